@@ -0,0 +1,1158 @@
+import importlib.util
+import io
+import os
+import sys
+import time
+import re
+import random
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from collections.abc import Mapping
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def load_script(filename, module_name):
+    """按路径加载脚本（文件名含空格和连字符，不能直接import）"""
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(BASE_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+summary = load_script('summary-version-2.py', 'summary_version_2')
+analyzer_script = load_script('test - version04--workingone.py', 'email_analyzer')
+query_service = load_script('query-service.py', 'query_service')
+synthetic = load_script('synthetic-data.py', 'synthetic_data')
+
+SAMPLE_WORKBOOKS = [
+    os.path.join(BASE_DIR, '邮件日本时间summary.xlsx'),
+    os.path.join(BASE_DIR, '邮件日本时间0130-new.xlsx'),
+]
+
+# 合成数据的规模测试（python benchmark.py --scale [邮件数...] [--results 结果文件]）
+SCALES = [1000, 10000, 100000]
+SCALE_QUERIES = 1000  # 单个查询测试的搜索ID数
+RESULTS_FILE = os.path.join(BASE_DIR, 'benchmark-results.csv')
+RESULT_COLUMNS = ['时间', '版本', 'Python', '规模', '阶段', '数量', '秒', '每秒', '峰值内存(MB)']
+
+def legacy_extract_jst_time(content):
+    """原来的extract_jst_time（每次调用重新构建正则列表和月份表），作为对比基准"""
+    # 方法1: 尝试查找类似 "2026-01-26 09:44:39" 的格式
+    pattern1 = r'(\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2})'
+    match = re.search(pattern1, content)
+    
+    if match:
+        return match.group(1)
+    
+    # 方法2: 尝试查找Date头（原始脚本的方法，但需要修正）
+    date_pattern = r'Date:\s*(.+?)(?:\n|$)'
+    date_match = re.search(date_pattern, content, re.IGNORECASE)
+    
+    if date_match:
+        date_str = date_match.group(1).strip()
+        
+        # 尝试解析常见的邮件时间格式
+        # 格式1: Tue, 20 Jan 2026 06:13:09 +0000
+        # 格式2: 20 Jan 2026 06:13:09 +0900
+        patterns = [
+            r'(\d{1,2})\s+([A-Za-z]{3})\s+(\d{4})\s+(\d{2}):(\d{2}):(\d{2})\s+([+-]\d{4})',
+            r'([A-Za-z]{3}),\s+(\d{1,2})\s+([A-Za-z]{3})\s+(\d{4})\s+(\d{2}):(\d{2}):(\d{2})\s+([+-]\d{4})',
+            r'(\d{4}-\d{2}-\d{2})\s+(\d{2}:\d{2}:\d{2})'
+        ]
+        
+        for pattern in patterns:
+            match = re.search(pattern, date_str)
+            if match:
+                try:
+                    # 月份映射
+                    months = {'Jan':1,'Feb':2,'Mar':3,'Apr':4,'May':5,'Jun':6,
+                             'Jul':7,'Aug':8,'Sep':9,'Oct':10,'Nov':11,'Dec':12}
+                    
+                    if len(match.groups()) >= 6:
+                        if pattern == patterns[0]:  # 格式1
+                            day = int(match.group(1))
+                            month = months.get(match.group(2), 1)
+                            year = int(match.group(3))
+                            hour = int(match.group(4))
+                            minute = int(match.group(5))
+                            second = int(match.group(6))
+                            offset = match.group(7)
+                        elif pattern == patterns[1]:  # 格式2
+                            day = int(match.group(2))
+                            month = months.get(match.group(3), 1)
+                            year = int(match.group(4))
+                            hour = int(match.group(5))
+                            minute = int(match.group(6))
+                            second = int(match.group(7))
+                            offset = match.group(8)
+                        
+                        # 计算UTC偏移
+                        offset_hours = int(offset[:3])
+                        
+                        # 创建时间对象
+                        local_time = datetime(year, month, day, hour, minute, second)
+                        
+                        # 转换为UTC
+                        utc_time = local_time - timedelta(hours=offset_hours)
+                        
+                        # 转换为日本时间 (UTC+9)
+                        jst_time = utc_time + timedelta(hours=9)
+                        
+                        return jst_time.strftime("%Y-%m-%d %H:%M:%S")
+                    
+                except Exception as e:
+                    print(f"解析时间时出错: {date_str}, 错误: {e}")
+                    continue
+    
+    return "未找到时间信息"
+
+def make_date_contents(n, seed=0):
+    """生成测试用的邮件头文本，包含常见的几种Date格式和时区"""
+    rng = random.Random(seed)
+    offsets = [0, 9 * 60, -5 * 60, 8 * 60, 330, -210, 345]  # 含+0530、-0330、+0545
+    contents = []
+    for _ in range(n):
+        tz = timezone(timedelta(minutes=rng.choice(offsets)))
+        dt = datetime(2026, 1, 1, tzinfo=tz) + timedelta(seconds=rng.randrange(365 * 86400))
+        date_str = format_datetime(dt)
+        style = rng.random()
+        if style < 0.1:
+            date_str = date_str.split(', ', 1)[1]  # 没有星期
+        elif style < 0.15:
+            date_str = format_datetime(dt.astimezone(timezone.utc), usegmt=True)  # GMT
+        contents.append(f"From: a@example.com\nSubject: test\nDate: {date_str}\n\n")
+    return contents
+
+def measure(func, items, repeat=3):
+    """返回最快一轮的每秒处理数"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            func(item)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(items) / best
+
+def bench_date_parsing(n=20000):
+    """比较新旧Date解析的速度，并检查结果差异"""
+    print(f"\n时间解析 ({n} 条):")
+    contents = make_date_contents(n)
+    
+    old_rate = measure(legacy_extract_jst_time, contents)
+    new_rate = measure(summary.extract_jst_time, contents)
+    print(f"  原函数: {old_rate:,.0f} 次/秒")
+    print(f"  新函数: {new_rate:,.0f} 次/秒 ({new_rate / old_rate:.1f}x)")
+    
+    # 原函数只使用小时偏移，+0530/-0330等结果不同，GMT格式原函数无法解析
+    diff = sum(1 for c in contents if legacy_extract_jst_time(c) != summary.extract_jst_time(c))
+    print(f"  结果不同: {diff} 条（分钟级时区偏移或GMT格式）")
+
+def legacy_process_file(path):
+    """原来读取.eml的方式（文本模式读取前5000个字符，依次尝试几种编码），时间解析使用新的extract_jst_time，
+    用于检查文件级的优先顺序（开头的 "2026-01-26 09:44:39" 格式优先于Date头）
+    """
+    jst_time = summary.NOT_FOUND
+    for encoding in ['utf-8', 'shift_jis', 'euc-jp', 'cp932', 'latin-1']:
+        with open(path, 'r', encoding=encoding, errors='ignore') as f:
+            content = f.read(5000)
+        jst_time = summary.extract_jst_time(content)
+        if jst_time != summary.NOT_FOUND:
+            break
+    return jst_time
+
+def make_eml_bytes(rng, index):
+    """生成一封测试邮件: 正文中可能有 "2026-01-19 10:00:00" 格式的时间（在5000个字符之内或之后）、
+    Delivery-Date头、很长的Received头、换算后超出datetime范围的Date头、日文正文和CRLF换行
+    """
+    headers = []
+    if rng.random() < 0.2:
+        headers += [f"Received: from relay{i}.example.com by mx.example.com; id {i:040d}" for i in range(rng.choice([5, 150]))]
+    if rng.random() < 0.3:
+        headers.append("Delivery-Date: Mon, 19 Jan 2026 23:59:59 -0800")
+    headers += [f"From: a{index}@example.com", f"Subject: test {index}"]
+    if rng.random() < 0.9:
+        headers.append("Date: Tue, 20 Jan 2026 06:13:09 +0000")
+    elif rng.random() < 0.5:
+        headers.append(rng.choice(["Date: Fri, 31 Dec 9999 23:59:59 -0100", "Date: Mon, 1 Jan 0001 00:00:00 +0100"]))
+    headers.append("Content-Type: text/plain; charset=utf-8")
+    
+    filler = rng.choice(['本文のテキストです。', 'plain body text. '])
+    body = filler * rng.randrange(0, 400)
+    if rng.random() < 0.6:
+        body += "\n送信日時: 2026-01-19 10:00:00\n"
+    text = '\n'.join(headers) + '\n\n' + body
+    if rng.random() < 0.3:
+        text = text.replace('\n', '\r\n')
+    return text.encode('utf-8')
+
+def bench_eml_precedence(n=500, seed=0):
+    """检查process_file（只读邮件头和开头的字节）与原来读取.eml的方式结果相同
+    
+    原来找不到时间的长邮件头（Date头在5000个字符之后）现在可以找到，单独计数；
+    不能有"错误:"的结果（如Date头超出datetime的范围）
+    """
+    import tempfile
+    
+    rng = random.Random(seed)
+    print(f"\n.eml时间的优先顺序 ({n} 个文件):")
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(n):
+            paths.append(os.path.join(tmp, f"{i}.eml"))
+            with open(paths[-1], 'wb') as f:
+                f.write(make_eml_bytes(rng, i))
+        results = [(summary.process_file(path), legacy_process_file(path)) for path in paths]
+    
+    found = sum(old == summary.NOT_FOUND and new != summary.NOT_FOUND for new, old in results)
+    different = sum(old != summary.NOT_FOUND and new != old for new, old in results)
+    errors = sum(new.startswith('错误') for new, _ in results)
+    print(f"  长邮件头中新找到: {found} 个")
+    print(f"  结果不同: {different} 个")
+    print(f"  读取错误: {errors} 个")
+    same = not different and not errors
+    print(f"  结果一致: {'是' if same else '否'}")
+    return same
+
+def make_message(rng, name):
+    """生成一封只有邮件头的测试邮件，返回 (字节, 日本时间)"""
+    dt = datetime(2026, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=rng.randrange(365 * 86400))
+    text = (f"From: {name}@example.com\nMessage-ID: <{name}@example.com>\n"
+            f"Date: {format_datetime(dt)}\nSubject: {name}\n\nFrom the body\n")
+    return text.encode('ascii'), (dt + timedelta(hours=9)).strftime('%Y-%m-%d %H:%M:%S')
+
+def write_inputs(folder, rng, tag):
+    """在folder中写入.eml（含子文件夹）、.zip、.tar.gz、mbox和Maildir，返回 {路径: [[文件名, 日本时间], ...]}
+    
+    tag不同时所有邮件的内容都不同；每个文件的修改时间设为不同的值，增量扫描可以区分
+    """
+    import tarfile
+    import zipfile
+    
+    expected = {}
+    
+    def write_file(rel_path, data):
+        path = os.path.join(folder, *rel_path.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        mtime = time.time_ns() + rng.randrange(1, 10**9)
+        os.utime(path, ns=(mtime, mtime))
+    
+    for rel_path in ('a.eml', 'sub/b.eml', 'maildir/cur/1700000000.M1.host:2,S', 'maildir/new/1700000001.M2.host'):
+        data, jst_time = make_message(rng, f"{tag}-{os.path.basename(rel_path)}")
+        write_file(rel_path, data)
+        expected[rel_path] = [[rel_path, jst_time]]
+    write_file('maildir/tmp/1700000002.M3.host', b'delivering')
+    
+    buf = io.BytesIO()
+    expected['mails.zip'] = []
+    with zipfile.ZipFile(buf, 'w') as zf:
+        for name in ('x/1.eml', 'x/2.eml', 'notes.txt'):
+            data, jst_time = make_message(rng, f"{tag}-zip-{name}")
+            zf.writestr(name, data)
+            if name.endswith('.eml'):
+                expected['mails.zip'].append([f"mails.zip/{name}", jst_time])
+    write_file('mails.zip', buf.getvalue())
+    
+    buf = io.BytesIO()
+    expected['mails.tar.gz'] = []
+    with tarfile.open(fileobj=buf, mode='w:gz') as tf:
+        for name in ('y/3.eml', 'y/4.eml'):
+            data, jst_time = make_message(rng, f"{tag}-tar-{name}")
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+            expected['mails.tar.gz'].append([f"mails.tar.gz/{name}", jst_time])
+    write_file('mails.tar.gz', buf.getvalue())
+    
+    mbox = b''
+    expected['box.mbox'] = []
+    for i in range(3):
+        name = f"{tag}-mbox-{i}"
+        data, jst_time = make_message(rng, name)
+        expected['box.mbox'].append([f"box.mbox@{len(mbox)} <{name}@example.com>", jst_time])
+        mbox += b'From sender@example.com Tue Jan 20 06:13:09 2026\n' + data.replace(b'\nFrom ', b'\n>From ') + b'\n'
+    write_file('box.mbox', mbox)
+    return expected
+
+def bench_input_formats(seed=0):
+    """检查.eml子文件夹、.zip、.tar.gz、mbox和Maildir的扫描结果，
+    以及增量扫描（未修改的文件不重新读取、修改过的重新读取、删除的不再出现）和exclude_patterns
+    """
+    import tempfile
+    
+    print("\n压缩包/mbox/Maildir和增量扫描:")
+    rng = random.Random(seed)
+    reads = []
+    extract = summary.extract_jst_time_from_message
+    saved = summary.scan_mode, summary.exclude_patterns
+    # 单进程扫描，才能统计读取的邮件数
+    summary.scan_mode = 'serial'
+    summary.extract_jst_time_from_message = lambda *args: reads.append(1) or extract(*args)
+    
+    def scan(folder, manifest_path):
+        reads.clear()
+        results = quiet(summary.scan_incremental, folder, manifest_path)
+        return results, len(reads)
+    
+    def flatten(expected):
+        return [row for rel_path in sorted(expected) for row in expected[rel_path]]
+    
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = os.path.join(tmp, 'in')
+            manifest_path = os.path.join(tmp, 'out.manifest.json')
+            expected = write_inputs(folder, rng, 'v1')
+            total = len(flatten(expected))
+            
+            results, first_reads = scan(folder, manifest_path)
+            same = results == flatten(expected) and first_reads == total
+            print(f"  首次扫描: {len(results)} 封邮件, 读取 {first_reads} 封")
+            
+            results, cached_reads = scan(folder, manifest_path)
+            same = same and results == flatten(expected) and cached_reads == 0
+            print(f"  再次扫描（未修改）: 读取 {cached_reads} 封")
+            
+            # 修改一个.eml和tar.gz，删除子文件夹中的.eml、一封Maildir邮件和mbox
+            changed = write_inputs(os.path.join(tmp, 'v2'), rng, 'v2')
+            for rel_path in ('a.eml', 'mails.tar.gz'):
+                os.replace(os.path.join(tmp, 'v2', rel_path), os.path.join(folder, rel_path))
+                expected[rel_path] = changed[rel_path]
+            for rel_path in ('sub/b.eml', 'maildir/new/1700000001.M2.host', 'box.mbox'):
+                os.remove(os.path.join(folder, rel_path))
+                del expected[rel_path]
+            
+            results, changed_reads = scan(folder, manifest_path)
+            cached = summary.load_manifest(manifest_path, folder)
+            same = (same and results == flatten(expected) and changed_reads == 1 + len(expected['mails.tar.gz']) and
+                    sorted(cached) == sorted(expected))
+            print(f"  修改后扫描: {len(results)} 封邮件, 读取 {changed_reads} 封")
+            
+            summary.exclude_patterns = ['*.zip', 'maildir/*']
+            results, _ = scan(folder, manifest_path)
+            same = same and results == flatten({k: v for k, v in expected.items() if k in ('a.eml', 'mails.tar.gz')})
+    finally:
+        summary.scan_mode, summary.exclude_patterns = saved
+        summary.extract_jst_time_from_message = extract
+    
+    print(f"  结果一致: {'是' if same else '否'}")
+    return same
+
+def bench_quiet_metrics(seed=0, threads=8, n=20000):
+    """检查多个线程同时更新运行统计时计数不丢失，以及verbose为False时扫描.eml文件夹不显示进度"""
+    import contextlib
+    import tempfile
+    import threading
+    
+    print("\n运行统计和不显示过程:")
+    metrics = analyzer_script.Metrics()
+    
+    def update():
+        for _ in range(n):
+            metrics.count('queries')
+            metrics.add_time('query', 0.001)
+            metrics.observe(0.001)
+    
+    workers = [threading.Thread(target=update) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    counts = metrics.to_dict()
+    same = (counts['counters']['queries'] == threads * n and counts['stages']['query']['calls'] == threads * n and
+            counts['query_latency']['count'] == threads * n)
+    print(f"  {threads} 个线程的计数: {counts['counters']['queries']:,} / {threads * n:,}")
+    
+    outputs = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        write_inputs(tmp, random.Random(seed), 'quiet')
+        for verbose in (True, False):
+            buffer = io.StringIO()
+            with contextlib.redirect_stdout(buffer):
+                analyzer_script.EmailAnalyzer(eml_folder=tmp, verbose=verbose)
+            outputs[verbose] = buffer.getvalue()
+    # 显示过程时有扫描进度（如压缩包的邮件数），不显示时没有任何输出
+    same = same and '封邮件' in outputs[True] and outputs[False] == ''
+    print(f"  不显示过程时的输出: {len(outputs[False])} 个字符")
+    print(f"  结果一致: {'是' if same else '否'}")
+    return same
+
+def values_equal(a, b, skip=()):
+    """比较两个值（NaN视为相等），skip中的键不比较"""
+    if isinstance(a, Mapping) and isinstance(b, Mapping):
+        keys = [k for k in a.keys() if k not in skip]
+        return keys == [k for k in b.keys() if k not in skip] and all(values_equal(a[k], b[k]) for k in keys)
+    if isinstance(a, float) and isinstance(b, float) and a != a and b != b:
+        return True
+    return a == b
+
+def indexes_equal(a, b, skip=()):
+    """比较两个EmailAnalyzer的all_emails / data_by_thread_id / data_by_search_id"""
+    if len(a.all_emails) != len(b.all_emails):
+        return False
+    if not all(values_equal(x, y, skip) for x, y in zip(a.all_emails, b.all_emails)):
+        return False
+    if list(a.data_by_thread_id) != list(b.data_by_thread_id):
+        return False
+    for thread_id, emails in a.data_by_thread_id.items():
+        other = b.data_by_thread_id[thread_id]
+        if len(emails) != len(other) or not all(values_equal(x, y, skip) for x, y in zip(emails, other)):
+            return False
+    if list(a.data_by_search_id) != list(b.data_by_search_id):
+        return False
+    return all(values_equal(a.data_by_search_id[k], b.data_by_search_id[k], skip) for k in a.data_by_search_id)
+
+def quiet(func, *args, **kwargs):
+    """执行时不显示分析器的输出"""
+    import io
+    import contextlib
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+def bench_process_data(excel_file):
+    """比较逐行处理和按列批量处理的速度（及各阶段耗时），并检查两者的索引和计数器完全相同"""
+    import pandas as pd
+    
+    df = pd.read_excel(excel_file)
+    print(f"\nprocess_data ({os.path.basename(excel_file)}, {len(df)} 行):")
+    
+    metrics = analyzer_script.metrics
+    timings = {}
+    analyzers = {}
+    counters = {}
+    for vectorized, label in ((False, '逐行处理'), (True, '批量处理')):
+        analyzer = analyzer_script.EmailAnalyzer(verbose=False)
+        analyzer.df = df
+        metrics.reset()
+        start = time.perf_counter()
+        analyzer.process_data(vectorized=vectorized)
+        timings[vectorized] = time.perf_counter() - start
+        analyzers[vectorized] = analyzer
+        counters[vectorized] = dict(metrics.counters)
+        stages = ', '.join(f"{stage} {seconds:.3f}" for stage, seconds in metrics.stage_seconds.items())
+        print(f"  {label}: {timings[vectorized]:.3f} 秒 ({stages})")
+    
+    print(f"  加速: {timings[False] / timings[True]:.1f}x")
+    
+    same = indexes_equal(analyzers[False], analyzers[True]) and counters[False] == counters[True]
+    print(f"  结果一致: {'是' if same else '否'}")
+    return same
+
+def bench_memory(excel_file):
+    """比较每条记录的内存: 原来的dict（含原始数据副本）和按列保存的记录"""
+    import pandas as pd
+    
+    df = pd.read_excel(excel_file)
+    print(f"\n索引内存 ({os.path.basename(excel_file)}, {len(df)} 行):")
+    
+    for vectorized, label in ((False, '每行一个dict'), (True, '按列保存')):
+        analyzer = analyzer_script.EmailAnalyzer()
+        analyzer.df = df
+        tracemalloc.start()
+        quiet(analyzer.process_data, vectorized=vectorized)
+        used, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        count = len(analyzer.all_emails)
+        print(f"  {label}: {used / 1024 / 1024:.2f} MB, 每条 {used / max(count, 1):.0f} 字节")
+
+def bench_classifier(excel_file):
+    """比较原来的4个提取方法和classify_filename的速度（冷缓存/热缓存），并检查结果相同"""
+    import pandas as pd
+    
+    names = pd.read_excel(excel_file).iloc[:, 0].dropna().astype(str).str.strip().tolist()
+    print(f"\n文件名分类 ({os.path.basename(excel_file)}, {len(names)} 个):")
+    
+    analyzer = analyzer_script.EmailAnalyzer()
+    
+    def legacy(name):
+        return (analyzer.extract_email_id(name), analyzer.extract_thread_id(name),
+                analyzer.extract_search_id(name), analyzer.is_reply(name))
+    
+    def cold(name):
+        return analyzer_script.classify_filename.__wrapped__(name)
+    
+    old_rate = measure(legacy, names)
+    cold_rate = measure(cold, names)
+    analyzer_script.classify_filename.cache_clear()
+    warm_rate = measure(analyzer_script.classify_filename, names)
+    print(f"  原方法: {old_rate:,.0f} 次/秒")
+    print(f"  编译规则（无缓存）: {cold_rate:,.0f} 次/秒 ({cold_rate / old_rate:.1f}x)")
+    print(f"  编译规则（有缓存）: {warm_rate:,.0f} 次/秒 ({warm_rate / old_rate:.1f}x)")
+    
+    same = all(legacy(name) == analyzer_script.classify_filename(name) for name in names)
+    print(f"  结果一致: {'是' if same else '否'}")
+    return same
+
+def bench_fuzzy_lookup(excel_file, n=500, seed=0):
+    """比较逐个扫描搜索ID和三元组索引的部分ID查找速度，并检查匹配到的ID集合相同"""
+    import pandas as pd
+    
+    analyzer = analyzer_script.EmailAnalyzer()
+    analyzer.df = pd.read_excel(excel_file)
+    quiet(analyzer.process_data)
+    keys = list(analyzer.data_by_search_id.keys())
+    if not keys:
+        return True
+    print(f"\n部分ID查找 ({os.path.basename(excel_file)}, {len(keys)} 个搜索ID):")
+    
+    rnd = random.Random(seed)
+    # 用户通常只输入编号的末尾几位
+    queries = [rnd.choice(keys).split(':')[-1][-rnd.randint(3, 5):] for _ in range(n)]
+    
+    def linear(query):
+        return [sid for sid in keys if query.lower() in sid.lower()]
+    
+    old_rate = measure(linear, queries)
+    new_rate = measure(lambda q: analyzer.find_search_ids(q, limit=1), queries)
+    print(f"  逐个扫描: {old_rate:,.0f} 次/秒")
+    print(f"  三元组索引: {new_rate:,.0f} 次/秒 ({new_rate / old_rate:.1f}x)")
+    
+    same = all(sorted(linear(q)) == sorted(analyzer.find_search_ids(q)) for q in queries)
+    print(f"  结果一致: {'是' if same else '否'}")
+    return same
+
+def bench_all_responses(excel_file):
+    """比较batch_query逐个查询全部搜索ID和compute_all_responses一次计算的速度，并检查结果相同"""
+    import pandas as pd
+    
+    analyzer = analyzer_script.EmailAnalyzer()
+    analyzer.df = pd.read_excel(excel_file)
+    quiet(analyzer.process_data)
+    search_ids = list(analyzer.data_by_search_id.keys())
+    if not search_ids:
+        return True
+    print(f"\n全部搜索ID的回复时间 ({os.path.basename(excel_file)}, {len(search_ids)} 个):")
+    
+    start = time.perf_counter()
+    old = pd.DataFrame(quiet(analyzer.batch_query, search_ids))
+    old_time = time.perf_counter() - start
+    start = time.perf_counter()
+    new = analyzer.compute_all_responses(search_ids)
+    new_time = time.perf_counter() - start
+    print(f"  batch_query: {old_time:.3f} 秒")
+    print(f"  compute_all_responses: {new_time:.3f} 秒 ({old_time / new_time:.1f}x)")
+    
+    same = list(old.columns) == list(new.columns) and old.to_dict('records') == new.to_dict('records')
+    print(f"  结果一致: {'是' if same else '否'}")
+    return same
+
+def bench_snapshot(excel_file):
+    """比较首次加载（读取Excel并建立索引）和从索引快照加载的速度，并检查索引相同
+    
+    在临时文件夹中复制数据文件，快照不会写到数据文件旁边
+    """
+    import shutil
+    import tempfile
+    
+    print(f"\n索引快照 ({os.path.basename(excel_file)}):")
+    with tempfile.TemporaryDirectory() as tmp:
+        source = shutil.copy(excel_file, tmp)
+        
+        start = time.perf_counter()
+        cold = quiet(analyzer_script.EmailAnalyzer, source)
+        cold_time = time.perf_counter() - start
+        start = time.perf_counter()
+        warm = quiet(analyzer_script.EmailAnalyzer, source)
+        warm_time = time.perf_counter() - start
+    
+    print(f"  首次加载: {cold_time:.3f} 秒")
+    print(f"  快照加载: {warm_time:.3f} 秒 ({cold_time / warm_time:.1f}x)")
+    
+    same = indexes_equal(cold, warm)
+    print(f"  结果一致: {'是' if same else '否'}")
+    return same
+
+def bench_read_columns(excel_file):
+    """分别强制使用openpyxl只读模式和calamine引擎（可以使用时）读取，比较读取时间，
+    并检查建立的索引与读取整个表相同；另外检查pandas低于2.2时不使用calamine
+    """
+    import importlib.util
+    import pandas as pd
+    
+    print(f"\n读取需要的列 ({os.path.basename(excel_file)}):")
+    expected = analyzer_script.EmailAnalyzer()
+    expected.df = pd.read_excel(excel_file)
+    expected.columns = expected.detect_columns(expected.df.columns)
+    quiet(expected.process_data)
+    
+    engines = [('openpyxl只读模式', False)]
+    if analyzer_script.calamine_supported():
+        engines.append(('calamine', True))
+    same = True
+    calamine_supported = analyzer_script.calamine_supported
+    try:
+        for label, use_calamine in engines:
+            analyzer_script.calamine_supported = lambda: use_calamine
+            analyzer = analyzer_script.EmailAnalyzer()
+            start = time.perf_counter()
+            analyzer.df = quiet(analyzer.read_columns, excel_file)
+            elapsed = time.perf_counter() - start
+            quiet(analyzer.process_data)
+            print(f"  {label}: {elapsed:.3f} 秒")
+            same = same and indexes_equal(analyzer, expected, skip=('原始数据',))
+    finally:
+        analyzer_script.calamine_supported = calamine_supported
+    
+    # pandas 2.2之前没有engine='calamine'，即使安装了python-calamine也不使用
+    version = pd.__version__
+    find_spec = importlib.util.find_spec
+    try:
+        pd.__version__ = '2.1.4'
+        importlib.util.find_spec = lambda name, *args: object() if name == 'python_calamine' else find_spec(name, *args)
+        same = same and not analyzer_script.calamine_supported()
+    finally:
+        pd.__version__ = version
+        importlib.util.find_spec = find_spec
+    print(f"  结果一致: {'是' if same else '否'}")
+    return same
+
+def bench_streaming(excel_file, chunk_size=1000):
+    """比较整体读取和流式分块读取的时间、内存峰值，并检查索引相同（流式读取的原始数据只有两列，不比较）"""
+    print(f"\n流式读取 ({os.path.basename(excel_file)}, 每块 {chunk_size} 行):")
+    
+    analyzers = {}
+    for streaming, label in ((False, '整体读取'), (True, '流式读取')):
+        analyzer = analyzer_script.EmailAnalyzer()
+        # 文件名分类的缓存也计入内存
+        analyzer_script.classify_filename.cache_clear()
+        tracemalloc.start()
+        start = time.perf_counter()
+        if streaming:
+            quiet(analyzer.process_stream, excel_file, chunk_size)
+        else:
+            analyzer.df = quiet(analyzer.read_columns, excel_file)
+            quiet(analyzer.process_data)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        analyzers[streaming] = analyzer
+        print(f"  {label}: {elapsed:.3f} 秒, 内存峰值 {peak / 1024 / 1024:.2f} MB")
+    
+    same = indexes_equal(analyzers[False], analyzers[True], skip=('原始数据',))
+    print(f"  结果一致: {'是' if same else '否'}")
+    return same
+
+def bench_add_emails(excel_file, new_rows=200, seed=0):
+    """比较add_emails追加最后几行和整体重新处理的速度，并检查索引和全部回复结果相同；
+    另外把随机抽出的行分几次追加（时间不按顺序），检查结果也相同
+    """
+    import numpy as np
+    import pandas as pd
+    
+    df = pd.read_excel(excel_file)
+    if len(df) <= new_rows:
+        return True
+    print(f"\n追加邮件 ({os.path.basename(excel_file)}, 追加 {new_rows} 行):")
+    
+    live = analyzer_script.EmailAnalyzer()
+    live.df = df.iloc[:-new_rows]
+    quiet(live.process_data)
+    start = time.perf_counter()
+    quiet(live.add_emails, df.iloc[-new_rows:])
+    add_time = time.perf_counter() - start
+    
+    rebuilt = analyzer_script.EmailAnalyzer()
+    rebuilt.df = df
+    start = time.perf_counter()
+    quiet(rebuilt.process_data)
+    rebuild_time = time.perf_counter() - start
+    
+    print(f"  重新处理: {rebuild_time:.3f} 秒")
+    print(f"  add_emails: {add_time:.3f} 秒 ({rebuild_time / add_time:.1f}x)")
+    
+    same = (indexes_equal(live, rebuilt) and
+            live.compute_all_responses().to_dict('records') == rebuilt.compute_all_responses().to_dict('records'))
+    
+    # 随机抽出的行（时间不按顺序）分几次追加，与按同样行顺序整体处理的结果相同
+    held = df.sample(n=new_rows, random_state=seed).index
+    parts = np.array_split(np.asarray(held), 4)
+    live = analyzer_script.EmailAnalyzer()
+    live.df = df.drop(held).reset_index(drop=True)
+    quiet(live.process_data)
+    for part in parts:
+        quiet(live.add_emails, df.loc[part])
+    rebuilt = analyzer_script.EmailAnalyzer()
+    rebuilt.df = pd.concat([df.drop(held)] + [df.loc[part] for part in parts], ignore_index=True)
+    quiet(rebuilt.process_data)
+    same = (same and indexes_equal(live, rebuilt) and live.df.equals(rebuilt.df) and
+            live.compute_all_responses().to_dict('records') == rebuilt.compute_all_responses().to_dict('records'))
+    print(f"  结果一致: {'是' if same else '否'}")
+    return same
+
+def bench_sqlite(excel_file, n=500, seed=0):
+    """比较内存索引和SQLite后端的启动速度和单个查询速度，并检查batch_query和全部回复结果相同
+    
+    在临时文件夹中复制数据文件，数据库不会写到数据文件旁边
+    """
+    import shutil
+    import tempfile
+    
+    print(f"\nSQLite后端 ({os.path.basename(excel_file)}):")
+    with tempfile.TemporaryDirectory() as tmp:
+        source = shutil.copy(excel_file, tmp)
+        start = time.perf_counter()
+        quiet(analyzer_script.EmailAnalyzer, source, sqlite=True).sqlite_db.close()
+        build_time = time.perf_counter() - start
+        # 使用SQLite时不另存快照
+        no_snapshot = not any(os.path.exists(path) for path in analyzer_script.get_snapshot_paths(source))
+        
+        memory = quiet(analyzer_script.EmailAnalyzer, source, sqlite=False)
+        keys = list(memory.data_by_search_id.keys())
+        start = time.perf_counter()
+        db = quiet(analyzer_script.EmailAnalyzer, source, sqlite=True)
+        open_time = time.perf_counter() - start
+        print(f"  建立数据库: {build_time:.3f} 秒")
+        print(f"  打开数据库: {open_time:.3f} 秒")
+        
+        # 已有的搜索ID、部分ID（模糊匹配）和不存在的ID
+        rnd = random.Random(seed)
+        queries = [rnd.choice(keys) for _ in range(n // 2)] if keys else []
+        queries += [rnd.choice(keys).split(':')[-1][-rnd.randint(3, 5):] for _ in range(n // 2)] if keys else []
+        queries.append('不存在的搜索ID')
+        
+        memory_rate = measure(lambda q: quiet(memory.find_closest_response, q), queries)
+        db_rate = measure(lambda q: quiet(db.find_closest_response, q), queries)
+        print(f"  内存索引查询: {memory_rate:,.0f} 次/秒")
+        print(f"  SQLite查询: {db_rate:,.0f} 次/秒")
+        
+        same = (no_snapshot and quiet(memory.batch_query, queries) == quiet(db.batch_query, queries) and
+                indexes_equal(memory, db, skip=('原始数据',)) and
+                memory.compute_all_responses().to_dict('records') == db.compute_all_responses().to_dict('records'))
+        db.sqlite_db.close()
+    print(f"  结果一致: {'是' if same else '否'}")
+    return same
+
+def bench_service(excel_file, clients=16, n=2000, seed=0):
+    """查询服务的负载测试: 多个keep-alive连接同时发送单个查询，显示吞吐量和延迟，
+    并检查单个查询、批量查询和模糊查找的结果与直接调用分析器相同；
+    SQLite模式下同时发送多个批量查询和单个查询，并检查重新加载后旧的数据库已关闭
+    
+    在临时文件夹中复制数据文件，快照和数据库不会写到数据文件旁边
+    """
+    import asyncio
+    import contextlib
+    import io
+    import json
+    import shutil
+    import tempfile
+    from urllib.parse import quote
+    
+    async def request(reader, writer, method, target, body=None):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8') if body is not None else b''
+        writer.write(f"{method} {target} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(data)}\r\n\r\n".encode() + data)
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        length = 0
+        while (line := await reader.readline()) not in (b'\r\n', b''):
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.lower() == 'content-length':
+                length = int(value)
+        return status, json.loads(await reader.readexactly(length))
+    
+    async def run(source):
+        service = query_service.QueryService(source, reload_interval=0)
+        with contextlib.redirect_stdout(io.StringIO()):
+            await service.start('127.0.0.1', 0)
+        analyzer = service.analyzer
+        keys = list(analyzer.data_by_search_id.keys())
+        if not keys:
+            await service.stop()
+            return True
+        print(f"\n查询服务 ({os.path.basename(excel_file)}, {clients} 个连接, {n} 个请求):")
+        
+        rnd = random.Random(seed)
+        queries = [rnd.choice(keys) for _ in range(n * 3 // 4)]
+        queries += [rnd.choice(keys).split(':')[-1][-rnd.randint(3, 5):] for _ in range(n - len(queries) - 1)]
+        queries.append('不存在的搜索ID')
+        latencies, answers = [], {}
+        
+        async def client(targets):
+            reader, writer = await asyncio.open_connection('127.0.0.1', service.port)
+            for query in targets:
+                start = time.perf_counter()
+                _, answers[query] = await request(reader, writer, 'GET', '/query?id=' + quote(query, safe=''))
+                latencies.append(time.perf_counter() - start)
+            writer.close()
+        
+        start = time.perf_counter()
+        await asyncio.gather(*(client(queries[i::clients]) for i in range(clients)))
+        elapsed = time.perf_counter() - start
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+        print(f"  吞吐量: {len(queries) / elapsed:,.0f} 次/秒")
+        print(f"  延迟: p50 {p50:.2f} 毫秒, p99 {p99:.2f} 毫秒")
+        
+        # 经过JSON后与直接调用的结果比较
+        as_json = lambda value: json.loads(json.dumps(value, ensure_ascii=False, default=query_service.json_default))
+        reader, writer = await asyncio.open_connection('127.0.0.1', service.port)
+        unique = list(dict.fromkeys(queries))
+        _, batch = await request(reader, writer, 'POST', '/batch', {'ids': unique})
+        _, search = await request(reader, writer, 'GET', '/search?limit=5&q=' + quote(queries[-2], safe=''))
+        missing_status, _ = await request(reader, writer, 'GET', '/query')
+        writer.close()
+        same = (all(answers[q] == as_json(analyzer.find_closest_response(q)) for q in unique) and
+                batch == as_json(analyzer.compute_all_responses(unique).to_dict('records')) and
+                search['搜索ID'] == analyzer.find_search_ids(queries[-2], limit=5) and
+                missing_status == 400)
+        await service.stop()
+        
+        # SQLite模式: 批量查询在线程池中同时执行（每个线程使用自己的连接）
+        service = query_service.QueryService(source, sqlite=True, reload_interval=0)
+        with contextlib.redirect_stdout(io.StringIO()):
+            await service.start('127.0.0.1', 0)
+        
+        async def batch_client(ids):
+            reader, writer = await asyncio.open_connection('127.0.0.1', service.port)
+            status, result = await request(reader, writer, 'POST', '/batch', {'ids': ids})
+            writer.close()
+            return status, result
+        
+        parts = [unique[i::8] for i in range(8)]
+        results = await asyncio.gather(*(batch_client(ids) for ids in parts))
+        same = same and all(
+            status == 200 and result == as_json(analyzer.compute_all_responses(ids).to_dict('records'))
+            for ids, (status, result) in zip(parts, results))
+        # 单个查询和模糊查找也在线程池中执行
+        answers = {}
+        await asyncio.gather(*(client(unique[i:i + 50:5]) for i in range(0, 250, 50)))
+        reader, writer = await asyncio.open_connection('127.0.0.1', service.port)
+        _, search = await request(reader, writer, 'GET', '/search?limit=5&q=' + quote(queries[-2], safe=''))
+        writer.close()
+        same = (same and all(answers[q] == as_json(analyzer.find_closest_response(q)) for q in answers) and
+                search['搜索ID'] == analyzer.find_search_ids(queries[-2], limit=5) and not service.in_use)
+        old = service.analyzer
+        with contextlib.redirect_stdout(io.StringIO()):
+            await service.load()
+        same = same and not old.sqlite_db.connections and service.analyzer.sqlite_db is not None
+        await service.stop()
+        print(f"  结果一致: {'是' if same else '否'}")
+        return same
+    
+    import numpy as np
+    with tempfile.TemporaryDirectory() as tmp:
+        return asyncio.run(run(shutil.copy(excel_file, tmp)))
+
+def bench_batch_cli(excel_file):
+    """比较batch_query（逐个显示过程）和命令行批量查询的速度，并检查写出的CSV与batch_query结果相同
+    
+    在临时文件夹中复制数据文件，快照不会写到数据文件旁边
+    """
+    import shutil
+    import tempfile
+    import pandas as pd
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        source = shutil.copy(excel_file, tmp)
+        analyzer = quiet(analyzer_script.EmailAnalyzer, source)
+        search_ids = list(analyzer.data_by_search_id.keys())
+        if not search_ids:
+            return True
+        search_ids += [sid.split(':')[-1] for sid in search_ids[:100]] + ['不存在的搜索ID']
+        print(f"\n命令行批量查询 ({os.path.basename(excel_file)}, {len(search_ids)} 个):")
+        
+        start = time.perf_counter()
+        expected = pd.DataFrame(quiet(analyzer.batch_query, search_ids))
+        old_time = time.perf_counter() - start
+        
+        id_path = os.path.join(tmp, 'ids.txt')
+        out_path = os.path.join(tmp, 'out.csv')
+        with open(id_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(search_ids) + '\n')
+        start = time.perf_counter()
+        quiet(analyzer_script.batch_cli, [source, '-i', id_path, '-o', out_path, '--min-success', '0'])
+        new_time = time.perf_counter() - start
+        written = pd.read_csv(out_path, dtype=str, keep_default_na=False)
+    
+    print(f"  batch_query: {old_time:.3f} 秒")
+    print(f"  命令行（含加载）: {new_time:.3f} 秒 ({old_time / new_time:.1f}x)")
+    
+    same = written.equals(expected.astype(str))
+    print(f"  结果一致: {'是' if same else '否'}")
+    return same
+
+def pivot_responses(analyzer, results, period):
+    """原来的做法: 逐个查询的结果按线程类型和日期手工透视（作为response_stats的对比基准）"""
+    import numpy as np
+    import pandas as pd
+    
+    df = pd.DataFrame(results)
+    emails = [analyzer.data_by_search_id[sid] for sid in df['搜索ID']]
+    target = pd.to_datetime(df['目标邮件时间'])
+    success = df['状态'] == '成功'
+    hours = (pd.to_datetime(df['最近的返信时间'].where(success)) - target).dt.total_seconds() / 3600
+    table = pd.DataFrame({
+        '线程类型': [analyzer_script.thread_family(e['线程ID'], e['文件名']) for e in emails],
+        '小时': hours.where(success, np.nan),
+    })
+    keys = ['线程类型']
+    if period == 'day':
+        table['日期'] = target.dt.strftime('%Y-%m-%d')
+        keys.append('日期')
+    elif period == 'week':
+        table['周'] = (target.dt.normalize() - pd.to_timedelta(target.dt.dayofweek, unit='D')).dt.strftime('%Y-%m-%d')
+        keys.append('周')
+    
+    grouped = table.groupby(keys)['小时']
+    stats = pd.DataFrame({
+        '邮件数': grouped.size(),
+        '已回复': grouped.count(),
+        '平均(小时)': grouped.mean(),
+        'p50(小时)': grouped.quantile(0.5),
+        'p90(小时)': grouped.quantile(0.9),
+        'p99(小时)': grouped.quantile(0.99),
+    }).round(2)
+    for n in analyzer_script.SLA_HOURS:
+        stats[f"{n}小时内回复比例"] = (table['小时'] <= n).groupby([table[key] for key in keys]).mean().round(4)
+    return stats
+
+def bench_response_stats(excel_file):
+    """比较逐个查询后手工透视和response_stats的速度，并检查按日、按周和不分时间的统计结果相同，
+    以及没有能找到的搜索ID时返回空表
+    
+    在临时文件夹中复制数据文件加载，快照不会写到数据文件旁边
+    """
+    import shutil
+    import tempfile
+    import numpy as np
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        analyzer = quiet(analyzer_script.EmailAnalyzer, shutil.copy(excel_file, tmp))
+    search_ids = list(analyzer.data_by_search_id.keys())
+    if not search_ids:
+        return True
+    print(f"\n回复时间统计 ({os.path.basename(excel_file)}, {len(search_ids)} 个搜索ID):")
+    
+    start = time.perf_counter()
+    results = quiet(analyzer.batch_query, search_ids)
+    expected = {period: pivot_responses(analyzer, results, period) for period in ('day', 'week', None)}
+    old_time = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    stats = {period: analyzer.response_stats(period=period) for period in ('day', 'week', None)}
+    new_time = time.perf_counter() - start
+    print(f"  逐个查询后透视: {old_time:.3f} 秒")
+    print(f"  response_stats: {new_time:.3f} 秒 ({old_time / new_time:.1f}x)")
+    
+    same = True
+    for period, got in stats.items():
+        keys = list(got.columns[:2 if period else 1])
+        got = got.astype({'线程类型': str}).set_index(keys)
+        same = (same and got.index.equals(expected[period].index) and
+                np.allclose(got.to_numpy(float), expected[period].to_numpy(float), equal_nan=True))
+        # 没有能找到的搜索ID时返回列相同的空表
+        empty = analyzer.response_stats(['不存在的搜索ID'], period=period)
+        same = same and empty.empty and list(empty.columns) == list(stats[period].columns)
+    print(f"  结果一致: {'是' if same else '否'}")
+    return same
+
+def legacy_save_excel(df, base_filename, locations):
+    """原来的safe_save_excel_with_auto_rename: 每个位置都重新调用to_excel（作为对比基准）"""
+    for location in locations:
+        try:
+            if not os.path.exists(location):
+                continue
+            file_path = os.path.join(location, base_filename)
+            df.to_excel(file_path, index=False)
+            return file_path
+        except Exception:
+            continue
+    return None
+
+def bench_save(excel_file, failing=4):
+    """前几个保存位置失败时（这里用文件代替文件夹），比较每个位置重新to_excel和只序列化一次的保存，
+    并检查读回的内容与to_excel相同、序列化只执行一次（数据文件在临时文件夹中复制后加载）"""
+    import shutil
+    import tempfile
+    import pandas as pd
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        analyzer = quiet(analyzer_script.EmailAnalyzer, shutil.copy(excel_file, tmp))
+    df = analyzer.compute_all_responses()
+    if df.empty:
+        return True
+    print(f"\n保存结果 ({os.path.basename(excel_file)}, {len(df)} 行, 前 {failing} 个位置失败):")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        blocked = []
+        for i in range(failing):
+            blocked.append(os.path.join(tmp, f"不是文件夹{i}"))
+            open(blocked[-1], 'w').close()
+        target = os.path.join(tmp, 'out')
+        os.mkdir(target)
+        
+        start = time.perf_counter()
+        old_path = legacy_save_excel(df, '原方法.xlsx', blocked + [target])
+        old_time = time.perf_counter() - start
+        
+        serializations = []
+        write_result_file = analyzer_script.write_result_file
+        analyzer_script.write_result_file = lambda *args: serializations.append(1) or write_result_file(*args)
+        try:
+            start = time.perf_counter()
+            new_path = quiet(analyzer_script.safe_save_excel_with_auto_rename, df, '新方法', locations=blocked + [target])
+            new_time = time.perf_counter() - start
+        finally:
+            analyzer_script.write_result_file = write_result_file
+        
+        print(f"  每个位置重新to_excel: {old_time:.3f} 秒")
+        print(f"  只序列化一次: {new_time:.3f} 秒 ({old_time / new_time:.1f}x)")
+        # 保存的文件与to_excel直接创建的文件权限相同（不是临时文件的0600）
+        same = (len(serializations) == 1 and new_path is not None and
+                os.stat(new_path).st_mode & 0o777 == os.stat(old_path).st_mode & 0o777 and
+                pd.read_excel(new_path).equals(pd.read_excel(old_path)))
+    print(f"  结果一致: {'是' if same else '否'}")
+    return same
+
+def git_revision():
+    """当前代码的git提交（不是git仓库时为空）"""
+    import subprocess
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                                capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+    return result.stdout.strip()
+
+def run_stage(func, trace_memory=True):
+    """计时执行func一次；trace_memory时再在tracemalloc下执行一次得到峰值内存
+    （tracemalloc使执行变慢，这一次不计时；只统计本进程，不含扫描的子进程）
+    
+    返回 (第一次的结果, 秒, 峰值内存MB或None)
+    """
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    peak = None
+    if trace_memory:
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak /= 1024 * 1024
+    return result, elapsed, peak
+
+def append_results(path, rows):
+    """追加到结果文件（CSV，UTF-8 BOM），不同版本和规模的结果可以在同一个表中比较"""
+    import csv
+    new_file = not os.path.exists(path)
+    with open(path, 'a', newline='', encoding='utf-8-sig' if new_file else 'utf-8') as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(RESULT_COLUMNS)
+        writer.writerows(rows)
+
+def bench_scale(scales=SCALES, results_file=RESULTS_FILE, trace_memory=True, seed=0):
+    """合成数据的端到端测试: 每个规模生成.eml文件夹和汇总表，依次测试
+    扫描时间（extract_jst_time）、process_data、单个find_closest_response和全部搜索ID的batch_query，
+    显示并记录吞吐量和峰值内存；同时检查扫描结果与汇总表相同
+    """
+    import shutil
+    import tempfile
+    import pandas as pd
+    
+    revision = git_revision()
+    python = '.'.join(map(str, sys.version_info[:3]))
+    all_same = True
+    for n in scales:
+        print(f"\n合成数据 {n:,} 封邮件:")
+        rows = []
+        
+        def record(stage, items, seconds, peak):
+            rows.append([datetime.now().strftime('%Y-%m-%d %H:%M:%S'), revision, python, n, stage, items,
+                         round(seconds, 4), round(items / seconds, 1) if seconds else '',
+                         round(peak, 2) if peak is not None else ''])
+            memory = f", 峰值内存 {peak:.1f} MB" if peak is not None else ''
+            print(f"  {stage}: {seconds:.3f} 秒, {items / seconds:,.0f} 个/秒{memory}")
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            eml_folder = os.path.join(tmp, 'eml')
+            workbook = os.path.join(tmp, 'summary.csv')
+            start = time.perf_counter()
+            synthetic.write_eml_folder(eml_folder, n, seed)
+            synthetic.write_workbook(workbook, n, seed)
+            print(f"  生成数据: {time.perf_counter() - start:.3f} 秒")
+            
+            results, seconds, peak = run_stage(lambda: quiet(summary.scan_inputs, eml_folder)[0], trace_memory)
+            record('扫描.eml', n, seconds, peak)
+            same = results == sorted(synthetic.iter_summary_rows(n, seed))
+            del results
+            shutil.rmtree(eml_folder)
+            
+            df = pd.read_csv(workbook, encoding='utf-8-sig')
+            
+            def process():
+                analyzer = analyzer_script.EmailAnalyzer(verbose=False)
+                analyzer.df = df
+                analyzer.process_data()
+                return analyzer
+            
+            analyzer, seconds, peak = run_stage(process, trace_memory)
+            record('process_data', n, seconds, peak)
+            
+            keys = list(analyzer.data_by_search_id.keys())
+            sample = random.Random(seed).sample(keys, min(SCALE_QUERIES, len(keys)))
+            latencies = []
+            
+            def single_queries():
+                for search_id in sample:
+                    start = time.perf_counter()
+                    analyzer.find_closest_response(search_id)
+                    latencies.append(time.perf_counter() - start)
+            
+            _, seconds, peak = run_stage(single_queries, trace_memory)
+            record('单个查询', len(sample), seconds, peak)
+            latencies = sorted(latencies[:len(sample)])
+            if latencies:
+                p50, p99 = latencies[len(latencies) // 2], latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)]
+                print(f"    延迟: p50 {p50 * 1000:.3f} 毫秒, p99 {p99 * 1000:.3f} 毫秒")
+            
+            batch, seconds, peak = run_stage(lambda: analyzer.batch_query(keys), trace_memory)
+            record('batch_query', len(keys), seconds, peak)
+            # 汇总表中的每个搜索ID都应有结果，且与compute_all_responses相同
+            same = same and len(batch) == len(keys) and batch == analyzer.compute_all_responses(keys).to_dict('records')
+        
+        append_results(results_file, rows)
+        print(f"  结果一致: {'是' if same else '否'}")
+        all_same = same and all_same
+    print(f"\n结果已追加到: {results_file}")
+    return all_same
+
+def parse_scale_args(argv):
+    """--scale [邮件数...] [--results 结果文件] [--no-memory]"""
+    import argparse
+    parser = argparse.ArgumentParser(description="合成数据的规模测试")
+    parser.add_argument('--scale', nargs='*', type=int, required=True, metavar='邮件数',
+                        help=f"生成的邮件数（默认 {' '.join(map(str, SCALES))}，最多可测试1000000）")
+    parser.add_argument('--results', default=RESULTS_FILE, help="结果追加到的CSV文件")
+    parser.add_argument('--no-memory', action='store_true', help="不测量峰值内存（每个阶段只执行一次）")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    if '--scale' in sys.argv[1:]:
+        args = parse_scale_args(sys.argv[1:])
+        sys.exit(0 if bench_scale(args.scale or SCALES, args.results, not args.no_memory) else 1)
+    
+    bench_date_parsing()
+    
+    all_same = bench_eml_precedence()
+    all_same = bench_input_formats() and all_same
+    all_same = bench_quiet_metrics() and all_same
+    for excel_file in SAMPLE_WORKBOOKS:
+        if os.path.exists(excel_file):
+            all_same = bench_classifier(excel_file) and all_same
+            all_same = bench_process_data(excel_file) and all_same
+            all_same = bench_fuzzy_lookup(excel_file) and all_same
+            all_same = bench_all_responses(excel_file) and all_same
+            all_same = bench_snapshot(excel_file) and all_same
+            all_same = bench_read_columns(excel_file) and all_same
+            all_same = bench_streaming(excel_file) and all_same
+            all_same = bench_add_emails(excel_file) and all_same
+            all_same = bench_sqlite(excel_file) and all_same
+            all_same = bench_service(excel_file) and all_same
+            all_same = bench_batch_cli(excel_file) and all_same
+            all_same = bench_response_stats(excel_file) and all_same
+            all_same = bench_save(excel_file) and all_same
+            bench_memory(excel_file)
+    
+    sys.exit(0 if all_same else 1)
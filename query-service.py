@@ -0,0 +1,319 @@
+import asyncio
+import importlib.util
+import json
+import os
+import sys
+from datetime import datetime
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+
+import numpy as np
+
+# 查询服务: 一个进程保持EmailAnalyzer常驻内存，多人通过本机HTTP/JSON查询，不必各自重新加载数据
+#
+#   python query-service.py <数据文件> [端口]
+#
+#   GET  /query?id=<搜索ID>             单个查询（与find_closest_response相同的结果）
+#   GET  /batch?id=<ID1>&id=<ID2>...     批量查询（compute_all_responses）
+#   POST /batch  {"ids": [...]}          同上，ID较多时使用
+#   GET  /search?q=<部分ID>&limit=20     模糊查找搜索ID
+#   GET  /status                         已加载的数据和重新加载次数
+#   GET  /metrics[?format=prometheus]    各阶段耗时、计数和查询延迟直方图（JSON或Prometheus文本格式）
+HOST = '127.0.0.1'
+PORT = 8765
+RELOAD_INTERVAL = 2.0  # 检查数据文件是否改变的间隔（秒）
+SEARCH_LIMIT = 20  # 模糊查找默认返回的ID数
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+ANALYZER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test - version04--workingone.py')
+
+def load_analyzer_module():
+    """加载test - version04--workingone.py（文件名含空格和连字符，不能直接import）"""
+    module = sys.modules.get('email_analyzer')
+    if module is None:
+        spec = importlib.util.spec_from_file_location('email_analyzer', ANALYZER_SCRIPT)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules['email_analyzer'] = module
+        spec.loader.exec_module(module)
+    return module
+
+def json_default(value):
+    """numpy的数值和时间等不能直接转换为JSON的值"""
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+def file_signature(path):
+    """用修改时间和大小判断数据文件是否改变（不存在时为None）"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+class QueryService:
+    """保持一个已加载的EmailAnalyzer，在asyncio上处理HTTP/JSON查询
+    
+    内存索引的单个查询和模糊查找很快，直接在事件循环中执行；SQLite后端的单个查询和模糊查找要读磁盘，
+    与批量查询、重新加载一样放到线程中执行，不阻塞其他连接。数据文件改变后在后台建立新的分析器，
+    建好后再替换，替换前的请求仍使用旧的分析器；旧分析器的SQLite数据库在这些请求结束后关闭
+    """
+    
+    def __init__(self, source, sqlite=None, reload_interval=RELOAD_INTERVAL):
+        self.source = source
+        self.sqlite = sqlite
+        self.reload_interval = reload_interval
+        self.analyzer = None
+        self.signature = None
+        self.loaded_at = None
+        self.reloads = 0
+        self.requests = 0
+        self.server = None
+        self.watcher = None
+        self.connections = set()
+        self.in_use = {}  # 分析器 -> 正在线程中执行的查询数
+    
+    def build_analyzer(self):
+        """读取数据文件建立新的分析器（在线程中执行）"""
+        module = load_analyzer_module()
+        analyzer = module.EmailAnalyzer(self.source, sqlite=self.sqlite)
+        if not analyzer.all_emails:
+            raise ValueError(f"数据加载失败: {self.source}")
+        analyzer.verbose = False
+        return analyzer
+    
+    async def load(self):
+        """加载（或重新加载）数据文件，失败时保留原来的分析器"""
+        signature = file_signature(self.source)
+        loop = asyncio.get_running_loop()
+        try:
+            analyzer = await loop.run_in_executor(None, self.build_analyzer)
+        except Exception as e:
+            print(f"加载数据失败: {e}")
+            return False
+        previous, self.analyzer = self.analyzer, analyzer
+        if previous is not None:
+            self.reloads += 1
+            self.release(previous, 0)
+        self.signature = signature
+        self.loaded_at = datetime.now()
+        print(f"[{self.loaded_at:%H:%M:%S}] 已加载: {self.source} ({len(analyzer.all_emails)} 条邮件记录)")
+        return True
+    
+    async def run_in_thread(self, method, *args):
+        """在线程中执行当前分析器的method(*args)，执行期间不关闭该分析器的SQLite数据库"""
+        analyzer = self.analyzer
+        self.in_use[analyzer] = self.in_use.get(analyzer, 0) + 1
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(None, getattr(analyzer, method), *args)
+        finally:
+            self.release(analyzer)
+    
+    def release(self, analyzer, count=1):
+        """分析器在线程中的查询结束count个；已被替换且没有查询在执行时关闭它的SQLite数据库"""
+        remaining = self.in_use.pop(analyzer, 0) - count
+        if remaining > 0:
+            self.in_use[analyzer] = remaining
+        elif analyzer is not self.analyzer and analyzer.sqlite_db is not None:
+            analyzer.sqlite_db.close()
+    
+    async def watch(self):
+        """定期检查数据文件，改变后（且两次检查之间没有继续写入）重新加载"""
+        pending = None
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            signature = file_signature(self.source)
+            if signature is None or signature == self.signature:
+                pending = None
+                continue
+            # Excel保存文件需要时间，大小和修改时间稳定后再读取
+            if signature != pending:
+                pending = signature
+                continue
+            print("数据文件已改变，重新加载...")
+            if not await self.load():
+                self.signature = signature  # 同一内容不再重试，等待下一次修改
+            pending = None
+    
+    async def start(self, host=HOST, port=PORT):
+        """加载数据并开始监听（port为0时使用空闲端口），返回asyncio的Server"""
+        if not await self.load():
+            raise RuntimeError(f"不能加载数据文件: {self.source}")
+        self.server = await asyncio.start_server(self.handle, host, port)
+        if self.reload_interval:
+            self.watcher = asyncio.create_task(self.watch())
+        return self.server
+    
+    async def stop(self):
+        """停止监听并关闭所有连接"""
+        if self.watcher is not None:
+            self.watcher.cancel()
+        if self.server is not None:
+            self.server.close()
+            for writer in list(self.connections):
+                writer.close()
+            await self.server.wait_closed()
+            # 等待各连接的处理读到连接关闭后结束
+            while self.connections:
+                await asyncio.sleep(0)
+        if self.analyzer is not None and self.analyzer.sqlite_db is not None:
+            self.analyzer.sqlite_db.close()
+    
+    @property
+    def port(self):
+        return self.server.sockets[0].getsockname()[1]
+    
+    async def handle(self, reader, writer):
+        """处理一个连接上的请求（HTTP/1.1 keep-alive时可以有多个请求）"""
+        self.connections.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY_SIZE:
+                    status, payload = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'错误': '请求内容过大'}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b''
+                    status, payload = await self.dispatch(method, target, body)
+                    keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                
+                # 字符串为Prometheus文本格式，其他转换为JSON
+                if isinstance(payload, str):
+                    data, content_type = payload.encode('utf-8'), 'text/plain; version=0.0.4; charset=utf-8'
+                else:
+                    data = json.dumps(payload, ensure_ascii=False, default=json_default).encode('utf-8')
+                    content_type = 'application/json; charset=utf-8'
+                writer.write(
+                    f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass  # 客户端断开或请求格式错误时关闭连接
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+    
+    async def dispatch(self, method, target, body):
+        """按路径调用对应的查询，返回(HTTP状态, JSON内容)"""
+        self.requests += 1
+        url = urlsplit(target)
+        params = parse_qs(url.query)
+        routes = {
+            '/query': ('GET', self.query),
+            '/batch': ('GET', 'POST', self.batch),
+            '/search': ('GET', self.search),
+            '/status': ('GET', self.status),
+            '/metrics': ('GET', self.metrics),
+        }
+        route = routes.get(url.path)
+        if route is None:
+            return HTTPStatus.NOT_FOUND, {'错误': f"没有这个路径: {url.path}"}
+        if method not in route[:-1]:
+            return HTTPStatus.METHOD_NOT_ALLOWED, {'错误': f"不支持的方法: {method}"}
+        
+        if body:
+            try:
+                params.update(json.loads(body.decode('utf-8')))
+            except (UnicodeDecodeError, json.JSONDecodeError, TypeError, ValueError):
+                return HTTPStatus.BAD_REQUEST, {'错误': '请求内容不是JSON对象'}
+        try:
+            return HTTPStatus.OK, await route[-1](params)
+        except (KeyError, ValueError) as e:
+            return HTTPStatus.BAD_REQUEST, {'错误': e.args[0] if e.args else str(e)}
+        except Exception as e:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'错误': f"{type(e).__name__}: {e}"}
+    
+    @staticmethod
+    def single(params, name):
+        """查询参数中的一个值（parse_qs的结果为列表，JSON中可以直接是字符串）"""
+        value = params.get(name)
+        if isinstance(value, list):
+            value = value[0] if value else None
+        if value is None or value == '':
+            raise KeyError(f"缺少参数: {name}")
+        return str(value)
+    
+    async def query(self, params):
+        search_id = self.single(params, 'id')
+        # SQLite后端的查询要读磁盘，放到线程中执行
+        if self.analyzer.sqlite_db is not None:
+            return await self.run_in_thread('find_closest_response', search_id)
+        return self.analyzer.find_closest_response(search_id)
+    
+    async def batch(self, params):
+        ids = params.get('ids', params.get('id'))
+        if not isinstance(ids, list) or not ids:
+            raise KeyError("缺少参数: ids（或多个id）")
+        results = await self.run_in_thread('compute_all_responses', [str(sid) for sid in ids])
+        return results.to_dict('records')
+    
+    async def search(self, params):
+        query = self.single(params, 'q')
+        limit = int(self.single(params, 'limit')) if params.get('limit') else SEARCH_LIMIT
+        if self.analyzer.sqlite_db is not None:
+            search_ids = await self.run_in_thread('find_search_ids', query, limit)
+        else:
+            search_ids = self.analyzer.find_search_ids(query, limit=limit)
+        return {'查询': query, '搜索ID': search_ids}
+    
+    async def status(self, params):
+        analyzer = self.analyzer
+        return {
+            '数据文件': os.path.abspath(self.source),
+            '加载时间': self.loaded_at.strftime('%Y-%m-%d %H:%M:%S'),
+            '邮件记录': len(analyzer.all_emails),
+            '线程ID数量': len(analyzer.data_by_thread_id),
+            '搜索ID数量': len(analyzer.data_by_search_id),
+            'SQLite': analyzer.sqlite_db is not None,
+            '重新加载次数': self.reloads,
+            '请求数': self.requests,
+        }
+    
+    async def metrics(self, params):
+        metrics = load_analyzer_module().metrics
+        if params.get('format') in (['prometheus'], 'prometheus'):
+            return metrics.to_prometheus()
+        return metrics.to_dict()
+
+async def serve(source, host=HOST, port=PORT, sqlite=None):
+    """启动查询服务，直到按Ctrl+C"""
+    service = QueryService(source, sqlite=sqlite)
+    server = await service.start(host, port)
+    print(f"查询服务已启动: http://{host}:{service.port}/  (按Ctrl+C停止)")
+    async with server:
+        await server.serve_forever()
+
+def main():
+    if len(sys.argv) < 2:
+        print("用法: python query-service.py <数据文件> [端口]")
+        return 1
+    source = sys.argv[1]
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else PORT
+    if not os.path.exists(source):
+        print(f"文件不存在: {source}")
+        return 1
+    try:
+        asyncio.run(serve(source, port=port))
+    except KeyboardInterrupt:
+        print("\n查询服务已停止")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,140 +1,693 @@
-import pandas as pd
 import os
 import re
-from datetime import datetime, timedelta
+import codecs
+import json
+import hashlib
+import fnmatch
+import zipfile
+import tarfile
+import mmap
+import csv
+import multiprocessing
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from concurrent.futures import ProcessPoolExecutor
 
 folder = r"C:\Users\out-tanyuting\Downloads\test-0206\add"
 output = r"C:\Users\out-tanyuting\Desktop\邮件日本时间0206-new-01.xlsx"
 
+# 输出格式: None 按output的扩展名决定（.xlsx / .csv / .parquet），结果按批写入
+output_format = None
+write_batch_size = 5000  # 每批写入的行数（Parquet每批一个row group）
+
+# 扫描模式: 'parallel' 使用进程池并行处理, 'serial' 为原来的单进程逐个处理（用于对比）
+scan_mode = 'parallel'
+workers = os.cpu_count() or 1  # 进程池的进程数
+chunk_size = 500  # 每个任务批次包含的文件数
+verbose = True  # 是否显示扫描进度和清单统计（错误仍然显示）；分析器设置了quiet时不显示
+
+# 增量扫描: 结果缓存在输出文件旁的清单文件中，再次运行时只处理新增或修改过的文件
+use_manifest = True
+manifest_hash = False  # 除大小和修改时间外，再比较文件内容的哈希（需要读取整个文件）
+MANIFEST_VERSION = 4
+
+# 输入范围: 递归遍历子文件夹，按通配符筛选（匹配相对路径，如 "2026-01-26/xxx.eml"）
+recursive = True
+include_patterns = ['*.eml']
+exclude_patterns = []  # 例如 ['*/drafts/*', '*テスト*']
+scan_archives = True  # 直接读取.zip/.tar.gz中的.eml，不需要先解压
+zip_name_encoding = 'cp932'  # 没有UTF-8标志的zip文件名编码（Windows日文环境）
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz')
+
+# mbox/Maildir: mbox文件按 "From " 分隔行流式扫描；含cur/new子文件夹的目录按Maildir读取
+scan_mbox = True
+scan_maildir = True
+MBOX_SUFFIXES = ('.mbox', '.mbx')
+
+NOT_FOUND = "未找到时间信息"
+
+HEADER_BLOCK_SIZE = 8192  # 读取邮件头时每次读取的字节数
+MAX_HEADER_SIZE = 1024 * 1024  # 邮件头最大读取字节数（没有空行的异常文件）
+BODY_READ_SIZE = 5000  # 与原脚本相同，在邮件开头的5000个字符中查找时间
+BODY_READ_BYTES = BODY_READ_SIZE * 4  # 5000个字符最多占用的字节数（UTF-8）
+
+# 在原始字节上匹配，时间信息都是ASCII字符，不需要先解码整个文件
+HEADER_END_RE = re.compile(rb'\r?\n\r?\n')
+ISO_TIME_RE = re.compile(rb'(\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2})')
+DATE_HEADER_RE = re.compile(rb'^Date:[ \t]*([^\r\n]*(?:\r?\n[ \t][^\r\n]*)*)', re.MULTILINE | re.IGNORECASE)
+CHARSET_RE = re.compile(rb'charset\s*=\s*"?([A-Za-z0-9_\-]+)', re.IGNORECASE)
+MESSAGE_ID_RE = re.compile(rb'^Message-ID:[ \t]*([^\r\n]*)', re.MULTILINE | re.IGNORECASE)
+
+# 时间解析用的正则和月份表（只编译/创建一次）
+ISO_TIME_TEXT_RE = re.compile(r'(\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2})')
+DATE_LINE_RE = re.compile(r'Date:\s*(.+?)(?:\n|$)', re.IGNORECASE)
+RFC_DATE_RE = re.compile(
+    r'(?:[A-Za-z]{3},\s*)?(\d{1,2})\s+([A-Za-z]{3})\s+(\d{4})\s+'
+    r'(\d{1,2}):(\d{2})(?::(\d{2}))?\s*([+-]\d{4})'
+)
+MONTHS = {'Jan':1,'Feb':2,'Mar':3,'Apr':4,'May':5,'Jun':6,
+          'Jul':7,'Aug':8,'Sep':9,'Oct':10,'Nov':11,'Dec':12}
+OFFSET_TZ_CACHE = {}
+
+try:
+    JST = ZoneInfo('Asia/Tokyo')
+except ZoneInfoNotFoundError:
+    # Windows上没有安装tzdata时使用固定的UTC+9（日本没有夏令时）
+    JST = timezone(timedelta(hours=9), 'JST')
+
+def get_offset_tz(offset):
+    """把 "+0530" 这样的时区偏移转换为tzinfo（带缓存）"""
+    tz = OFFSET_TZ_CACHE.get(offset)
+    if tz is None:
+        sign = -1 if offset[0] == '-' else 1
+        minutes = int(offset[1:3]) * 60 + int(offset[3:5])
+        tz = timezone(sign * timedelta(minutes=minutes))
+        OFFSET_TZ_CACHE[offset] = tz
+    return tz
+
+def format_time(dt):
+    """格式化为 "2026-01-26 09:44:39"（比strftime快）"""
+    return dt.isoformat(' ')[:19]
+
+def parse_mail_date(date_str):
+    """解析邮件Date头的值，返回日本时间的datetime，无法解析时返回None"""
+    # 快速路径: Tue, 20 Jan 2026 06:13:09 +0000 / 20 Jan 2026 06:13:09 +0900
+    match = RFC_DATE_RE.search(date_str)
+    if match:
+        day, month_name, year, hour, minute, second, offset = match.groups()
+        month = MONTHS.get(month_name.title())
+        if month:
+            try:
+                local_time = datetime(int(year), month, int(day), int(hour), int(minute),
+                                      int(second or 0), tzinfo=get_offset_tz(offset))
+                return local_time.astimezone(JST)
+            except ValueError:
+                pass
+            except OverflowError:
+                # 换算后超出datetime的范围（如9999年12月31日、0001年1月1日），不再交给email.utils
+                # （它会把0001年当作两位年份的2001年）
+                return None
+    
+    # 其他格式（GMT/EST等时区名、两位年份等）交给email.utils解析
+    try:
+        parsed = parsedate_to_datetime(date_str)
+    except (TypeError, ValueError, IndexError):
+        return None
+    
+    # 没有时区信息（-0000）时按UTC处理
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    try:
+        return parsed.astimezone(JST)
+    except (ValueError, OverflowError):
+        return None
+
 def extract_jst_time(content):
     """从邮件内容中提取日本时间"""
     # 方法1: 尝试查找类似 "2026-01-26 09:44:39" 的格式
-    pattern1 = r'(\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2})'
-    match = re.search(pattern1, content)
-    
+    match = ISO_TIME_TEXT_RE.search(content)
     if match:
         return match.group(1)
     
-    # 方法2: 尝试查找Date头（原始脚本的方法，但需要修正）
-    date_pattern = r'Date:\s*(.+?)(?:\n|$)'
-    date_match = re.search(date_pattern, content, re.IGNORECASE)
+    # 方法2: 查找Date头并转换为日本时间
+    match = DATE_LINE_RE.search(content)
+    if match:
+        jst_time = parse_mail_date(match.group(1).strip())
+        if jst_time is not None:
+            return format_time(jst_time)
     
-    if date_match:
-        date_str = date_match.group(1).strip()
+    return NOT_FOUND
+
+def read_header_bytes(f):
+    """读取邮件头的原始字节，读到第一个空行（RFC 5322 头部结束）为止
+    
+    返回 (邮件头, 已读取的全部字节)，不需要seek，压缩包中的文件流也可以使用
+    """
+    buf = b''
+    while len(buf) < MAX_HEADER_SIZE:
+        block = f.read(HEADER_BLOCK_SIZE)
+        if not block:
+            break
         
-        # 尝试解析常见的邮件时间格式
-        # 格式1: Tue, 20 Jan 2026 06:13:09 +0000
-        # 格式2: 20 Jan 2026 06:13:09 +0900
-        patterns = [
-            r'(\d{1,2})\s+([A-Za-z]{3})\s+(\d{4})\s+(\d{2}):(\d{2}):(\d{2})\s+([+-]\d{4})',
-            r'([A-Za-z]{3}),\s+(\d{1,2})\s+([A-Za-z]{3})\s+(\d{4})\s+(\d{2}):(\d{2}):(\d{2})\s+([+-]\d{4})',
-            r'(\d{4}-\d{2}-\d{2})\s+(\d{2}:\d{2}:\d{2})'
-        ]
+        # 空行可能跨两个块，从上一块末尾几个字节开始查找
+        search_from = max(0, len(buf) - 3)
+        buf += block
+        match = HEADER_END_RE.search(buf, search_from)
+        if match:
+            return buf[:match.start()], buf
+    
+    return buf, buf
+
+def extract_jst_time_from_header(header):
+    """在邮件头原始字节中查找时间，只解码匹配到的部分"""
+    # 方法1: 类似 "2026-01-26 09:44:39" 的格式
+    match = ISO_TIME_RE.search(header)
+    if match:
+        return match.group(1).decode('ascii')
+    
+    # 方法2: Date头（可能折行）
+    match = DATE_HEADER_RE.search(header)
+    if match:
+        date_str = b' '.join(match.group(1).split()).decode('ascii', errors='ignore')
+        jst_time = parse_mail_date(date_str)
+        if jst_time is not None:
+            return format_time(jst_time)
+    
+    return NOT_FOUND
+
+def detect_charset(header):
+    """从Content-Type头中取得字符集，无法识别时使用utf-8"""
+    match = CHARSET_RE.search(header)
+    if match:
+        charset = match.group(1).decode('ascii')
+        try:
+            codecs.lookup(charset)
+            return charset
+        except LookupError:
+            pass
+    return 'utf-8'
+
+def extract_from_stream(f):
+    """从二进制文件流中提取日本时间"""
+    header, data = read_header_bytes(f)
+    if len(data) < BODY_READ_BYTES:
+        data += f.read(BODY_READ_BYTES - len(data))
+    return extract_jst_time_from_message(header, data)
+
+def extract_jst_time_from_message(header, data):
+    """按原脚本的优先顺序提取时间: 邮件开头5000个字符中的 "2026-01-26 09:44:39" 格式（包括正文）优先，
+    其次是其中的Date头；都没有时再查找整个邮件头（超过5000个字符的长邮件头）
+    """
+    content = data[:BODY_READ_BYTES].decode(detect_charset(header), errors='ignore')
+    # 原脚本按文本模式读取，换行统一为 "\n" 后再计算字符数
+    content = content.replace('\r\n', '\n').replace('\r', '\n')[:BODY_READ_SIZE]
+    jst_time = extract_jst_time(content)
+    if jst_time == NOT_FOUND:
+        jst_time = extract_jst_time_from_header(header)
+    return jst_time
+
+def process_file(path):
+    """读取单个.eml文件并提取日本时间"""
+    try:
+        with open(path, 'rb') as f:
+            return extract_from_stream(f)
+    
+    except Exception as e:
+        print(f"处理文件 {path} 时出错: {e}")
+        return f"错误: {str(e)}"
+
+def is_included(rel_path):
+    """按include/exclude通配符判断是否处理该文件"""
+    if is_excluded(rel_path):
+        return False
+    return any(fnmatch.fnmatch(rel_path, pattern) for pattern in include_patterns)
+
+def is_archive(name):
+    """判断是否是支持的压缩包"""
+    return scan_archives and name.lower().endswith(ARCHIVE_SUFFIXES)
+
+def is_mbox(name):
+    """判断是否是mbox文件"""
+    return scan_mbox and name.lower().endswith(MBOX_SUFFIXES)
+
+def is_maildir(path):
+    """含cur和new子文件夹的目录视为Maildir"""
+    return scan_maildir and os.path.isdir(os.path.join(path, 'cur')) and os.path.isdir(os.path.join(path, 'new'))
+
+def is_excluded(rel_path):
+    """文件、压缩包或子文件夹是否被exclude_patterns排除"""
+    return any(fnmatch.fnmatch(rel_path, pattern) for pattern in exclude_patterns)
+
+def walk_inputs(folder):
+    """用os.scandir遍历文件夹
+    
+    返回 ({.eml相对路径: (大小, 修改时间)}, {压缩包/mbox相对路径: (大小, 修改时间)})，
+    Maildir中cur/new下的邮件文件不论扩展名都作为单个邮件处理
+    """
+    files = {}
+    archives = {}
+    pending = [('', False)]  # (相对路径, 是否是Maildir的cur/new)
+    
+    while pending:
+        rel_dir, is_mail_dir = pending.pop()
+        dir_path = os.path.join(folder, rel_dir)
+        maildir_root = not is_mail_dir and is_maildir(dir_path)
         
-        for pattern in patterns:
-            match = re.search(pattern, date_str)
-            if match:
-                try:
-                    # 月份映射
-                    months = {'Jan':1,'Feb':2,'Mar':3,'Apr':4,'May':5,'Jun':6,
-                             'Jul':7,'Aug':8,'Sep':9,'Oct':10,'Nov':11,'Dec':12}
-                    
-                    if len(match.groups()) >= 6:
-                        if pattern == patterns[0]:  # 格式1
-                            day = int(match.group(1))
-                            month = months.get(match.group(2), 1)
-                            year = int(match.group(3))
-                            hour = int(match.group(4))
-                            minute = int(match.group(5))
-                            second = int(match.group(6))
-                            offset = match.group(7)
-                        elif pattern == patterns[1]:  # 格式2
-                            day = int(match.group(2))
-                            month = months.get(match.group(3), 1)
-                            year = int(match.group(4))
-                            hour = int(match.group(5))
-                            minute = int(match.group(6))
-                            second = int(match.group(7))
-                            offset = match.group(8)
-                        
-                        # 计算UTC偏移
-                        offset_hours = int(offset[:3])
-                        
-                        # 创建时间对象
-                        local_time = datetime(year, month, day, hour, minute, second)
-                        
-                        # 转换为UTC
-                        utc_time = local_time - timedelta(hours=offset_hours)
-                        
-                        # 转换为日本时间 (UTC+9)
-                        jst_time = utc_time + timedelta(hours=9)
-                        
-                        return jst_time.strftime("%Y-%m-%d %H:%M:%S")
-                    
-                except Exception as e:
-                    print(f"解析时间时出错: {date_str}, 错误: {e}")
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                # 统一使用 "/" 分隔，结果在不同系统上一致
+                rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                
+                if entry.is_dir(follow_symlinks=False):
+                    if maildir_root and entry.name in ('cur', 'new'):
+                        pending.append((rel_path, True))
+                    elif maildir_root and entry.name == 'tmp':
+                        continue  # 正在投递中的邮件
+                    elif recursive and not is_mail_dir and not is_excluded(rel_path):
+                        pending.append((rel_path, False))
+                    continue
+                
+                if is_excluded(rel_path):
+                    continue
+                if is_mail_dir:
+                    if entry.name.startswith('.'):
+                        continue
+                    target = files
+                elif is_archive(entry.name) or is_mbox(entry.name):
+                    target = archives
+                elif is_included(rel_path):
+                    target = files
+                else:
                     continue
+                
+                st = entry.stat()
+                target[rel_path] = (st.st_size, st.st_mtime_ns)
     
-    return "未找到时间信息"
+    return files, archives
 
-# 处理所有文件
-results = []
-file_count = 0
-error_files = []
+def list_eml_files(folder):
+    """列出文件夹中的.eml文件（排序后保证结果顺序固定）"""
+    files, _ = walk_inputs(folder)
+    return sorted(files)
 
-for file in os.listdir(folder):
-    if file.endswith('.eml'):
-        file_count += 1
-        path = os.path.join(folder, file)
-        
-        try:
-            # 尝试不同的编码
-            for encoding in ['utf-8', 'shift_jis', 'euc-jp', 'cp932', 'latin-1']:
-                try:
-                    with open(path, 'r', encoding=encoding, errors='ignore') as f:
-                        content = f.read(5000)  # 读取更多内容以确保包含时间信息
-                    
-                    jst_time = extract_jst_time(content)
-                    
-                    # 如果找到时间就停止尝试其他编码
-                    if jst_time != "未找到时间信息":
-                        break
-                except:
+def iter_archive_members(path):
+    """逐个返回压缩包中的 (成员名, 二进制文件流)，不解压到磁盘"""
+    if path.lower().endswith('.zip'):
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                if info.is_dir():
                     continue
+                name = info.filename
+                # 没有UTF-8标志的文件名被按cp437解码，按实际编码重新解码
+                if not info.flag_bits & 0x800:
+                    try:
+                        name = name.encode('cp437').decode(zip_name_encoding)
+                    except (UnicodeEncodeError, UnicodeDecodeError):
+                        pass
+                with zf.open(info) as f:
+                    yield name, f
+    else:
+        # 流式模式，.tar.gz按顺序解压，不需要随机访问
+        with tarfile.open(path, mode='r|*') as tf:
+            for member in tf:
+                if not member.isfile():
+                    continue
+                f = tf.extractfile(member)
+                yield member.name, f
+
+def iter_mbox_messages(path):
+    """用内存映射扫描mbox，逐个返回 (起始偏移, 邮件头, 邮件开头字节)，不把整个文件读入内存"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            # 第一封邮件的 "From " 分隔行
+            start = 0 if mm[:5] == b'From ' else mm.find(b'\nFrom ')
+            if start > 0:
+                start += 1
             
-            results.append([file, jst_time])
-            
-            if jst_time == "未找到时间信息":
-                error_files.append(file)
+            while 0 <= start < size:
+                next_sep = mm.find(b'\nFrom ', start)
+                end = size if next_sep == -1 else next_sep + 1
+                
+                # 跳过 "From " 分隔行本身
+                line_end = mm.find(b'\n', start, end)
+                header_start = end if line_end == -1 else line_end + 1
                 
-            # 显示进度
-            if file_count % 100 == 0:
-                print(f"已处理 {file_count} 个文件...")
+                header_limit = min(end, header_start + MAX_HEADER_SIZE)
+                match = HEADER_END_RE.search(mm, header_start, header_limit)
+                header_end = match.start() if match else header_limit
                 
-        except Exception as e:
-            print(f"处理文件 {file} 时出错: {e}")
-            results.append([file, f"错误: {str(e)}"])
-
-# 保存到Excel
-df = pd.DataFrame(results, columns=['文件名', '日本时间(JST)'])
-df.to_excel(output, index=False)
-
-print(f"\n完成！已处理 {len(results)} 个文件")
-print(f"保存到: {output}")
-
-# 显示统计信息
-print(f"\n统计信息:")
-print(f"- 成功处理: {len(results) - len(error_files)}")
-print(f"- 未找到时间: {len(error_files)}")
-
-if error_files:
-    print("\n以下文件未找到时间信息:")
-    for i, filename in enumerate(error_files[:10]):  # 只显示前10个
-        print(f"  {i+1}. {filename}")
-    if len(error_files) > 10:
-        print(f"  ... 还有 {len(error_files) - 10} 个文件")
-
-# 显示前几个结果
-print("\n前10个结果:")
-for i, (filename, time_str) in enumerate(results[:10]):
-    print(f"{i+1:3}. {filename[:50]:50} → {time_str}")
\ No newline at end of file
+                yield (start, mm[header_start:header_end],
+                       mm[header_start:min(end, header_start + BODY_READ_BYTES)])
+                start = end
+
+def scan_mbox_file(folder, rel_path):
+    """处理mbox中的所有邮件，文件名记为 "mbox路径@字节偏移 Message-ID" """
+    results = []
+    try:
+        for index, (offset, header, data) in enumerate(iter_mbox_messages(os.path.join(folder, rel_path))):
+            match = MESSAGE_ID_RE.search(header)
+            message_id = match.group(1).strip().decode('ascii', errors='ignore') if match else ''
+            key = f"{rel_path}@{offset} {message_id or f'#{index + 1}'}"
+            
+            results.append([key, extract_jst_time_from_message(header, data)])
+    except Exception as e:
+        print(f"读取mbox {rel_path} 时出错: {e}")
+        results.append([rel_path, f"错误: {str(e)}"])
+    
+    return results
+
+def scan_archive(folder, rel_path):
+    """处理一个压缩包（或mbox）中的所有邮件，返回 [[文件名, 日本时间], ...]"""
+    if is_mbox(rel_path):
+        return scan_mbox_file(folder, rel_path)
+    
+    results = []
+    try:
+        for name, f in iter_archive_members(os.path.join(folder, rel_path)):
+            if not is_included(name):
+                continue
+            key = f"{rel_path}/{name}"
+            try:
+                results.append([key, extract_from_stream(f)])
+            except Exception as e:
+                print(f"处理文件 {key} 时出错: {e}")
+                results.append([key, f"错误: {str(e)}"])
+    except Exception as e:
+        print(f"读取压缩包 {rel_path} 时出错: {e}")
+        results.append([rel_path, f"错误: {str(e)}"])
+    
+    return results
+
+def log(message):
+    """显示扫描进度（verbose为False时不显示）"""
+    if verbose:
+        print(message)
+
+def scan_archive_list(folder, archives):
+    """处理多个压缩包，返回 {压缩包相对路径: 结果列表}"""
+    if scan_mode == 'parallel' and len(archives) > 1 and pool_available():
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            archive_results = list(executor.map(scan_archive, [folder] * len(archives), archives))
+    else:
+        archive_results = [scan_archive(folder, rel_path) for rel_path in archives]
+    
+    for rel_path, results in zip(archives, archive_results):
+        log(f"{rel_path}: {len(results)} 封邮件")
+    return dict(zip(archives, archive_results))
+
+def process_chunk(paths):
+    """进程池任务：处理一批文件，按输入顺序返回时间"""
+    return [process_file(path) for path in paths]
+
+def iter_serial(folder, files):
+    """单进程逐个处理文件，逐条返回 [文件名, 日本时间]"""
+    for file_count, file in enumerate(files, 1):
+        yield [file, process_file(os.path.join(folder, file))]
+        
+        # 显示进度
+        if file_count % 100 == 0:
+            log(f"已处理 {file_count} 个文件...")
+
+def iter_parallel(folder, files, workers=workers, chunk_size=chunk_size):
+    """使用进程池分批并行处理文件，按文件顺序逐条返回 [文件名, 日本时间]"""
+    chunks = [files[i:i + chunk_size] for i in range(0, len(files), chunk_size)]
+    path_chunks = [[os.path.join(folder, file) for file in chunk] for chunk in chunks]
+    
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # executor.map 按提交顺序返回，结果顺序与文件列表一致
+        for chunk, times in zip(chunks, executor.map(process_chunk, path_chunks)):
+            yield from ([file, jst_time] for file, jst_time in zip(chunk, times))
+            done += len(chunk)
+            log(f"已处理 {done}/{len(files)} 个文件...")
+
+def scan_serial(folder, files=None):
+    """单进程逐个处理所有文件"""
+    if files is None:
+        files = list_eml_files(folder)
+    return list(iter_serial(folder, files))
+
+def scan_parallel(folder, workers=workers, chunk_size=chunk_size, files=None):
+    """使用进程池分批并行处理所有文件"""
+    if files is None:
+        files = list_eml_files(folder)
+    return list(iter_parallel(folder, files, workers, chunk_size))
+
+def pool_available():
+    """子进程要能按模块名找到处理函数：本脚本作为主程序运行，或者使用fork启动子进程
+    （被其他脚本按路径加载且使用spawn时（Windows），只能单进程处理）"""
+    return __name__ == '__main__' or multiprocessing.get_start_method() == 'fork'
+
+def iter_scan_files(folder, files):
+    """按scan_mode处理指定的文件"""
+    if scan_mode == 'parallel' and len(files) > chunk_size and pool_available():
+        log(f"并行扫描: {workers} 个进程, 每批 {chunk_size} 个文件")
+        return iter_parallel(folder, files, workers, chunk_size)
+    return iter_serial(folder, files)
+
+def scan_files(folder, files):
+    """按scan_mode处理指定的文件，返回结果列表"""
+    return list(iter_scan_files(folder, files))
+
+def get_manifest_path(output):
+    """清单文件保存在输出文件旁边"""
+    return os.path.splitext(output)[0] + '.manifest.json'
+
+def file_hash(path):
+    """计算文件内容的哈希"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def load_manifest(manifest_path, folder):
+    """读取清单，版本或文件夹不一致时视为空"""
+    if not os.path.exists(manifest_path):
+        return {}
+    
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except Exception as e:
+        print(f"读取清单失败，将重新扫描: {e}")
+        return {}
+    
+    if manifest.get('version') != MANIFEST_VERSION or manifest.get('folder') != os.path.abspath(folder):
+        return {}
+    return manifest.get('files', {})
+
+def save_manifest(manifest_path, folder, entries):
+    """写入清单（先写临时文件再替换，避免中断时损坏）"""
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'folder': os.path.abspath(folder),
+        'files': entries,
+    }
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+def is_unchanged(entry, stat, path):
+    """清单中的记录与当前文件的大小、修改时间（及哈希）是否一致"""
+    if not entry or (entry['size'], entry['mtime']) != stat:
+        return False
+    return not manifest_hash or entry.get('hash') == file_hash(path)
+
+def make_entry(stat, path, **values):
+    """创建清单记录"""
+    entry = {'size': stat[0], 'mtime': stat[1], **values}
+    if manifest_hash:
+        entry['hash'] = file_hash(path)
+    return entry
+
+def iter_scan_inputs(folder, cached, entries):
+    """处理文件夹中的.eml文件、压缩包和mbox，只处理cached中没有或已修改的部分
+    
+    按路径顺序逐条返回 [文件名, 日本时间]，处理完一批就返回一批，
+    新的清单记录写入entries（生成器结束后才完整）
+    """
+    files, archives = walk_inputs(folder)
+    
+    changed_files = []
+    changed_archives = []
+    for inputs, changed in ((files, changed_files), (archives, changed_archives)):
+        for rel_path in sorted(inputs):
+            if is_unchanged(cached.get(rel_path), inputs[rel_path], os.path.join(folder, rel_path)):
+                entries[rel_path] = cached[rel_path]
+            else:
+                changed.append(rel_path)
+    
+    removed = len(set(cached) - set(files) - set(archives))
+    log(f"清单: 已缓存 {len(entries)} 个, 需处理 {len(changed_files)} 个文件和 "
+        f"{len(changed_archives)} 个压缩包/mbox, 已删除 {removed} 个")
+    
+    # 压缩包/mbox数量少，先处理；单个文件按路径顺序流式处理，与缓存结果按路径合并
+    archive_results = scan_archive_list(folder, changed_archives)
+    for rel_path, members in archive_results.items():
+        if not any(jst_time.startswith('错误:') for _, jst_time in members):
+            path = os.path.join(folder, rel_path)
+            entries[rel_path] = make_entry(archives[rel_path], path, members=members)
+    
+    new_files = iter_scan_files(folder, changed_files)
+    for rel_path in sorted(set(files) | set(archives)):
+        if rel_path in archive_results:
+            yield from archive_results[rel_path]
+        elif rel_path in files and rel_path not in entries:
+            _, jst_time = next(new_files)
+            yield [rel_path, jst_time]
+            # 读取出错的文件不写入清单，下次重新处理
+            if not jst_time.startswith('错误:'):
+                path = os.path.join(folder, rel_path)
+                entries[rel_path] = make_entry(files[rel_path], path, jst=jst_time)
+        elif 'members' in entries[rel_path]:
+            yield from entries[rel_path]['members']
+        else:
+            yield [rel_path, entries[rel_path]['jst']]
+
+def scan_inputs(folder, cached=None):
+    """处理所有输入，返回 (按路径排序的结果, 新的清单记录)"""
+    entries = {}
+    results = list(iter_scan_inputs(folder, cached or {}, entries))
+    return results, entries
+
+def scan_incremental(folder, manifest_path):
+    """增量扫描：只处理新增或修改过的文件，其余结果从清单中读取"""
+    results, entries = scan_inputs(folder, load_manifest(manifest_path, folder))
+    save_manifest(manifest_path, folder, entries)
+    return results
+
+class ResultWriter:
+    """按批写入结果，支持 .csv / .parquet / .xlsx，不在内存中保留全部结果
+    
+    columns默认为扫描结果的两列；其他结果（如回复时间的批量查询）可以指定自己的列
+    """
+    
+    COLUMNS = ['文件名', '日本时间(JST)']
+    
+    def __init__(self, path, output_format=None, columns=None):
+        self.path = path
+        self.columns = list(columns or self.COLUMNS)
+        self.format = (output_format or os.path.splitext(path)[1].lstrip('.') or 'xlsx').lower()
+        self.rows_written = 0
+        
+        if self.format == 'csv':
+            # utf-8-sig: Excel直接打开时不会乱码
+            self.file = open(path, 'w', encoding='utf-8-sig', newline='')
+            self.csv_writer = csv.writer(self.file)
+            self.csv_writer.writerow(self.columns)
+        elif self.format == 'parquet':
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise ImportError("写入Parquet需要安装pyarrow: pip install pyarrow")
+            self.pa = pa
+            self.schema = pa.schema([(name, pa.string()) for name in self.columns])
+            # 每次write写入一个row group
+            self.parquet_writer = pq.ParquetWriter(path, self.schema)
+        elif self.format == 'xlsx':
+            try:
+                import xlsxwriter
+                # constant_memory: 每写完一行就刷到磁盘
+                self.workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+                self.worksheet = self.workbook.add_worksheet()
+                self.worksheet.write_row(0, 0, self.columns)
+            except ImportError:
+                from openpyxl import Workbook
+                # 没有xlsxwriter时使用openpyxl的只写模式
+                self.workbook = Workbook(write_only=True)
+                self.worksheet = self.workbook.create_sheet()
+                self.worksheet.append(self.columns)
+        else:
+            raise ValueError(f"不支持的输出格式: {self.format}")
+    
+    def write(self, rows):
+        """写入一批行（每行的值与columns的顺序相同）"""
+        if not rows:
+            return
+        
+        if self.format == 'csv':
+            self.csv_writer.writerows(rows)
+        elif self.format == 'parquet':
+            # 各列都保存为字符串（结果中数值和"N/A"可能混在同一列）
+            columns = list(zip(*rows))
+            table = self.pa.table({name: [None if v is None else str(v) for v in values]
+                                   for name, values in zip(self.columns, columns)},
+                                  schema=self.schema)
+            self.parquet_writer.write_table(table)
+        elif hasattr(self.worksheet, 'write_row'):
+            for i, row in enumerate(rows, self.rows_written + 1):
+                self.worksheet.write_row(i, 0, row)
+        else:
+            for row in rows:
+                self.worksheet.append(row)
+        
+        self.rows_written += len(rows)
+    
+    def close(self):
+        """完成写入并关闭文件"""
+        if self.format == 'csv':
+            self.file.close()
+        elif self.format == 'parquet':
+            self.parquet_writer.close()
+        elif hasattr(self.workbook, 'save'):
+            self.workbook.save(self.path)
+        else:
+            self.workbook.close()
+
+def main():
+    # 处理所有文件，边处理边按批写入
+    cached = load_manifest(get_manifest_path(output), folder) if use_manifest else {}
+    entries = {}
+    
+    writer = ResultWriter(output, output_format)
+    results = []  # 只保留前10个结果用于显示
+    error_files = []
+    batch = []
+    
+    for row in iter_scan_inputs(folder, cached, entries):
+        batch.append(row)
+        if len(batch) >= write_batch_size:
+            writer.write(batch)
+            batch = []
+        
+        if row[1] == NOT_FOUND:
+            error_files.append(row[0])
+        if len(results) < 10:
+            results.append(row)
+    
+    writer.write(batch)
+    writer.close()
+    
+    if use_manifest:
+        save_manifest(get_manifest_path(output), folder, entries)
+    
+    print(f"\n完成！已处理 {writer.rows_written} 个文件")
+    print(f"保存到: {output}")
+
+    # 显示统计信息
+    print(f"\n统计信息:")
+    print(f"- 成功处理: {writer.rows_written - len(error_files)}")
+    print(f"- 未找到时间: {len(error_files)}")
+
+    if error_files:
+        print("\n以下文件未找到时间信息:")
+        for i, filename in enumerate(error_files[:10]):  # 只显示前10个
+            print(f"  {i+1}. {filename}")
+        if len(error_files) > 10:
+            print(f"  ... 还有 {len(error_files) - 10} 个文件")
+
+    # 显示前几个结果
+    print("\n前10个结果:")
+    for i, (filename, time_str) in enumerate(results):
+        print(f"{i+1:3}. {filename[:50]:50} → {time_str}")
+
+if __name__ == "__main__":
+    main()
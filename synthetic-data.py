@@ -0,0 +1,273 @@
+import os
+import sys
+import heapq
+import random
+import base64
+import importlib.util
+from datetime import datetime, timedelta, timezone
+from email.header import Header
+from email.utils import format_datetime
+
+# 合成测试数据: 按真实数据的文件名格式和线程规模生成邮件，可以写成.eml文件夹或汇总表（1千～100万封）
+#
+#   python synthetic-data.py workbook <输出文件.xlsx|.csv|.parquet> <邮件数> [种子]
+#   python synthetic-data.py eml <文件夹> <邮件数> [种子]
+#
+# 同样的邮件数和种子生成相同的邮件；.eml文件夹扫描后的结果与汇总表相同
+
+START_TIME = datetime(2026, 1, 5, 9, 0, 0)  # 第一封邮件的日本时间
+MESSAGES_PER_DAY = 300  # 每天的邮件数（与真实数据相近）
+FIRST_SEARCH_NUMBER = 1211
+
+# 线程种类的比例: A/B/C为短格式线程ID，INC为只有INC编号的线程，
+# 长C为C29497931这样的编号（线程ID为"未知"，查询时从文件名猜测），其他为没有线程ID的邮件
+FAMILY_WEIGHTS = {'A': 18, 'B': 30, 'C': 22, 'INC': 15, '长C': 5, '其他': 10}
+
+# 每个线程的邮件数（按真实数据的分布）
+THREAD_SIZE_WEIGHTS = {1: 533, 2: 895, 3: 471, 4: 196, 5: 131, 6: 74, 7: 47, 8: 33, 9: 19, 10: 25, 11: 7, 13: 7}
+REPLY_GAP_HOURS = 4.0  # 线程内相邻两封邮件的平均间隔
+SAME_SECOND_RATE = 0.02  # 与上一封邮件时间完全相同的比例
+
+REPLY_MARKERS = ['Re: '] * 6 + ['RE: '] * 2 + ['返信: ']
+FOLLOW_UP_MARKERS = ['FW: ', '']  # 线程中不是回复的邮件（转发或追加的问合）
+REPLY_RATE = 0.8
+
+SUBJECTS = [
+    'iPhone MDM切替操作について',
+    'iPhone　MDM切替について',
+    'MDM切替後の社用スマホ動作不良で問合せをしておりますが回答いただけておりません',
+    'ガラホType2　MDM切り替え後の連絡先について',
+    '端末交換について',
+    'アプリがインストールできない',
+    'Teamsにサインインできません',
+    '【エスカレーション】(問合せID:OIN0118709)iPhoneが利用できない',
+]
+TOPICS = ['EPOCHコラボについて', '請求書の再発行', 'アカウント停止の解除', '社用スマホの返却']
+
+# .eml中Date头的写法（与汇总表中的时间对应）: 各种时区偏移、GMT、没有星期、折行、
+# 只在正文中有时间（旧邮件客户端），以及完全没有时间（汇总表中为"未找到时间信息"）
+DATE_STYLE_WEIGHTS = {
+    'jst': 40, 'utc': 20, 'offset': 15, 'gmt': 10, 'no_weekday': 5, 'folded': 4, 'body': 5, 'missing': 1,
+}
+OTHER_OFFSETS = [8 * 60, -5 * 60, 330, 345, -210]  # +0800、-0500、+0530、+0545、-0330
+CHARSET_WEIGHTS = {'utf-8': 50, 'iso-2022-jp': 30, 'shift_jis': 20}
+JST = timezone(timedelta(hours=9))
+NOT_FOUND = "未找到时间信息"
+
+SUMMARY_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'summary-version-2.py')
+
+def load_summary_module():
+    """加载summary-version-2.py（文件名含连字符，不能直接import）"""
+    module = sys.modules.get('summary_version_2')
+    if module is None:
+        spec = importlib.util.spec_from_file_location('summary_version_2', SUMMARY_SCRIPT)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules['summary_version_2'] = module
+        spec.loader.exec_module(module)
+    return module
+
+def weighted(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+def new_thread(rng):
+    """随机生成一个线程: 种类、线程ID（或INC/长C编号）、主题和邮件数"""
+    family = weighted(rng, FAMILY_WEIGHTS)
+    thread = {
+        'family': family,
+        'size': weighted(rng, THREAD_SIZE_WEIGHTS),
+        'inc': f"INC{29000000 + rng.randrange(1000000)}",
+        'subject': rng.choice(SUBJECTS),
+    }
+    if family in ('A', 'B', 'C'):
+        # 少数线程ID为4位数字（如B8891）
+        digits = 4 if rng.random() < 0.02 else 3
+        thread['thread_id'] = f"{family}{rng.randrange(1, 10 ** digits):0{digits}d}"
+    elif family == '长C':
+        thread['thread_id'] = f"C{29000000 + rng.randrange(1000000)}"
+    elif family == '其他':
+        thread['thread_id'] = f"[col:{rng.randrange(10000, 100000)}]"
+        thread['subject'] = f"お問合せ「{rng.choice(TOPICS)}」"
+    return thread
+
+def make_filename(rng, thread, k, search_number):
+    """线程中第k封邮件的文件名（不含.eml）和是否带搜索ID"""
+    parts = []
+    if k > 0:
+        parts.append(rng.choice(REPLY_MARKERS) if rng.random() < REPLY_RATE else rng.choice(FOLLOW_UP_MARKERS))
+    
+    family = thread['family']
+    if family in ('A', 'B', 'C'):
+        if k > 0 and rng.random() < 0.6:
+            parts.append(f"【{thread['inc']}】 ")
+        if rng.random() < 0.05:
+            parts.append('【MDM移行】')
+        if search_number > FIRST_SEARCH_NUMBER and rng.random() < 0.05:
+            # 引用了之前的搜索ID
+            parts.append(f"[mdmswitch_help:{rng.randrange(FIRST_SEARCH_NUMBER, search_number):05d}] ")
+        parts.append(f"【Intune切り替え】問い合わせが入りました_{thread['thread_id']}")
+    elif family == 'INC':
+        parts.append(f"【{thread['inc']}】 {thread['subject']}")
+    elif family == '长C':
+        parts.append(f"【{thread['thread_id']}】 {thread['subject']}")
+    else:
+        parts.append(f"{thread['thread_id']} Re:  {thread['subject']}")
+    return ''.join(parts)
+
+def iter_messages(n, seed=0, start=START_TIME):
+    """按时间顺序生成n封邮件的 (文件名, 日本时间, Date写法)
+    
+    新线程按泊松过程到达，线程内的后续邮件放在堆中按时间取出，内存只与进行中的线程数有关；
+    搜索ID按时间顺序编号，约0.5%的邮件没有搜索ID
+    """
+    rng = random.Random(seed)
+    mean_size = sum(k * w for k, w in THREAD_SIZE_WEIGHTS.items()) / sum(THREAD_SIZE_WEIGHTS.values())
+    thread_gap = 86400 * mean_size / MESSAGES_PER_DAY
+    
+    pending = []  # (时间, 序号, 线程, 线程中的第几封)
+    order = 0
+    next_thread = start
+    search_number = FIRST_SEARCH_NUMBER
+    used_plain = set()  # 没有搜索ID的文件名可能重复，重复时加 (2)、(3)
+    
+    for _ in range(n):
+        # 新线程先于所有待发送的后续邮件到达时，先加入新线程
+        while not pending or next_thread <= pending[0][0]:
+            heapq.heappush(pending, (next_thread, order, new_thread(rng), 0))
+            order += 1
+            next_thread += timedelta(seconds=int(rng.expovariate(1 / thread_gap)))
+        
+        time_val, _, thread, k = heapq.heappop(pending)
+        name = make_filename(rng, thread, k, search_number)
+        if rng.random() < 0.995:
+            name = f"[mdmswitch_help:{search_number:05d}] {name}"
+            search_number += 1
+        elif name in used_plain:
+            suffix = 2
+            while f"{name} ({suffix})" in used_plain:
+                suffix += 1
+            name = f"{name} ({suffix})"
+        if not name.startswith('[mdmswitch_help:'):
+            used_plain.add(name)
+        
+        if k + 1 < thread['size']:
+            gap = 0 if rng.random() < SAME_SECOND_RATE else int(rng.expovariate(1 / (REPLY_GAP_HOURS * 3600))) + 1
+            heapq.heappush(pending, (time_val + timedelta(seconds=gap), order, thread, k + 1))
+            order += 1
+        
+        yield name + '.eml', time_val, weighted(rng, DATE_STYLE_WEIGHTS)
+
+def iter_summary_rows(n, seed=0):
+    """汇总表的行 [文件名, 日本时间]，与扫描.eml文件夹的结果相同"""
+    for filename, time_val, style in iter_messages(n, seed):
+        time_str = NOT_FOUND if style == 'missing' else time_val.strftime('%Y-%m-%d %H:%M:%S')
+        yield [filename, time_str]
+
+def write_workbook(path, n, seed=0, output_format=None):
+    """生成汇总表（.xlsx / .csv / .parquet，与summary-version-2.py的输出格式相同），按批写入"""
+    summary = load_summary_module()
+    writer = summary.ResultWriter(path, output_format)
+    batch = []
+    for row in iter_summary_rows(n, seed):
+        batch.append(row)
+        if len(batch) >= summary.write_batch_size:
+            writer.write(batch)
+            batch = []
+    writer.write(batch)
+    writer.close()
+    return writer.rows_written
+
+def safe_filename(name):
+    """Windows上文件名不能含有的字符替换为!（与真实数据中的mdmswitch_help!03851相同）"""
+    if os.name == 'nt':
+        for char in '\\/:*?"<>|':
+            name = name.replace(char, '!')
+    return name
+
+def date_header(rng, time_val, style, newline):
+    """按style写出Date头的值（time_val为日本时间）"""
+    local = time_val.replace(tzinfo=JST)
+    if style == 'jst':
+        return format_datetime(local)
+    if style == 'utc':
+        return format_datetime(local.astimezone(timezone.utc))
+    if style == 'offset':
+        return format_datetime(local.astimezone(timezone(timedelta(minutes=rng.choice(OTHER_OFFSETS)))))
+    if style == 'gmt':
+        return format_datetime(local.astimezone(timezone.utc), usegmt=True)
+    if style == 'no_weekday':
+        return format_datetime(local).split(', ', 1)[1]
+    if style == 'folded':
+        weekday, rest = format_datetime(local).split(' ', 1)
+        return f"{weekday}{newline}\t{rest}"
+    return None
+
+def make_eml(filename, time_val, style, seed):
+    """生成一封.eml的字节: 编码各不相同（UTF-8/ISO-2022-JP/Shift_JIS，Base64/QP/8bit），换行为CRLF或LF"""
+    rng = random.Random(seed)
+    charset = weighted(rng, CHARSET_WEIGHTS)
+    subject = filename[:-len('.eml')]
+    newline = '\r\n' if rng.random() < 0.7 else '\n'
+    date_value = date_header(rng, time_val, style, newline)
+    
+    body_lines = ['お世話になっております。', '', subject, '']
+    if style == 'body':
+        # 旧邮件客户端: 邮件头没有Date，转发的正文中有发送时间
+        body_lines.append(f"送信日時: {time_val.strftime('%Y-%m-%d %H:%M:%S')}")
+    body_lines += ['ご確認のほどよろしくお願いいたします。'] * rng.randint(1, 20)
+    body = '\n'.join(body_lines)
+    
+    if charset == 'iso-2022-jp':
+        transfer = '7bit'
+    elif style == 'body':
+        transfer = '8bit'  # 正文中的时间需要不解码也能找到
+    else:
+        transfer = rng.choice(['base64', '8bit'])
+    body_bytes = body.encode(charset, errors='replace')
+    if transfer == 'base64':
+        body_bytes = base64.encodebytes(body_bytes)
+    
+    headers = [
+        f"Received: from mail.example.co.jp by mx.example.co.jp; {format_datetime(time_val.replace(tzinfo=JST) + timedelta(seconds=1))}",
+        f"From: support{rng.randrange(100)}@example.co.jp",
+        "To: mdmswitch_help@example.co.jp",
+        f"Subject: {Header(subject, charset).encode(linesep=newline)}",
+        f"Message-ID: <{rng.getrandbits(64):016x}@example.co.jp>",
+    ]
+    if date_value is not None:
+        headers.append(f"Date: {date_value}")
+    headers += [
+        "MIME-Version: 1.0",
+        f'Content-Type: text/plain; charset="{charset}"',
+        f"Content-Transfer-Encoding: {transfer}",
+    ]
+    header_bytes = newline.join(headers).encode('ascii')
+    body_bytes = body_bytes.replace(b'\r\n', b'\n').replace(b'\n', newline.encode('ascii'))
+    return header_bytes + (newline * 2).encode('ascii') + body_bytes
+
+def write_eml_folder(folder, n, seed=0):
+    """生成.eml文件夹（与真实数据相同，所有文件在同一个文件夹中），返回写入的文件数"""
+    os.makedirs(folder, exist_ok=True)
+    count = 0
+    for i, (filename, time_val, style) in enumerate(iter_messages(n, seed)):
+        with open(os.path.join(folder, safe_filename(filename)), 'wb') as f:
+            f.write(make_eml(filename, time_val, style, seed * 1000003 + i))
+        count += 1
+    return count
+
+def main():
+    if len(sys.argv) < 4 or sys.argv[1] not in ('workbook', 'eml'):
+        print("用法: python synthetic-data.py workbook <输出文件.xlsx|.csv|.parquet> <邮件数> [种子]")
+        print("      python synthetic-data.py eml <文件夹> <邮件数> [种子]")
+        return 1
+    kind, path, n = sys.argv[1], sys.argv[2], int(sys.argv[3])
+    seed = int(sys.argv[4]) if len(sys.argv) > 4 else 0
+    
+    if kind == 'workbook':
+        count = write_workbook(path, n, seed)
+    else:
+        count = write_eml_folder(path, n, seed)
+    print(f"已生成 {count} 封邮件: {path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
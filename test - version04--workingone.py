@@ -1,49 +1,2031 @@
 import pandas as pd
+import numpy as np
 import re
+import json
+import heapq
+import bisect
+import itertools
 import os
 import sys
-from datetime import datetime, timedelta
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
 from collections import defaultdict
+from collections.abc import Mapping, Sequence
+from functools import lru_cache, wraps
+import importlib.util
+import argparse
+import contextlib
+import cProfile
+import io
+import time
+import errno
+import shutil
+import tempfile
 import warnings
 warnings.filterwarnings('ignore')
 
+# 索引快照: 数据文件未改变时直接加载已建立的索引，不再读取Excel和重新处理
+use_snapshot = True
+SNAPSHOT_VERSION = 4  # 索引结构或解析规则改变时加1，旧快照自动失效
+
+# 读取数据文件时只加载文件名列和时间列；True时读取全部列（原始数据中保留所有列）
+load_all_columns = False
+
+# 流式读取: 数据文件超过该大小时按块读取并逐块建立索引，不保留整个DataFrame
+stream_threshold = 200 * 1024 * 1024
+STREAM_CHUNK_SIZE = 50000  # 每块的行数
+
+# SQLite后端: 索引保存在数据文件旁边的SQLite数据库中，查询直接执行带索引的SQL，
+# 启动时不读取数据文件，内存占用不随数据量增长；数据库为WAL模式，多个进程可以同时查询
+use_sqlite = False
+SQLITE_VERSION = 1  # 表结构或解析规则改变时加1，旧数据库自动重建
+
+# 命令行批量查询: 成功比例低于该值时退出码为1（可以用--min-success指定）
+BATCH_MIN_SUCCESS = 0.9
+
+# 保存查询结果的格式（'xlsx' / 'csv' / 'parquet'）和依次尝试的保存位置；
+# 结果只写入一次临时文件，再移动（不同磁盘时复制）到第一个可以写入的位置
+save_format = 'xlsx'
+SAVE_LOCATIONS = [
+    os.path.join(os.path.expanduser("~"), "Desktop"),  # 桌面
+    os.path.join(os.path.expanduser("~"), "Downloads"),  # 下载文件夹
+    os.path.dirname(os.path.abspath(__file__)),  # 脚本所在目录
+    "C:\\Temp",  # 临时文件夹
+    ".",  # 当前目录
+]
+
+# 回复时间统计（response_stats）: 显示"N小时内回复比例"的N
+SLA_HOURS = [1, 4, 24]
+THREAD_FAMILIES = ['A', 'B', 'C', 'INC', '长C', '其他']  # 统计中线程类型的顺序
+
+# 运行统计: quiet为True时分析器不显示处理过程（错误仍然显示）；
+# metrics_file设置时程序结束后写入各阶段耗时和计数（.json为JSON，其他为Prometheus文本格式）；
+# profile_file设置时用cProfile记录本次运行，结束后写入该文件（可以用pstats查看）
+quiet = False
+metrics_file = None
+profile_file = None
+
+SUMMARY_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'summary-version-2.py')
+
+def load_summary_module():
+    """加载summary-version-2.py（文件名含连字符，不能直接import）"""
+    module = sys.modules.get('summary_version_2')
+    if module is None:
+        spec = importlib.util.spec_from_file_location('summary_version_2', SUMMARY_SCRIPT)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules['summary_version_2'] = module
+        spec.loader.exec_module(module)
+    return module
+
+class Metrics:
+    """运行统计: 各阶段的累计耗时、计数器和查询延迟直方图，可以导出为JSON或Prometheus文本格式
+    
+    阶段: load（读取数据文件/快照/数据库）、parse（解析时间）、classify（从文件名提取ID）、
+    index（建立记录、线程时间线和搜索ID索引）、query（查询）
+    """
+    
+    PREFIX = 'email_analyzer'
+    LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+    COUNTER_HELP = {
+        'rows_empty_filename': '文件名为空而跳过的行数',
+        'rows_unparsable_time': '时间不能解析而跳过的行数',
+        'records_unknown_thread': '线程ID为"未知"的记录数',
+        'queries': '查询的搜索ID数',
+        'fuzzy_fallbacks': '搜索ID不存在、改用模糊匹配的查询数',
+        'search_id_not_found': '模糊匹配也没有找到的查询数',
+    }
+    
+    def __init__(self):
+        # 查询服务在线程池中执行批量查询和重新加载，更新和读取统计时加锁，避免丢失计数
+        self.lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        with self.lock:
+            self.stage_seconds = defaultdict(float)
+            self.stage_calls = defaultdict(int)
+            self.counters = dict.fromkeys(self.COUNTER_HELP, 0)
+            self.latency_counts = [0] * (len(self.LATENCY_BUCKETS) + 1)  # 最后一个为+Inf
+            self.latency_sum = 0.0
+    
+    def add_time(self, stage, seconds):
+        with self.lock:
+            self.stage_seconds[stage] += seconds
+            self.stage_calls[stage] += 1
+    
+    @contextlib.contextmanager
+    def timer(self, stage):
+        """记录with中的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+    
+    def timed(self, stage, latency=False):
+        """装饰器: 记录函数的耗时（latency=True时同时记入查询延迟直方图）"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    elapsed = time.perf_counter() - start
+                    self.add_time(stage, elapsed)
+                    if latency:
+                        self.observe(elapsed)
+            return wrapper
+        return decorator
+    
+    def timed_iter(self, stage, iterable):
+        """逐个产生iterable的元素，取元素的耗时记入stage（如按块读取文件）"""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.add_time(stage, time.perf_counter() - start)
+            yield item
+    
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + int(n)
+    
+    def observe(self, seconds):
+        """记录一次查询的延迟"""
+        with self.lock:
+            self.latency_counts[bisect.bisect_left(self.LATENCY_BUCKETS, seconds)] += 1
+            self.latency_sum += seconds
+    
+    def latency_buckets(self):
+        """(上限, 累计次数)的列表，与Prometheus直方图的le相同"""
+        bounds = [str(bound) for bound in self.LATENCY_BUCKETS] + ['+Inf']
+        return list(zip(bounds, itertools.accumulate(self.latency_counts)))
+    
+    def to_dict(self):
+        with self.lock:
+            return {
+                'stages': {stage: {'seconds': round(seconds, 6), 'calls': self.stage_calls[stage]}
+                           for stage, seconds in self.stage_seconds.items()},
+                'counters': dict(self.counters),
+                'query_latency': {
+                    'count': sum(self.latency_counts),
+                    'sum': round(self.latency_sum, 6),
+                    'buckets': dict(self.latency_buckets()),
+                },
+            }
+    
+    def to_prometheus(self):
+        """Prometheus文本格式（可以由node_exporter的textfile collector读取）"""
+        with self.lock:
+            return self.format_prometheus()
+    
+    def format_prometheus(self):
+        p = self.PREFIX
+        lines = [f'# HELP {p}_stage_seconds_total 各阶段的累计耗时（秒）',
+                 f'# TYPE {p}_stage_seconds_total counter']
+        lines += [f'{p}_stage_seconds_total{{stage="{stage}"}} {seconds:.6f}'
+                  for stage, seconds in self.stage_seconds.items()]
+        lines += [f'# HELP {p}_stage_calls_total 各阶段的执行次数',
+                  f'# TYPE {p}_stage_calls_total counter']
+        lines += [f'{p}_stage_calls_total{{stage="{stage}"}} {calls}' for stage, calls in self.stage_calls.items()]
+        for name, value in self.counters.items():
+            lines += [f'# HELP {p}_{name}_total {self.COUNTER_HELP.get(name, name)}',
+                      f'# TYPE {p}_{name}_total counter',
+                      f'{p}_{name}_total {value}']
+        lines += [f'# HELP {p}_query_latency_seconds 单个查询的延迟（秒）',
+                  f'# TYPE {p}_query_latency_seconds histogram']
+        lines += [f'{p}_query_latency_seconds_bucket{{le="{bound}"}} {count}' for bound, count in self.latency_buckets()]
+        lines += [f'{p}_query_latency_seconds_sum {self.latency_sum:.6f}',
+                  f'{p}_query_latency_seconds_count {sum(self.latency_counts)}']
+        return '\n'.join(lines) + '\n'
+    
+    def write(self, path):
+        """写入文件: .json为JSON，其他为Prometheus文本格式（先写临时文件再替换）"""
+        if path.lower().endswith('.json'):
+            text = json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
+        else:
+            text = self.to_prometheus()
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(path + '.tmp', path)
+
+# 整个进程共用的运行统计
+metrics = Metrics()
+
+@contextlib.contextmanager
+def profiled(path):
+    """用cProfile记录with中的运行，结束后把统计写入path（path为空时不记录）"""
+    if not path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        print(f"性能分析结果已保存: {path}", file=sys.stderr)
+
+# 文件名中各种ID的匹配规则（按顺序尝试，第一个匹配的生效）
+EMAIL_ID_PATTERNS = [
+    r'\[.*?:(\d{5})\]',
+    r'_(\d{5})\.eml',
+    r'(\d{5})\.eml',
+    r'\[INC(\d{8})\]',  # 8位INC编号
+    r'INC(\d{8})',
+    r'(\d{5})_',
+    r'_(\d{5})_',
+]
+
+# 长C编号（如C29497931），不是真正的C格式线程ID
+LONG_C_PATTERN = r'[^a-zA-Z](C\d{8,})[^a-zA-Z]'
+
+THREAD_ID_PATTERNS = [
+    # 真正的Cxxx格式 - 需要确保是短格式且后面有合适的上下文
+    r'[^a-zA-Z](C\d{3})[^\.a-zA-Z]',  # C088后面不是点或字母
+    r'_C(\d{3})\.eml',  # _C088.eml
+    r'問い合わせが入りました_C(\d{3})\.eml',  # 問い合わせが入りました_C088.eml
+    r'【Intune切り替え】問い合わせが入りました_C(\d{3})\.eml',
+    
+    # Axxx格式
+    r'[^a-zA-Z](A\d{3})[^\.a-zA-Z]',
+    r'_A(\d{3})\.eml',
+    
+    # Bxxx格式
+    r'[^a-zA-Z](B\d{3})[^\.a-zA-Z]',
+    r'_B(\d{3})\.eml',
+    
+    # 通用短格式（3-4位数字）
+    r'[^a-zA-Z]([A-Z]\d{3})[^\.a-zA-Z\d]',  # 字母+3位数字，后面不是点、字母或数字
+    r'_([A-Z]\d{3})\.eml',  # _A553.eml格式
+    
+    # 最后尝试宽松匹配
+    r'([A-Z]\d{3})(?![a-zA-Z\d])',  # 字母+3位数字，后面不是字母或数字
+]
+
+INC_PATTERNS = [
+    r'\[INC(\d+)\]',
+    r'INC(\d+)',
+    r'【INC(\d+)】',
+]
+
+SEARCH_ID_PATTERNS = [
+    r'\[(mdmswitch_help:\d+)\]',
+    r'\[(\w+:\d+)\]',
+    r'(\w+:\d+)',
+]
+
+REPLY_INDICATORS = ['Re:', '返信', 'RE:', 're:', '回复', '答复']
+
+# 编译后的规则，供classify_filename使用
+EMAIL_ID_REGEXES = [re.compile(pattern) for pattern in EMAIL_ID_PATTERNS]
+LONG_C_REGEX = re.compile(LONG_C_PATTERN)
+# 只捕获数字的规则（如 _C(\d{3})\.eml）得到的结果不可能通过is_short_thread_id检查，
+# 编译版本中省略，结果不变；其余规则保留re.IGNORECASE（_c088.eml 这样的小写也要识别）
+THREAD_ID_REGEXES = [re.compile(pattern, re.IGNORECASE) for pattern in THREAD_ID_PATTERNS
+                     if '(\\d' not in pattern]
+INC_REGEXES = [re.compile(pattern) for pattern in INC_PATTERNS]
+SEARCH_ID_REGEXES = [re.compile(pattern) for pattern in SEARCH_ID_PATTERNS]
+# 线程ID未知时从文件名中找关联线程的规则
+FALLBACK_THREAD_PATTERNS = [
+    r'[^a-zA-Z]([A-Z]\d{3})[^\.a-zA-Z]',
+    r'_([A-Z]\d{3})\.eml',
+]
+FALLBACK_THREAD_REGEXES = [re.compile(p, re.IGNORECASE) for p in FALLBACK_THREAD_PATTERNS]
+CLASSIFY_CACHE_SIZE = 1 << 18  # 缓存的不同文件名数量
+
+# 逐个尝试的时间格式（通用解析失败时）
+TIME_FORMATS = ['%Y-%m-%d %H:%M:%S', '%Y/%m/%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y/%m/%d %H:%M']
+
+def is_short_thread_id(thread_id):
+    """是否是真正的短格式线程ID: A/B/C + 3位数字"""
+    return (thread_id.startswith(('A', 'B', 'C')) and
+            len(thread_id) == 4 and
+            thread_id[1:].isdigit())
+
+def first_group(regexes, text):
+    """依次尝试regexes，返回第一个匹配的分组"""
+    for regex in regexes:
+        match = regex.search(text)
+        if match:
+            return match.group(1)
+    return None
+
+@lru_cache(maxsize=CLASSIFY_CACHE_SIZE)
+def classify_filename(filename_str):
+    """一次性提取 (邮件ID, 线程ID, 搜索ID, 是否回复)
+    
+    规则和优先顺序与extract_email_id / extract_thread_id / extract_search_id / is_reply相同，
+    回复和转发的文件名大量重复，结果按文件名缓存
+    """
+    if filename_str == 'nan':
+        return None, "未知", None, False
+    
+    email_id = first_group(EMAIL_ID_REGEXES, filename_str)
+    search_id = first_group(SEARCH_ID_REGEXES, filename_str)
+    reply_flag = any(indicator in filename_str for indicator in REPLY_INDICATORS)
+    
+    # 长C编号（如C29497931）不是真正的C格式线程ID
+    if LONG_C_REGEX.search(filename_str):
+        return email_id, "未知", search_id, reply_flag
+    
+    for regex in THREAD_ID_REGEXES:
+        match = regex.search(filename_str)
+        if match:
+            thread_id = match.group(1).upper()
+            if is_short_thread_id(thread_id):
+                return email_id, thread_id, search_id, reply_flag
+    
+    for regex in INC_REGEXES:
+        match = regex.search(filename_str)
+        if match and len(match.group(1)) >= 5:
+            return email_id, f"INC{match.group(1)}", search_id, reply_flag
+    
+    return email_id, "未知", search_id, reply_flag
+
+def thread_family(thread_id, filename=None):
+    """线程类型: A/B/C（短格式线程ID）、INC、长C（线程ID未知且文件名中有C29497931这样的编号）、其他"""
+    if is_short_thread_id(thread_id):
+        return thread_id[0]
+    if thread_id.startswith('INC'):
+        return 'INC'
+    if filename is not None and LONG_C_REGEX.search(filename):
+        return '长C'
+    return '其他'
+
+def parse_time_value(value):
+    """解析单个时间值，依次尝试通用解析和TIME_FORMATS，失败时返回None"""
+    try:
+        time_val = pd.to_datetime(value)
+    except:
+        time_val = None
+        for fmt in TIME_FORMATS:
+            try:
+                time_val = pd.to_datetime(value, format=fmt)
+                break
+            except:
+                continue
+    
+    # 空字符串等会被解析为NaT，视为无效
+    if time_val is None or pd.isna(time_val):
+        return None
+    return time_val
+
+def parse_time_column(column):
+    """整列解析时间: 先按TIME_FORMATS批量解析，剩下的少量值再逐个解析
+    
+    返回object类型的Series，无法解析的为None
+    """
+    result = pd.Series(None, index=column.index, dtype=object)
+    
+    if pd.api.types.is_datetime64_any_dtype(column):
+        valid = column.notna()
+        result[valid] = column[valid].astype(object)
+        return result
+    
+    pending = column[column.notna()].astype(object)
+    for fmt in TIME_FORMATS:
+        if pending.empty:
+            break
+        parsed = pd.to_datetime(pending, format=fmt, errors='coerce')
+        parsed = parsed[parsed.notna()]
+        result[parsed.index] = parsed.astype(object)
+        pending = pending.drop(parsed.index)
+    
+    for idx, value in pending.items():
+        result[idx] = parse_time_value(value)
+    
+    return result
+
+class GrowableArray:
+    """可以在末尾追加的numpy数组: 容量不够时按倍数扩大，追加k个元素的均摊开销为O(k)
+    
+    values为已使用部分的视图；第一次追加时才复制原数组
+    """
+    
+    def __init__(self, values):
+        self.buffer = values
+        self.size = len(values)
+    
+    @property
+    def values(self):
+        return self.buffer[:self.size]
+    
+    def extend(self, values):
+        """追加values，返回追加后的values"""
+        end = self.size + len(values)
+        if end > len(self.buffer):
+            buffer = np.empty(max(end, 2 * len(self.buffer), 16), dtype=self.buffer.dtype)
+            buffer[:self.size] = self.buffer[:self.size]
+            self.buffer = buffer
+        self.buffer[self.size:end] = values
+        self.size = end
+        return self.values
+
+class StringColumn(Sequence):
+    """连续保存的UTF-8字符串列: 一个bytes加int64偏移，比Python字符串列表省内存"""
+    
+    def __init__(self, data=b'', offsets=None):
+        self.data = data
+        self.offsets = offsets if offsets is not None else np.zeros(1, dtype=np.int64)
+        self.offset_buffer = None  # 追加过字符串时的偏移缓冲区
+    
+    @classmethod
+    def from_bytes(cls, parts):
+        offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+        np.cumsum([len(part) for part in parts], out=offsets[1:])
+        return cls(b''.join(parts), offsets)
+    
+    @classmethod
+    def from_strings(cls, strings):
+        return cls.from_bytes([string.encode('utf-8') for string in strings])
+    
+    @classmethod
+    def concat(cls, columns):
+        """按顺序连接多个StringColumn"""
+        columns = list(columns)
+        if not columns:
+            return cls()
+        starts = np.cumsum([0] + [len(column.data) for column in columns[:-1]])
+        offsets = np.concatenate([columns[0].offsets[:1]] + [
+            column.offsets[1:] + start for column, start in zip(columns, starts)])
+        return cls(b''.join(column.data for column in columns), offsets)
+    
+    def extend(self, other):
+        """在末尾追加另一个StringColumn（data改为bytearray原地追加，不复制已有的字符串）"""
+        if not isinstance(self.data, bytearray):
+            self.data = bytearray(self.data)
+        if self.offset_buffer is None:
+            self.offset_buffer = GrowableArray(self.offsets)
+        self.offsets = self.offset_buffer.extend(other.offsets[1:] - other.offsets[0] + len(self.data))
+        self.data += other.data
+    
+    def __getitem__(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]].decode('utf-8')
+    
+    def __len__(self):
+        return len(self.offsets) - 1
+    
+    @property
+    def nbytes(self):
+        return len(self.data) + self.offsets.nbytes
+
+class CodeTable:
+    """按首次出现的顺序给值编号（跨块保持一致，结果与对整列pd.factorize相同）
+    
+    base为已有的值（pd.Index）时，已有的值沿用原编号，新值接在后面编号
+    """
+    
+    def __init__(self, base=None):
+        self.base = base if base is not None else pd.Index([], dtype=object)
+        self.codes = {}
+    
+    def encode(self, values):
+        """返回values的编码数组，None为-1"""
+        codes, uniques = pd.factorize(np.array(values, dtype=object))
+        if not len(uniques):
+            return np.full(len(codes), -1, dtype=np.int32)
+        if len(self.base):
+            mapping = self.base.get_indexer(uniques)
+        else:
+            mapping = np.full(len(uniques), -1, dtype=np.int64)
+        for i in np.flatnonzero(mapping < 0):
+            mapping[i] = len(self.base) + self.codes.setdefault(uniques[i], len(self.codes))
+        return np.where(codes >= 0, mapping[codes], -1).astype(np.int32)
+    
+    def new_values(self):
+        """base中没有的值（按编号顺序）"""
+        return np.array(list(self.codes), dtype=object)
+    
+    def values(self):
+        """全部的值（已有的值在前）"""
+        return np.concatenate([np.asarray(self.base.values, dtype=object), self.new_values()])
+
+class IndexBuilder:
+    """逐块解析数据并累积紧凑的列（行位置、时间、线程/搜索ID编码、是否回复），最后一次建立记录和索引
+    
+    keep_names=True 时同时保存文件名（流式读取时不保留DataFrame）；这时文件名基本不重复，
+    提取ID不使用缓存，避免缓存保留大量文件名
+    """
+    
+    def __init__(self, keep_names=False, thread_ids=None, search_ids=None):
+        self.keep_names = keep_names
+        self.threads = CodeTable(thread_ids)
+        self.searches = CodeTable(search_ids)
+        self.tz = None
+        self.has_times = False
+        self.parts = defaultdict(list)
+    
+    def add(self, chunk, filename_col, time_col):
+        """解析一块数据，chunk的索引为源数据中的行位置"""
+        # 文件名: 跳过空值和空字符串
+        raw_names = chunk[filename_col]
+        names = raw_names.astype(object).where(raw_names.notna())
+        names = names[names.notna()].map(str).str.strip()
+        names = names[names != '']
+        metrics.count('rows_empty_filename', len(chunk) - len(names))
+        
+        # 时间: 整列解析，解析失败的行跳过
+        with metrics.timer('parse'):
+            times = parse_time_column(chunk[time_col]).reindex(names.index)
+        valid = times.notna()
+        metrics.count('rows_unparsable_time', len(valid) - int(valid.sum()))
+        names = names[valid]
+        times = times[valid]
+        if names.empty:
+            return
+        
+        # 提取各种ID（按文件名缓存，重复的文件名只解析一次）
+        name_list = names.tolist()
+        classify = classify_filename.__wrapped__ if self.keep_names else classify_filename
+        with metrics.timer('classify'):
+            fields = [classify(filename_str) for filename_str in name_list]
+        metrics.count('records_unknown_thread', sum(1 for f in fields if f[1] == "未知"))
+        
+        time_index = pd.DatetimeIndex(times.tolist())
+        if self.has_times and time_index.tz != self.tz:
+            raise ValueError(f"时间列的时区不一致: {self.tz} / {time_index.tz}")
+        self.tz = time_index.tz
+        self.has_times = True
+        
+        # 线程ID和搜索ID编码为整数，编号按首次出现的顺序；"未知"/None编码为-1
+        parts = self.parts
+        parts['rows'].append(np.asarray(names.index, dtype=np.int64))
+        parts['times'].append(to_ns(time_index))
+        parts['thread_codes'].append(self.threads.encode([None if f[1] == "未知" else f[1] for f in fields]))
+        parts['search_codes'].append(self.searches.encode([f[2] for f in fields]))
+        parts['reply'].append(np.array([f[3] for f in fields], dtype=bool))
+        if self.keep_names:
+            parts['names'].append(StringColumn.from_strings(name_list))
+    
+    def column(self, name, dtype):
+        parts = self.parts[name]
+        return np.concatenate(parts) if parts else np.array([], dtype=dtype)
+    
+    def collect(self):
+        """取出累积的各列（按读取顺序）；线程ID、搜索ID在self.threads、self.searches中"""
+        columns = {
+            'rows': self.column('rows', np.int64),
+            'times': self.column('times', np.int64),
+            'thread_codes': self.column('thread_codes', np.int32),
+            'search_codes': self.column('search_codes', np.int32),
+            'reply': self.column('reply', bool),
+            'names': StringColumn.concat(self.parts['names']) if self.keep_names else None,
+        }
+        self.parts = defaultdict(list)
+        return columns
+    
+    @metrics.timed('index')
+    def build(self, df, filename_col, time_col):
+        """建立按时间排序的记录、线程索引和搜索ID索引"""
+        columns = self.collect()
+        rows = columns['rows']
+        times_ns = columns['times']
+        thread_codes = columns['thread_codes']
+        search_codes = columns['search_codes']
+        reply = columns['reply']
+        thread_ids = self.threads.values()
+        search_ids = self.searches.values()
+        
+        # 所有记录按时间排序（稳定排序，同一时间保持原始顺序）
+        order = np.argsort(times_ns, kind='stable')
+        store_pos = np.empty(len(order), dtype=np.int64)
+        store_pos[order] = np.arange(len(order))
+        
+        # 文件名保持读取顺序，记录位置通过order对应（不复制字符串）
+        names = columns['names']
+        
+        store = EmailRecordStore(
+            df, filename_col,
+            rows=rows[order],
+            times=times_ns[order],
+            tz=self.tz,
+            thread_codes=thread_codes[order],
+            thread_ids=thread_ids,
+            search_codes=search_codes[order],
+            search_ids=search_ids,
+            reply=reply[order],
+            names=names,
+            name_index=order if self.keep_names else None,
+            time_col=time_col,
+        )
+        
+        # 按线程ID分组: 每个线程的记录按原始行顺序
+        in_thread = np.flatnonzero(thread_codes >= 0)
+        grouped = in_thread[np.argsort(thread_codes[in_thread], kind='stable')]
+        counts = np.bincount(thread_codes[in_thread], minlength=len(thread_ids))
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        thread_index = ThreadIndex(store, thread_ids, store_pos[grouped], offsets)
+        
+        # 按搜索ID索引: 同一搜索ID保留最后一条（与逐行覆盖的结果相同）
+        has_search = np.flatnonzero(search_codes >= 0)
+        last_rows = np.full(len(search_ids), -1, dtype=np.int64)
+        np.maximum.at(last_rows, search_codes[has_search], has_search)
+        search_index = SearchIndex(store, search_ids, store_pos[last_rows])
+        return store, thread_index, search_index
+
+class EmailRecord(Mapping):
+    """邮件记录的只读视图，可以像原来的dict一样按键读取字段"""
+    
+    __slots__ = ('store', 'pos')
+    
+    def __init__(self, store, pos):
+        self.store = store
+        self.pos = pos
+    
+    def __getitem__(self, key):
+        return self.store.get_field(self.pos, key)
+    
+    def __iter__(self):
+        return iter(EmailRecordStore.FIELDS)
+    
+    def __len__(self):
+        return len(EmailRecordStore.FIELDS)
+    
+    def __repr__(self):
+        return f"EmailRecord({dict(self)!r})"
+
+class EmailRecordStore(Sequence):
+    """按列保存的邮件记录（按时间排序），代替每封邮件一个dict
+    
+    时间保存为int64纳秒，线程ID和搜索ID保存为分类编码（-1表示没有），
+    文件名和原始数据不复制，只保存在源DataFrame中的行位置；
+    流式读取时没有DataFrame，文件名保存在StringColumn中（与记录顺序相同）
+    
+    add_emails追加的记录接在数组末尾（记录位置不变），追加的源数据保存为单独的数据块；
+    追加后数组不一定按时间存放，按下标访问时用time_order()得到按时间的顺序
+    """
+    
+    FIELDS = ('原始行号', '文件名', '时间', '邮件ID', '线程ID', '搜索ID', '是回复', '原始数据')
+    
+    def __init__(self, df, filename_col, rows, times, tz, thread_codes, thread_ids,
+                 search_codes, search_ids, reply, names=None, name_index=None, time_col=None):
+        self.df = df
+        self.filename_col = filename_col
+        self.time_col = time_col
+        self.filename_pos = df.columns.get_loc(filename_col) if df is not None else None
+        self.names = names
+        self.name_index = name_index  # 第pos条记录的文件名为 names[name_index[pos]]
+        self.rows = rows  # 源数据中的行位置
+        self.times = times  # int64纳秒
+        self.tz = tz
+        self.thread_codes = thread_codes
+        self.thread_ids = thread_ids  # 编码对应的线程ID
+        self.search_codes = search_codes
+        self.search_ids = search_ids  # 编码对应的搜索ID
+        self.reply = reply
+        self.frames = []  # add_emails追加的源数据块 [(起始行位置, DataFrame)]，列与df相同
+        self.row_count = len(df) if df is not None else (int(rows.max()) + 1 if len(rows) else 0)
+        self.buffers = {}  # 追加过记录的数组的GrowableArray
+        self.in_time_order = True  # 数组是否按时间（稳定）排序存放
+        self.order = None  # 不按时间存放时，按时间排序的记录位置（需要时计算）
+    
+    def __len__(self):
+        return len(self.rows)
+    
+    def __getitem__(self, pos):
+        order = self.time_order()
+        if isinstance(pos, slice):
+            positions = range(*pos.indices(len(self)))
+            return [EmailRecord(self, i if order is None else int(order[i])) for i in positions]
+        if pos < 0:
+            pos += len(self)
+        if not 0 <= pos < len(self):
+            raise IndexError(pos)
+        return EmailRecord(self, pos if order is None else int(order[pos]))
+    
+    def time_order(self):
+        """按时间排序的记录位置；数组已按时间存放时为None
+        
+        追加的记录位置在已有记录之后、并按行顺序，稳定排序后同一时间的记录仍按原始行顺序
+        """
+        if self.in_time_order:
+            return None
+        if self.order is None:
+            self.order = np.argsort(self.times, kind='stable')
+        return self.order
+    
+    def append(self, columns, frame=None, source_rows=0):
+        """在数组末尾追加记录（columns为IndexBuilder.collect的各列，按行顺序），已有记录的位置不变
+        
+        frame为追加的源数据块（与df的列相同），source_rows为追加的源数据行数
+        """
+        times = columns['times']
+        if len(times) and self.in_time_order:
+            # 新记录都不早于已有记录且按时间排列时，数组仍按时间存放（通常的实时追加）
+            self.in_time_order = bool((not len(self) or times[0] >= self.times[-1]) and
+                                      np.all(times[1:] >= times[:-1]))
+        self.order = None
+        
+        if self.names is not None:
+            name_index = np.arange(len(self.names), len(self.names) + len(times), dtype=self.name_index.dtype)
+            self.names.extend(columns['names'])
+            columns = dict(columns, name_index=name_index)
+        for name in ('rows', 'times', 'thread_codes', 'search_codes', 'reply') + (
+                ('name_index',) if self.names is not None else ()):
+            buffer = self.buffers.get(name)
+            if buffer is None:
+                buffer = self.buffers[name] = GrowableArray(getattr(self, name))
+            setattr(self, name, buffer.extend(columns[name]))
+        
+        if frame is not None and len(frame):
+            self.frames.append((self.row_count, frame))
+        self.row_count += source_rows
+    
+    def merge_frames(self):
+        """把追加的源数据块合并到df（只在需要整个DataFrame时执行），返回合并后的df"""
+        if self.frames:
+            self.df = pd.concat([self.df] + [frame for _, frame in self.frames], ignore_index=True)
+            self.frames = []
+        return self.df
+    
+    def frame_at(self, row):
+        """源数据行位置所在的数据块和块内位置"""
+        if row < len(self.df) or not self.frames:
+            return self.df, row
+        i = bisect.bisect_right([start for start, _ in self.frames], row) - 1
+        start, frame = self.frames[i]
+        return frame, row - start
+    
+    def timestamp(self, pos):
+        """第pos条记录的时间"""
+        time_val = pd.Timestamp(int(self.times[pos]))
+        if self.tz is not None:
+            time_val = time_val.tz_localize('UTC').tz_convert(self.tz)
+        return time_val
+    
+    def filename(self, pos):
+        """第pos条记录的文件名"""
+        if self.names is not None:
+            return self.names[int(self.name_index[pos])]
+        frame, row = self.frame_at(int(self.rows[pos]))
+        return str(frame.iat[row, self.filename_pos]).strip()
+    
+    def filenames(self, positions):
+        """多条记录的文件名（一次取出文件名列，不逐行访问DataFrame）"""
+        if self.names is not None:
+            return [self.names[i] for i in self.name_index[positions].tolist()]
+        rows = self.rows[positions]
+        if not self.frames:
+            return self.df.iloc[rows, self.filename_pos].astype(str).str.strip().tolist()
+        
+        # 有追加的数据块时按块分组取出
+        names = np.empty(len(rows), dtype=object)
+        starts = np.array([0] + [start for start, _ in self.frames])
+        which = np.searchsorted(starts, rows, side='right') - 1
+        for i in np.unique(which).tolist():
+            selected = np.flatnonzero(which == i)
+            frame = self.df if i == 0 else self.frames[i - 1][1]
+            names[selected] = frame.iloc[rows[selected] - starts[i], self.filename_pos].astype(str).str.strip().to_numpy()
+        return names.tolist()
+    
+    def email_ids(self, positions):
+        """多条记录的邮件ID"""
+        rows = self.rows[positions]
+        ids = [classify_filename(name)[0] for name in self.filenames(positions)]
+        return [email_id if email_id else f"ID_{row}" for email_id, row in zip(ids, rows.tolist())]
+    
+    def get_field(self, pos, key):
+        """按原来dict的键读取第pos条记录的字段"""
+        row = int(self.rows[pos])
+        if key == '时间':
+            return self.timestamp(pos)
+        if key == '文件名':
+            return self.filename(pos)
+        if key == '线程ID':
+            code = self.thread_codes[pos]
+            return self.thread_ids[code] if code >= 0 else "未知"
+        if key == '搜索ID':
+            code = self.search_codes[pos]
+            return self.search_ids[code] if code >= 0 else None
+        if key == '是回复':
+            return bool(self.reply[pos])
+        if key == '邮件ID':
+            email_id = classify_filename(self.filename(pos))[0]
+            return email_id if email_id else f"ID_{row}"
+        if key == '原始行号':
+            return row + 2
+        if key == '原始数据':
+            if self.df is None:
+                # 流式读取时只有文件名列和时间列
+                return {self.filename_col: self.filename(pos), self.time_col: self.timestamp(pos)}
+            frame, frame_row = self.frame_at(row)
+            return frame.iloc[frame_row].to_dict()
+        raise KeyError(key)
+    
+    def memory_usage(self):
+        """数组部分占用的字节数（不含源DataFrame）"""
+        arrays = (self.rows, self.times, self.thread_codes, self.search_codes, self.reply)
+        names = self.names.nbytes + self.name_index.nbytes if self.names is not None else 0
+        return sum(array.nbytes for array in arrays) + names
+
+class IdIndex(Sequence):
+    """编码 -> ID的数组和ID -> 编码的dict（代替pd.Index），追加新ID时不重建整个哈希表"""
+    
+    def __init__(self, ids):
+        self.buffer = GrowableArray(ids.values if isinstance(ids, (IdIndex, pd.Index)) else np.asarray(ids, dtype=object))
+        self._codes = None
+    
+    @property
+    def values(self):
+        """编码对应的ID（object数组）"""
+        return self.buffer.values
+    
+    @property
+    def codes(self):
+        # 第一次查找时才建立
+        if self._codes is None:
+            self._codes = {value: code for code, value in enumerate(self.values.tolist())}
+        return self._codes
+    
+    def extend(self, ids):
+        """追加新ID（编码接在已有的ID后面）"""
+        if self._codes is not None:
+            self._codes.update((value, code) for code, value in enumerate(ids, start=len(self)))
+        self.buffer.extend(np.asarray(ids, dtype=object))
+    
+    def get_loc(self, key):
+        return self.codes[key]
+    
+    def get_indexer(self, keys):
+        """各个key的编码，不存在时为-1"""
+        codes = self.codes
+        return np.array([codes.get(key, -1) for key in keys], dtype=np.int64)
+    
+    def tolist(self):
+        return self.values.tolist()
+    
+    def __getitem__(self, code):
+        return self.values[code]
+    
+    def __contains__(self, key):
+        return key in self.codes
+    
+    def __iter__(self):
+        return iter(self.values.tolist())
+    
+    def __len__(self):
+        return self.buffer.size
+
+class ThreadIndex(Mapping):
+    """线程ID -> 该线程的邮件列表（按原始行顺序），用排序后的位置数组保存
+    
+    add_emails追加的记录不插入positions（要复制整个数组），保存在各线程自己的GrowableArray中，
+    保存快照或写入数据库前用compact()合并
+    """
+    
+    def __init__(self, store, thread_ids, positions, offsets):
+        self.store = store
+        # 已经是IdIndex时直接使用（保留已建立的dict）
+        self.thread_ids = thread_ids if isinstance(thread_ids, IdIndex) else IdIndex(thread_ids)
+        self.positions = positions  # 按线程分组的记录位置
+        self.offsets = offsets  # 第i个线程的记录为 positions[offsets[i]:offsets[i+1]]
+        self.tails = {}  # 线程编码 -> 追加的记录位置（GrowableArray）
+    
+    def code_positions(self, code):
+        """第code个线程所有记录的位置（按行顺序）"""
+        positions = self.positions[self.offsets[code]:self.offsets[code + 1]] if code < len(self.offsets) - 1 else \
+            self.positions[:0]
+        tail = self.tails.get(code)
+        return positions if tail is None else np.concatenate([positions, tail.values])
+    
+    def timeline(self, code):
+        """第code个线程的ThreadTimeline（store按时间稳定排序存放时，位置升序即时间顺序）"""
+        positions = np.sort(self.code_positions(code))
+        if not self.store.in_time_order:
+            # 追加过记录: 按时间稳定排序（同一时间按位置，即原始行顺序）
+            positions = positions[np.argsort(self.store.times[positions], kind='stable')]
+        return ThreadTimeline(self.store.times[positions], self.store.reply[positions],
+                              store=self.store, positions=positions)
+    
+    def append(self, codes, positions, new_thread_ids):
+        """追加记录: codes为线程编码（-1表示没有线程），positions为记录位置（按行顺序），
+        new_thread_ids为新出现的线程ID。返回涉及到的线程编码
+        """
+        self.thread_ids.extend(new_thread_ids)
+        in_thread = np.flatnonzero(codes >= 0)
+        grouped = in_thread[np.argsort(codes[in_thread], kind='stable')]
+        touched, starts = np.unique(codes[grouped], return_index=True)
+        
+        # 每个线程的新记录接在该线程的追加缓冲区后面，只涉及这些线程
+        for code, added in zip(touched.tolist(), np.split(positions[grouped], starts[1:])):
+            tail = self.tails.get(code)
+            if tail is None:
+                tail = self.tails[code] = GrowableArray(np.empty(0, dtype=np.int64))
+            tail.extend(added)
+        return touched
+    
+    def compact(self):
+        """把追加的记录合并到positions和offsets中（复制整个数组，只在保存快照、写入数据库前执行）"""
+        if not self.tails:
+            return
+        old_count = len(self.offsets) - 1
+        codes = np.array(sorted(self.tails), dtype=np.int64)
+        added = [self.tails[code].values for code in codes.tolist()]
+        counts = np.array([len(values) for values in added], dtype=np.int64)
+        
+        # 每个线程的新记录接在该线程原有记录后面（新线程的记录在最后），偏移一次向量化地后移
+        at = np.repeat(self.offsets[np.minimum(codes + 1, old_count)], counts)
+        self.positions = np.insert(self.positions, at, np.concatenate(added))
+        offsets = np.empty(len(self.thread_ids) + 1, dtype=np.int64)
+        offsets[:old_count + 1] = self.offsets
+        offsets[old_count + 1:] = self.offsets[-1]
+        offsets[1:] += np.cumsum(np.bincount(codes, weights=counts, minlength=len(self.thread_ids)).astype(np.int64))
+        self.offsets = offsets
+        self.tails = {}
+    
+    def thread_positions(self, thread_id):
+        """线程中所有记录在store中的位置"""
+        return self.code_positions(self.thread_ids.get_loc(thread_id))
+    
+    def __getitem__(self, thread_id):
+        if thread_id not in self.thread_ids:
+            raise KeyError(thread_id)
+        return [EmailRecord(self.store, int(pos)) for pos in self.thread_positions(thread_id)]
+    
+    def __contains__(self, thread_id):
+        return thread_id in self.thread_ids
+    
+    def __iter__(self):
+        return iter(self.thread_ids)
+    
+    def __len__(self):
+        return len(self.thread_ids)
+
+class SearchIndex(Mapping):
+    """搜索ID -> 邮件记录（同一搜索ID有多条时为最后一条）"""
+    
+    def __init__(self, store, search_ids, positions):
+        self.store = store
+        self.search_ids = search_ids if isinstance(search_ids, IdIndex) else IdIndex(search_ids)
+        self.positions = positions
+        self.position_buffer = None  # 追加过搜索ID时的GrowableArray
+    
+    def append(self, codes, positions, new_search_ids):
+        """追加记录: 同一搜索ID保留最后一条，新记录覆盖原来的记录；new_search_ids为新出现的搜索ID"""
+        self.search_ids.extend(new_search_ids)
+        if self.position_buffer is None:
+            self.position_buffer = GrowableArray(self.positions)
+        self.positions = self.position_buffer.extend(np.zeros(len(new_search_ids), dtype=self.positions.dtype))
+        
+        has_search = np.flatnonzero(codes >= 0)
+        # 倒序后每个编码第一次出现的就是最后一条
+        reversed_codes = codes[has_search][::-1]
+        updated, last = np.unique(reversed_codes, return_index=True)
+        self.positions[updated] = positions[has_search][::-1][last]
+    
+    def __getitem__(self, search_id):
+        if search_id not in self.search_ids:
+            raise KeyError(search_id)
+        return EmailRecord(self.store, int(self.positions[self.search_ids.get_loc(search_id)]))
+    
+    def __contains__(self, search_id):
+        return search_id in self.search_ids
+    
+    def __iter__(self):
+        return iter(self.search_ids)
+    
+    def __len__(self):
+        return len(self.search_ids)
+
+class ThreadTimeline:
+    """一个线程内按时间排序的邮件，另有只含回复邮件的时间数组，查询时用二分查找"""
+    
+    __slots__ = ('times', 'reply_index', 'reply_times', 'emails', 'store', 'positions')
+    
+    def __init__(self, times, reply_flags, emails=None, store=None, positions=None):
+        self.times = times  # int64纳秒，升序
+        self.reply_index = np.flatnonzero(reply_flags)
+        self.reply_times = times[self.reply_index]
+        # 邮件来源: dict列表，或EmailRecordStore中的位置
+        self.emails = emails
+        self.store = store
+        self.positions = positions
+    
+    def __len__(self):
+        return len(self.times)
+    
+    def email(self, i):
+        """按时间顺序的第i封邮件"""
+        if self.store is not None:
+            return EmailRecord(self.store, int(self.positions[i]))
+        return self.emails[i]
+    
+    def first_after(self, target_ns):
+        """时间晚于target_ns的第一封邮件的位置（没有时等于邮件数）"""
+        return int(np.searchsorted(self.times, target_ns, side='right'))
+    
+    def first_reply_after(self, target_ns):
+        """时间晚于target_ns的第一封回复邮件的位置，以及之后的回复邮件数"""
+        j = int(np.searchsorted(self.reply_times, target_ns, side='right'))
+        if j == len(self.reply_times):
+            return None, 0
+        return int(self.reply_index[j]), len(self.reply_times) - j
+
+class SearchIdNgramIndex:
+    """搜索ID的小写三元组(trigram)倒排索引，用于子串模糊查找
+    
+    查询时只验证最短倒排列表中的候选，不再逐个扫描全部搜索ID；
+    少于3个字符的查询退回到对预先小写化的ID做线性扫描
+    """
+    
+    N = 3
+    
+    def __init__(self, search_ids):
+        self.search_ids = list(search_ids)
+        self.lowered = [sid.lower() for sid in self.search_ids]
+        postings = defaultdict(list)
+        for i, sid in enumerate(self.lowered):
+            for gram in {sid[j:j + self.N] for j in range(len(sid) - self.N + 1)}:
+                postings[gram].append(i)
+        # 倒排列表用int32数组保存，比Python整数列表省内存
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+        self.buffers = {}  # 追加过ID的三元组 -> GrowableArray（postings中为其已使用部分）
+    
+    def __len__(self):
+        return len(self.search_ids)
+    
+    def add(self, search_ids):
+        """追加新的搜索ID（编号接在已有的ID后面）"""
+        postings = defaultdict(list)
+        for i, sid in enumerate(search_ids, start=len(self.search_ids)):
+            lowered = sid.lower()
+            self.search_ids.append(sid)
+            self.lowered.append(lowered)
+            for gram in {lowered[j:j + self.N] for j in range(len(lowered) - self.N + 1)}:
+                postings[gram].append(i)
+        # 常见的三元组的倒排列表很长，追加到GrowableArray中，不每次复制整个列表
+        for gram, ids in postings.items():
+            buffer = self.buffers.get(gram)
+            if buffer is None:
+                buffer = self.buffers[gram] = GrowableArray(self.postings.get(gram, np.empty(0, dtype=np.int32)))
+            self.postings[gram] = buffer.extend(ids)
+    
+    def to_arrays(self):
+        """把倒排列表展开为(三元组, 连接后的位置, 偏移)三个数组，用于保存快照"""
+        grams = list(self.postings)
+        lengths = [len(self.postings[gram]) for gram in grams]
+        ids = np.concatenate([self.postings[gram] for gram in grams]) if grams else np.array([], dtype=np.int32)
+        return np.array(grams, dtype=object), ids, np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    
+    @classmethod
+    def from_arrays(cls, search_ids, grams, ids, offsets):
+        """从to_arrays的结果恢复索引，不再重新切分三元组"""
+        index = cls([])
+        index.search_ids = list(search_ids)
+        index.lowered = [sid.lower() for sid in index.search_ids]
+        index.postings = {gram: ids[offsets[i]:offsets[i + 1]] for i, gram in enumerate(grams.tolist())}
+        return index
+    
+    def candidates(self, query):
+        """可能包含query的搜索ID位置（升序），取最短的倒排列表"""
+        if len(query) < self.N:
+            return range(len(self.lowered))
+        best = None
+        for j in range(len(query) - self.N + 1):
+            ids = self.postings.get(query[j:j + self.N])
+            if ids is None:
+                return ()
+            if best is None or len(ids) < len(best):
+                best = ids
+        return best.tolist()
+    
+    def lookup(self, query, limit=None):
+        """返回包含query（不区分大小写）的全部搜索ID，按确定的顺序排列:
+        完全一致 > 以query结尾 > 以query开头 > ID较短 > 数据中先出现
+        """
+        query = str(query).lower()
+        if not query:
+            return []
+        lowered = self.lowered
+        hits = [i for i in self.candidates(query) if query in lowered[i]]
+        rank = lambda i: (lowered[i] != query, not lowered[i].endswith(query),
+                          not lowered[i].startswith(query), len(lowered[i]), i)
+        if limit is None:
+            hits.sort(key=rank)
+        else:
+            hits = heapq.nsmallest(limit, hits, key=rank)
+        return [self.search_ids[i] for i in hits]
+
+SQLITE_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE emails (
+    pos INTEGER PRIMARY KEY,  -- 按时间稳定排序后的位置
+    row INTEGER NOT NULL,     -- 源数据中的行位置
+    filename TEXT NOT NULL,
+    time INTEGER NOT NULL,    -- int64纳秒（带时区时为UTC）
+    email_id TEXT NOT NULL,
+    thread_id TEXT,           -- NULL表示"未知"
+    search_id TEXT,
+    is_reply INTEGER NOT NULL
+);
+CREATE TABLE threads (code INTEGER PRIMARY KEY, thread_id TEXT NOT NULL, count INTEGER NOT NULL);
+CREATE TABLE search_ids (code INTEGER PRIMARY KEY, search_id TEXT NOT NULL, lowered TEXT NOT NULL, pos INTEGER NOT NULL);
+"""
+
+# 数据写入后再建索引（比逐行维护索引快）
+SQLITE_INDEXES = """
+CREATE INDEX emails_thread_time ON emails (thread_id, time, pos);
+CREATE INDEX emails_thread_reply ON emails (thread_id, is_reply, time, pos);
+CREATE UNIQUE INDEX threads_thread_id ON threads (thread_id);
+CREATE UNIQUE INDEX search_ids_search_id ON search_ids (search_id);
+"""
+
+# 搜索ID的三元组全文索引（与SearchIdNgramIndex相同的用途），需要SQLite 3.34以上的FTS5
+SQLITE_NGRAM_INDEX = """
+CREATE VIRTUAL TABLE search_grams USING fts5(lowered, tokenize='trigram', content='search_ids', content_rowid='code');
+INSERT INTO search_grams (search_grams) VALUES ('rebuild');
+"""
+
+def tz_to_text(tz):
+    """时区保存为文本: 有名称时用名称，固定偏移保存为offset:秒数"""
+    if tz is None:
+        return None
+    name = getattr(tz, 'key', None) or getattr(tz, 'zone', None)
+    if name:
+        return name
+    offset = tz.utcoffset(None)
+    if offset is not None:
+        return f"offset:{int(offset.total_seconds())}"
+    return str(tz)
+
+def text_to_tz(text):
+    """tz_to_text的逆变换"""
+    if text is None:
+        return None
+    if text.startswith('offset:'):
+        return timezone(timedelta(seconds=int(text[len('offset:'):])))
+    return text
+
+class SQLiteEmailDB:
+    """保存在SQLite数据库中的邮件记录和索引，每次查询执行一条带索引的SQL
+    
+    打开时不把记录读入内存；表结构与EmailRecordStore相同（按时间稳定排序的位置为主键），
+    线程时间线用(thread_id, time, pos)索引，回复邮件用(thread_id, is_reply, time, pos)索引
+    """
+    
+    COLUMNS = 'pos, row, filename, time, email_id, thread_id, search_id, is_reply'
+    
+    def __init__(self, path):
+        self.path = path
+        # sqlite3的连接不能在线程间同时使用: 每个线程（如查询服务的线程池）打开自己的只读连接
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+        self.meta = dict(self.conn.execute('SELECT key, value FROM meta'))
+        self.tz = text_to_tz(self.meta.get('tz'))
+        self.filename_col, self.time_col = json.loads(self.meta['columns'])
+    
+    @staticmethod
+    def create(path, store, thread_index, search_index, meta, chunk_size=STREAM_CHUNK_SIZE):
+        """把按列保存的记录和索引写入新数据库（先写临时文件再替换，分块写入不一次展开全部记录）"""
+        tmp_path = path + '.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = OFF')
+            conn.executescript(SQLITE_SCHEMA)
+            
+            thread_ids = np.append(store.thread_ids.astype(object), None)
+            search_ids = np.append(store.search_ids.astype(object), None)
+            # 数据库中的pos为按时间排序的位置（追加过记录时与数组中的位置不同）
+            order = store.time_order()
+            search_positions = search_index.positions
+            if order is not None:
+                ranks = np.empty(len(order), dtype=np.int64)
+                ranks[order] = np.arange(len(order))
+                search_positions = ranks[search_positions]
+            for start in range(0, len(store), chunk_size):
+                db_positions = np.arange(start, min(start + chunk_size, len(store)))
+                positions = db_positions if order is None else order[db_positions]
+                codes_t = store.thread_codes[positions]
+                codes_s = store.search_codes[positions]
+                conn.executemany(
+                    f'INSERT INTO emails ({SQLiteEmailDB.COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    zip(db_positions.tolist(), store.rows[positions].tolist(), store.filenames(positions),
+                        store.times[positions].tolist(), store.email_ids(positions),
+                        thread_ids[codes_t].tolist(), search_ids[codes_s].tolist(),
+                        store.reply[positions].astype(int).tolist()))
+            
+            thread_index.compact()
+            counts = np.diff(thread_index.offsets).tolist()
+            conn.executemany('INSERT INTO threads VALUES (?, ?, ?)',
+                             zip(range(len(counts)), thread_index.thread_ids.tolist(), counts))
+            sids = search_index.search_ids.tolist()
+            conn.executemany('INSERT INTO search_ids VALUES (?, ?, ?, ?)',
+                             zip(range(len(sids)), sids, [sid.lower() for sid in sids],
+                                 search_positions.tolist()))
+            conn.executescript(SQLITE_INDEXES)
+            try:
+                conn.executescript(SQLITE_NGRAM_INDEX)
+                meta = dict(meta, ngram='1')
+            except sqlite3.Error:
+                pass  # 不支持trigram时模糊查找逐个扫描
+            conn.executemany('INSERT INTO meta VALUES (?, ?)', meta.items())
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp_path, path)
+    
+    @property
+    def conn(self):
+        """当前线程的连接（第一次使用时打开）"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            # close()可能在其他线程中执行，所以不检查连接所属的线程
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute('PRAGMA query_only = ON')
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+    
+    def close(self):
+        """关闭所有线程的连接"""
+        with self.lock:
+            connections, self.connections = self.connections, []
+            self.local = threading.local()
+        for conn in connections:
+            conn.close()
+    
+    def scalar(self, sql, params=()):
+        """执行SQL并返回第一行第一列（没有结果时为None）"""
+        row = self.conn.execute(sql, params).fetchone()
+        return row[0] if row is not None else None
+    
+    def record(self, row):
+        """把emails表的一行转换为与EmailRecord相同键的dict"""
+        pos, source_row, filename, ns, email_id, thread_id, search_id, is_reply = row
+        time_val = pd.Timestamp(ns)
+        if self.tz is not None:
+            time_val = time_val.tz_localize('UTC').tz_convert(self.tz)
+        return {
+            '原始行号': source_row + 2,
+            '文件名': filename,
+            '时间': time_val,
+            '邮件ID': email_id,
+            '线程ID': thread_id if thread_id is not None else "未知",
+            '搜索ID': search_id,
+            '是回复': bool(is_reply),
+            '原始数据': {self.filename_col: filename, self.time_col: time_val},
+        }
+    
+    def email_at(self, pos):
+        """第pos条记录（按时间排序）"""
+        row = self.conn.execute(f'SELECT {self.COLUMNS} FROM emails WHERE pos = ?', (pos,)).fetchone()
+        if row is None:
+            raise IndexError(pos)
+        return self.record(row)
+    
+    def lookup(self, query, limit=None):
+        """与SearchIdNgramIndex.lookup相同的模糊查找和排序规则，在SQL中完成
+        
+        有三元组全文索引且query不少于3个字符时只验证索引给出的候选，否则逐个扫描
+        """
+        query = str(query).lower()
+        if not query:
+            return []
+        params = {'q': query, 'limit': -1 if limit is None else limit}
+        if self.meta.get('ngram') and len(query) >= SearchIdNgramIndex.N:
+            source = "search_ids WHERE code IN (SELECT rowid FROM search_grams WHERE search_grams MATCH :phrase) AND"
+            params['phrase'] = '"' + query.replace('"', '""') + '"'
+        else:
+            source = "search_ids WHERE"
+        rows = self.conn.execute(
+            f"SELECT search_id FROM {source} instr(lowered, :q) > 0 "
+            "ORDER BY lowered != :q, substr(lowered, -length(:q)) != :q, "
+            "substr(lowered, 1, length(:q)) != :q, length(lowered), code LIMIT :limit", params)
+        return [sid for sid, in rows]
+
+class SQLiteEmailList(Sequence):
+    """SQLite中的全部邮件记录（按时间排序），按位置读取或顺序遍历"""
+    
+    def __init__(self, db):
+        self.db = db
+        self.tz = db.tz
+    
+    def __len__(self):
+        return int(self.db.meta['records'])
+    
+    def __getitem__(self, pos):
+        if pos < 0:
+            pos += len(self)
+        return self.db.email_at(pos)
+    
+    def __iter__(self):
+        for row in self.db.conn.execute(f'SELECT {self.db.COLUMNS} FROM emails ORDER BY pos'):
+            yield self.db.record(row)
+
+class SQLiteThreadIndex(Mapping):
+    """线程ID -> 该线程的邮件列表（按原始行顺序），从SQLite中查询"""
+    
+    def __init__(self, db):
+        self.db = db
+    
+    def __getitem__(self, thread_id):
+        if thread_id not in self:
+            raise KeyError(thread_id)
+        rows = self.db.conn.execute(
+            f'SELECT {self.db.COLUMNS} FROM emails WHERE thread_id = ? ORDER BY row, pos', (thread_id,))
+        return [self.db.record(row) for row in rows]
+    
+    def __contains__(self, thread_id):
+        return self.db.scalar('SELECT 1 FROM threads WHERE thread_id = ?', (thread_id,)) is not None
+    
+    def __iter__(self):
+        return (thread_id for thread_id, in self.db.conn.execute('SELECT thread_id FROM threads ORDER BY code'))
+    
+    def __len__(self):
+        return self.db.scalar('SELECT COUNT(*) FROM threads')
+
+class SQLiteSearchIndex(Mapping):
+    """搜索ID -> 邮件记录（同一搜索ID有多条时为最后一条），从SQLite中查询"""
+    
+    def __init__(self, db):
+        self.db = db
+    
+    def __getitem__(self, search_id):
+        pos = self.db.scalar('SELECT pos FROM search_ids WHERE search_id = ?', (search_id,))
+        if pos is None:
+            raise KeyError(search_id)
+        return self.db.email_at(pos)
+    
+    def __contains__(self, search_id):
+        return self.db.scalar('SELECT 1 FROM search_ids WHERE search_id = ?', (search_id,)) is not None
+    
+    def __iter__(self):
+        return (sid for sid, in self.db.conn.execute('SELECT search_id FROM search_ids ORDER BY code'))
+    
+    def __len__(self):
+        return self.db.scalar('SELECT COUNT(*) FROM search_ids')
+
+class SQLiteThreadTimeline:
+    """与ThreadTimeline接口相同的线程时间线，位置和数量都用索引上的范围查询得到"""
+    
+    store = None
+    
+    def __init__(self, db, thread_id, count):
+        self.db = db
+        self.thread_id = thread_id
+        self.count = count
+        self._arrays = None
+    
+    def __len__(self):
+        return self.count
+    
+    def email(self, i):
+        """按时间顺序的第i封邮件"""
+        row = self.db.conn.execute(
+            f'SELECT {self.db.COLUMNS} FROM emails WHERE thread_id = ? ORDER BY time, pos LIMIT 1 OFFSET ?',
+            (self.thread_id, i)).fetchone()
+        if row is None:
+            raise IndexError(i)
+        return self.db.record(row)
+    
+    def first_after(self, target_ns):
+        """时间晚于target_ns的第一封邮件的位置（没有时等于邮件数）"""
+        return self.db.scalar('SELECT COUNT(*) FROM emails WHERE thread_id = ? AND time <= ?',
+                              (self.thread_id, target_ns))
+    
+    def first_reply_after(self, target_ns):
+        """时间晚于target_ns的第一封回复邮件的位置，以及之后的回复邮件数"""
+        row = self.db.conn.execute(
+            'SELECT time, pos FROM emails WHERE thread_id = ? AND is_reply = 1 AND time > ? '
+            'ORDER BY time, pos LIMIT 1', (self.thread_id, target_ns)).fetchone()
+        if row is None:
+            return None, 0
+        index = self.db.scalar('SELECT COUNT(*) FROM emails WHERE thread_id = ? AND (time, pos) < (?, ?)',
+                               (self.thread_id, *row))
+        count = self.db.scalar('SELECT COUNT(*) FROM emails WHERE thread_id = ? AND is_reply = 1 AND time > ?',
+                               (self.thread_id, target_ns))
+        return index, count
+    
+    def arrays(self):
+        """整个线程的时间数组和回复邮件位置（compute_all_responses使用，读取一次后保留）"""
+        if self._arrays is None:
+            rows = self.db.conn.execute('SELECT time, is_reply FROM emails WHERE thread_id = ? ORDER BY time, pos',
+                                        (self.thread_id,)).fetchall()
+            times = np.array([r[0] for r in rows], dtype=np.int64)
+            self._arrays = times, np.flatnonzero([r[1] for r in rows])
+        return self._arrays
+    
+    @property
+    def times(self):
+        return self.arrays()[0]
+    
+    @property
+    def reply_index(self):
+        return self.arrays()[1]
+
+class SQLiteTimelines(Mapping):
+    """线程ID -> SQLiteThreadTimeline（查询时才创建，不预先建立）"""
+    
+    def __init__(self, db):
+        self.db = db
+    
+    def __getitem__(self, thread_id):
+        count = self.db.scalar('SELECT count FROM threads WHERE thread_id = ?', (thread_id,))
+        if count is None:
+            raise KeyError(thread_id)
+        return SQLiteThreadTimeline(self.db, thread_id, count)
+    
+    def __contains__(self, thread_id):
+        return self.db.scalar('SELECT 1 FROM threads WHERE thread_id = ?', (thread_id,)) is not None
+    
+    def __iter__(self):
+        return (thread_id for thread_id, in self.db.conn.execute('SELECT thread_id FROM threads ORDER BY code'))
+    
+    def __len__(self):
+        return self.db.scalar('SELECT COUNT(*) FROM threads')
+
+def to_ns(times):
+    """把时间列表转换为int64纳秒数组（带时区时为UTC）"""
+    return np.asarray(pd.DatetimeIndex(list(times)).values.astype('datetime64[ns]').view('int64'))
+
+def excel_header_names(values):
+    """把表头单元格转换为与pd.read_excel相同的列名（空单元格为Unnamed: i，重复列名加.1、.2）"""
+    names = []
+    seen = {}
+    for i, value in enumerate(values):
+        name = f"Unnamed: {i}" if value is None or value == '' else value
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+def excel_cell(value):
+    """与pd.read_excel相同: 整数值的浮点数转换为int"""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def calamine_supported():
+    """能否用calamine引擎读取Excel: 需要安装python-calamine，且pandas为2.2以上（之前没有engine='calamine'）"""
+    if importlib.util.find_spec('python_calamine') is None:
+        return False
+    version = tuple(int(part) for part in re.findall(r'\d+', pd.__version__)[:2])
+    return version >= (2, 2)
+
+def get_snapshot_paths(source):
+    """快照保存在数据文件旁边: 索引数组(.snapshot.npz)和元数据(.snapshot.json)"""
+    stem = os.path.splitext(source)[0]
+    return stem + '.snapshot.npz', stem + '.snapshot.json'
+
+# 快照中object列的值类型（只保存数组，不使用pickle）
+VALUE_NONE, VALUE_STR, VALUE_INT, VALUE_FLOAT, VALUE_BOOL, VALUE_DATETIME, VALUE_TIMESTAMP, VALUE_NAT, VALUE_NA = range(9)
+INTEGER_VALUES = (VALUE_INT, VALUE_BOOL, VALUE_DATETIME, VALUE_TIMESTAMP)  # 保存在integers数组中的类型
+
+def pack_strings(strings):
+    """字符串列表 -> (UTF-8字节的uint8数组, 偏移)"""
+    column = StringColumn.from_strings(strings)
+    return np.frombuffer(column.data, dtype=np.uint8), column.offsets
+
+def unpack_strings(data, offsets):
+    """pack_strings的逆操作"""
+    column = StringColumn(data.tobytes(), offsets)
+    return [column[i] for i in range(len(column))]
+
+def pack_values(values):
+    """把object列的值转换为数组: 类型编码，以及按类型分开保存的整数、浮点数和字符串
+    
+    支持None、字符串、整数、浮点数、布尔值和不带时区的时间，有其他类型的值时返回None
+    """
+    kinds = np.empty(len(values), dtype=np.int8)
+    integers, floats, strings = [], [], []
+    for i, value in enumerate(values):
+        if value is None:
+            kinds[i] = VALUE_NONE
+        elif isinstance(value, str):
+            kinds[i] = VALUE_STR
+            strings.append(value)
+        elif isinstance(value, (bool, np.bool_)):
+            kinds[i] = VALUE_BOOL
+            integers.append(int(value))
+        elif isinstance(value, (int, np.integer)):
+            kinds[i] = VALUE_INT
+            integers.append(int(value))
+        elif isinstance(value, (float, np.floating)):
+            kinds[i] = VALUE_FLOAT
+            floats.append(float(value))
+        elif value is pd.NaT:
+            kinds[i] = VALUE_NAT
+        elif value is pd.NA:
+            kinds[i] = VALUE_NA
+        elif isinstance(value, datetime) and value.tzinfo is None:
+            kinds[i] = VALUE_TIMESTAMP if isinstance(value, pd.Timestamp) else VALUE_DATETIME
+            try:
+                integers.append(pd.Timestamp(value).value)
+            except ValueError:
+                return None
+        else:
+            return None
+    
+    try:
+        integers = np.array(integers, dtype=np.int64)
+    except OverflowError:
+        return None
+    data, offsets = pack_strings(strings)
+    return {'kinds': kinds, 'integers': integers, 'floats': np.array(floats, dtype=np.float64),
+            'strings': data, 'string_offsets': offsets}
+
+def unpack_values(kinds, integers, floats, strings, string_offsets):
+    """pack_values的逆操作，返回object数组"""
+    values = np.empty(len(kinds), dtype=object)
+    values[kinds == VALUE_STR] = np.array(unpack_strings(strings, string_offsets), dtype=object)
+    values[kinds == VALUE_FLOAT] = floats.astype(object)
+    values[kinds == VALUE_NAT] = pd.NaT
+    values[kinds == VALUE_NA] = pd.NA
+    
+    positions = np.flatnonzero(np.isin(kinds, INTEGER_VALUES))
+    integer_kinds = kinds[positions]
+    for kind, convert in ((VALUE_INT, lambda v: v.astype(object)),
+                          (VALUE_BOOL, lambda v: v.astype(bool).astype(object)),
+                          (VALUE_DATETIME, lambda v: pd.DatetimeIndex(v.view('datetime64[ns]')).to_pydatetime()),
+                          (VALUE_TIMESTAMP, lambda v: pd.DatetimeIndex(v.view('datetime64[ns]')).astype(object))):
+        selected = integer_kinds == kind
+        if selected.any():
+            values[positions[selected]] = np.asarray(convert(integers[selected]), dtype=object)
+    return values
+
+def frame_to_arrays(df):
+    """把源DataFrame拆成数组（数值/布尔/时间列直接保存，其他列用pack_values）和列的说明
+    
+    有不能保存的列名、索引或值时返回None（这时不保存快照）
+    """
+    if not (isinstance(df.index, pd.RangeIndex) and df.index.start == 0 and df.index.step == 1):
+        return None
+    
+    arrays = {}
+    columns = []
+    for i, name in enumerate(df.columns):
+        if isinstance(name, bool) or not isinstance(name, (str, int)):
+            return None
+        column = df.iloc[:, i]
+        dtype = column.dtype
+        if isinstance(dtype, np.dtype) and dtype.kind in 'biufmM':
+            arrays[f"df{i}"] = column.to_numpy()
+            packed = False
+        else:
+            values = pack_values(column.tolist())
+            if values is None:
+                return None
+            arrays.update({f"df{i}_{key}": array for key, array in values.items()})
+            packed = True
+        columns.append({'name': name, 'dtype': str(dtype), 'packed': packed})
+    return arrays, columns
+
+def arrays_to_frame(arrays, columns):
+    """frame_to_arrays的逆操作"""
+    data = {}
+    for i, column in enumerate(columns):
+        if column['packed']:
+            values = unpack_values(*(arrays[f"df{i}_{key}"] for key in
+                                     ('kinds', 'integers', 'floats', 'strings', 'string_offsets')))
+            data[i] = pd.Series(values, dtype=pd.api.types.pandas_dtype(column['dtype']))
+        else:
+            data[i] = pd.Series(arrays[f"df{i}"])
+    df = pd.DataFrame(data)
+    df.columns = [column['name'] for column in columns]
+    return df
+
+def get_sqlite_path(source):
+    """SQLite数据库保存在数据文件旁边: <数据文件名>.sqlite"""
+    return os.path.splitext(source)[0] + '.sqlite'
+
 class EmailAnalyzer:
-    def __init__(self, excel_file=None):
+    def __init__(self, excel_file=None, eml_folder=None, output=None, streaming=None, sqlite=None, verbose=None):
         self.excel_file = excel_file
+        self.use_sqlite = use_sqlite if sqlite is None else sqlite
+        self.sqlite_db = None
+        self.verbose = not quiet if verbose is None else verbose  # 是否显示处理和查询过程
         self.df = None
         self.data_by_search_id = {}
         self.data_by_thread_id = defaultdict(list)
+        self.thread_timelines = {}
+        self.search_id_index = SearchIdNgramIndex([])
+        self.columns = None  # 检测到的(文件名列, 时间列)
         self.all_emails = []
         self.results = []
         
-        if excel_file:
-            self.load_data(excel_file)
+        if eml_folder:
+            self.load_eml_folder(eml_folder, output)
+        elif excel_file:
+            self.load_data(excel_file, streaming)
+    
+    @property
+    def df(self):
+        """源数据（add_emails追加的数据块在读取df时才合并）"""
+        store = self.all_emails
+        if isinstance(store, EmailRecordStore) and store.frames and store.df is self._df:
+            self._df = store.merge_frames()
+        return self._df
+    
+    @df.setter
+    def df(self, df):
+        self._df = df
     
-    def load_data(self, excel_file):
-        """加载Excel数据"""
-        print(f"读取文件: {excel_file}")
+    def load_data(self, excel_file, streaming=None):
+        """加载数据（Excel、CSV或Parquet）
+        
+        streaming为None时，文件超过stream_threshold则按块流式读取
+        """
+        self.log(f"读取文件: {excel_file}")
         
         if not os.path.exists(excel_file):
             print(f"文件不存在: {excel_file}")
             return False
         
-        try:
-            self.df = pd.read_excel(excel_file)
-            print(f"数据形状: {self.df.shape}")
-            print(f"列名: {list(self.df.columns)}")
-            
-            # 处理数据
-            self.process_data()
+        source_hash = None
+        if use_snapshot or self.use_sqlite:
+            source_hash = load_summary_module().file_hash(excel_file)
+        if self.use_sqlite and self.open_sqlite(excel_file, source_hash):
             return True
+        
+        if not (use_snapshot and self.load_snapshot(excel_file, source_hash)):
+            if streaming is None:
+                streaming = os.path.getsize(excel_file) > stream_threshold
+            
+            try:
+                if streaming:
+                    if not self.process_stream(excel_file):
+                        return False
+                else:
+                    with metrics.timer('load'):
+                        self.df = self.read_columns(excel_file)
+                    self.log(f"数据形状: {self.df.shape}")
+                    self.log(f"列名: {list(self.df.columns)}")
+                    
+                    # 处理数据
+                    self.process_data()
+                # 使用SQLite时索引保存在数据库中，不再另存快照
+                if use_snapshot and not self.use_sqlite:
+                    self.save_snapshot(excel_file, source_hash)
+                
+            except Exception as e:
+                print(f"读取文件失败: {e}")
+                return False
+        
+        # 写入SQLite数据库后改为SQL查询，释放内存中的记录和索引
+        if self.use_sqlite and self.save_sqlite(excel_file, source_hash):
+            self.open_sqlite(excel_file, source_hash)
+        return True
+    
+    def read_columns(self, path):
+        """读取数据文件: 先只读表头识别文件名列和时间列，再只加载这两列
+        
+        Excel在可以使用calamine引擎时（calamine_supported）用calamine读取，否则用openpyxl只读模式逐行读取
+        """
+        ext = os.path.splitext(path)[1].lower()
+        
+        if load_all_columns or ext == '.parquet':
+            if ext == '.csv':
+                df = pd.read_csv(path, encoding='utf-8-sig')
+            elif ext == '.parquet':
+                df = pd.read_parquet(path)
+            else:
+                df = pd.read_excel(path)
+            self.columns = self.detect_columns(df.columns)
+            return df
+        
+        if ext == '.csv':
+            columns = list(pd.read_csv(path, encoding='utf-8-sig', nrows=0).columns)
+            self.columns = self.detect_columns(columns)
+            return pd.read_csv(path, encoding='utf-8-sig', usecols=list(dict.fromkeys(self.columns)))
+        
+        if calamine_supported():
+            columns = list(pd.read_excel(path, engine='calamine', nrows=0).columns)
+            self.columns = self.detect_columns(columns)
+            positions = sorted({columns.index(col) for col in self.columns})
+            self.log("使用calamine引擎读取")
+            return pd.read_excel(path, engine='calamine', usecols=positions)
+        
+        if ext in ('.xlsx', '.xlsm'):
+            return self.read_xlsx_columns(path)
+        
+        df = pd.read_excel(path)
+        self.columns = self.detect_columns(df.columns)
+        return df[list(dict.fromkeys(self.columns))]
+    
+    def read_xlsx_columns(self, path):
+        """用openpyxl只读模式读取需要的列"""
+        rows = self.iter_xlsx_rows(path)
+        columns = next(rows)
+        rows = list(rows)
+        
+        # 与pd.read_excel相同，去掉末尾的空行
+        while rows and all(value is None for value in rows[-1]):
+            rows.pop()
+        return pd.DataFrame(rows, columns=columns)
+    
+    def iter_xlsx_rows(self, path):
+        """用openpyxl只读模式打开一次工作簿: 读表头识别列，再逐行只取需要的列
+        
+        第一个返回值是列名列表，之后每次返回一行的值
+        """
+        from openpyxl import load_workbook
+        
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            worksheet = workbook.worksheets[0]
+            header = next(worksheet.iter_rows(max_row=1, values_only=True), ())
+            columns = excel_header_names(header)
+            self.columns = self.detect_columns(columns)
+            positions = sorted({columns.index(col) for col in self.columns})
+            yield [columns[p] for p in positions]
             
+            for row in worksheet.iter_rows(min_row=2, max_col=positions[-1] + 1, values_only=True):
+                yield [excel_cell(row[p]) for p in positions]
+        finally:
+            workbook.close()
+    
+    def iter_chunks(self, path, chunk_size):
+        """按块读取数据文件的文件名列和时间列，每块的索引为源数据中的行位置"""
+        ext = os.path.splitext(path)[1].lower()
+        
+        if ext == '.csv':
+            columns = list(pd.read_csv(path, encoding='utf-8-sig', nrows=0).columns)
+            self.columns = self.detect_columns(columns)
+            yield from pd.read_csv(path, encoding='utf-8-sig', usecols=list(dict.fromkeys(self.columns)),
+                                   chunksize=chunk_size)
+            return
+        
+        if ext == '.parquet':
+            try:
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise ImportError("流式读取Parquet需要安装pyarrow: pip install pyarrow")
+            parquet_file = pq.ParquetFile(path)
+            self.columns = self.detect_columns(parquet_file.schema_arrow.names)
+            start = 0
+            for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=list(dict.fromkeys(self.columns))):
+                chunk = batch.to_pandas()
+                chunk.index = pd.RangeIndex(start, start + len(chunk))
+                start += len(chunk)
+                yield chunk
+            return
+        
+        if ext in ('.xlsx', '.xlsm'):
+            rows = self.iter_xlsx_rows(path)
+            columns = next(rows)
+            start = 0
+            while True:
+                batch = list(itertools.islice(rows, chunk_size))
+                if not batch:
+                    break
+                yield pd.DataFrame(batch, columns=columns, index=pd.RangeIndex(start, start + len(batch)))
+                start += len(batch)
+            return
+        
+        # 其他格式（如.xls）不能流式读取，整体读入后分块
+        df = self.read_columns(path)
+        for start in range(0, len(df), chunk_size):
+            yield df.iloc[start:start + chunk_size]
+    
+    def save_snapshot(self, source, source_hash):
+        """保存已建立的索引（只保存数组，不使用pickle，加载快照不会执行代码），先写临时文件再替换"""
+        store = self.all_emails
+        if not isinstance(store, EmailRecordStore) or not store.in_time_order:
+            return False
+        
+        self.data_by_thread_id.compact()
+        frame = frame_to_arrays(self.df) if self.df is not None else ({}, None)
+        if frame is None:
+            self.log("数据中有不能保存到快照的值，不保存索引快照")
+            return False
+        frame_arrays, frame_columns = frame
+        
+        data_path, meta_path = get_snapshot_paths(source)
+        filename_col, time_col = self.columns
+        thread_ids, thread_id_offsets = pack_strings(store.thread_ids)
+        search_ids, search_id_offsets = pack_strings(store.search_ids)
+        grams, gram_ids, gram_offsets = self.search_id_index.to_arrays()
+        grams, gram_text_offsets = pack_strings(grams)
+        arrays = {
+            **frame_arrays,
+            'rows': store.rows,
+            'times': store.times,
+            'thread_codes': store.thread_codes,
+            'thread_ids': thread_ids,
+            'thread_id_offsets': thread_id_offsets,
+            'search_codes': store.search_codes,
+            'search_ids': search_ids,
+            'search_id_offsets': search_id_offsets,
+            'reply': store.reply,
+            'thread_positions': self.data_by_thread_id.positions,
+            'thread_offsets': self.data_by_thread_id.offsets,
+            'search_positions': self.data_by_search_id.positions,
+            'grams': grams,
+            'gram_text_offsets': gram_text_offsets,
+            'gram_ids': gram_ids,
+            'gram_offsets': gram_offsets,
+        }
+        if store.names is not None:
+            arrays['names'] = np.frombuffer(store.names.data, dtype=np.uint8)
+            arrays['name_offsets'] = store.names.offsets
+            arrays['name_index'] = store.name_index
+        meta = {
+            'version': SNAPSHOT_VERSION,
+            'source': os.path.abspath(source),
+            'hash': source_hash,
+            'records': len(store),
+            'columns': [filename_col, time_col],
+            'tz': tz_to_text(store.tz),
+            'frame': frame_columns,  # 源DataFrame各列的列名和类型（流式读取时为None）
+        }
+        try:
+            # 元数据最后写入: 元数据有效时数据文件一定已经完整
+            with open(data_path + '.tmp', 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(data_path + '.tmp', data_path)
+            with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(meta_path + '.tmp', meta_path)
+        except Exception as e:
+            print(f"保存索引快照失败: {e}")
+            return False
+        self.log(f"索引快照已保存: {data_path}")
+        return True
+    
+    @metrics.timed('load')
+    def load_snapshot(self, source, source_hash):
+        """数据文件内容和快照版本都一致时，从快照恢复索引"""
+        data_path, meta_path = get_snapshot_paths(source)
+        if not (os.path.exists(meta_path) and os.path.exists(data_path)):
+            return False
+        
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except Exception as e:
+            print(f"读取快照元数据失败，将重新处理: {e}")
+            return False
+        
+        if meta.get('version') != SNAPSHOT_VERSION or meta.get('hash') != source_hash:
+            self.log("数据文件已改变，快照失效，将重新处理")
+            return False
+        
+        try:
+            # allow_pickle=False: 快照中只有数值数组，含Python对象的文件直接报错
+            with np.load(data_path, allow_pickle=False) as npz:
+                arrays = {name: npz[name] for name in npz.files}
+            df = arrays_to_frame(arrays, meta['frame']) if meta['frame'] is not None else None
+            names = None
+            if 'names' in arrays:
+                names = StringColumn(arrays['names'].tobytes(), arrays['name_offsets'])
+            thread_ids = np.array(unpack_strings(arrays['thread_ids'], arrays['thread_id_offsets']), dtype=object)
+            search_ids = np.array(unpack_strings(arrays['search_ids'], arrays['search_id_offsets']), dtype=object)
+            grams = np.array(unpack_strings(arrays['grams'], arrays['gram_text_offsets']), dtype=object)
+        except Exception as e:
+            print(f"读取索引快照失败，将重新处理: {e}")
+            return False
+        
+        self.df = df
+        self.columns = tuple(meta['columns'])
+        filename_col, time_col = self.columns
+        store = EmailRecordStore(
+            self.df, filename_col,
+            rows=arrays['rows'],
+            times=arrays['times'],
+            tz=text_to_tz(meta['tz']),
+            thread_codes=arrays['thread_codes'],
+            thread_ids=thread_ids,
+            search_codes=arrays['search_codes'],
+            search_ids=search_ids,
+            reply=arrays['reply'],
+            names=names,
+            name_index=arrays.get('name_index'),
+            time_col=time_col,
+        )
+        self.all_emails = store
+        self.data_by_thread_id = ThreadIndex(store, store.thread_ids, arrays['thread_positions'], arrays['thread_offsets'])
+        self.data_by_search_id = SearchIndex(store, store.search_ids, arrays['search_positions'])
+        self.build_thread_timelines()
+        self.search_id_index = SearchIdNgramIndex.from_arrays(
+            store.search_ids.tolist(), grams, arrays['gram_ids'], arrays['gram_offsets'])
+        
+        self.log(f"从索引快照加载: {data_path}")
+        self.log(f"  有效邮件记录: {len(self.all_emails)}")
+        self.log(f"  唯一线程ID数量: {len(self.data_by_thread_id)}")
+        self.log(f"  包含搜索ID的记录: {len(self.data_by_search_id)}")
+        return True
+    
+    def save_sqlite(self, source, source_hash):
+        """把已建立的记录和索引写入数据文件旁边的SQLite数据库"""
+        store = self.all_emails
+        if not isinstance(store, EmailRecordStore):
+            return False
+        
+        db_path = get_sqlite_path(source)
+        meta = {
+            'version': str(SQLITE_VERSION),
+            'source': os.path.abspath(source),
+            'hash': source_hash,
+            'records': str(len(store)),
+            'columns': json.dumps(list(self.columns), ensure_ascii=False),
+            'tz': tz_to_text(store.tz),
+        }
+        try:
+            SQLiteEmailDB.create(db_path, store, self.data_by_thread_id, self.data_by_search_id, meta)
+        except Exception as e:
+            print(f"保存SQLite数据库失败: {e}")
+            return False
+        self.log(f"SQLite数据库已保存: {db_path}")
+        return True
+    
+    @metrics.timed('load')
+    def open_sqlite(self, source, source_hash):
+        """数据文件内容和数据库版本都一致时，打开SQLite数据库，之后的查询都在数据库中执行"""
+        db_path = get_sqlite_path(source)
+        if not os.path.exists(db_path):
+            return False
+        
+        try:
+            db = SQLiteEmailDB(db_path)
         except Exception as e:
-            print(f"读取文件失败: {e}")
+            print(f"打开SQLite数据库失败，将重新处理: {e}")
+            return False
+        
+        if db.meta.get('version') != str(SQLITE_VERSION) or db.meta.get('hash') != source_hash:
+            self.log("数据文件已改变，SQLite数据库失效，将重新处理")
+            db.close()
             return False
+        
+        if self.sqlite_db is not None:
+            self.sqlite_db.close()
+        self.sqlite_db = db
+        self.df = None
+        self.columns = (db.filename_col, db.time_col)
+        self.all_emails = SQLiteEmailList(db)
+        self.data_by_thread_id = SQLiteThreadIndex(db)
+        self.data_by_search_id = SQLiteSearchIndex(db)
+        self.thread_timelines = SQLiteTimelines(db)
+        self.search_id_index = db
+        
+        self.log(f"使用SQLite数据库: {db_path}")
+        self.log(f"  有效邮件记录: {len(self.all_emails)}")
+        self.log(f"  唯一线程ID数量: {len(self.data_by_thread_id)}")
+        self.log(f"  包含搜索ID的记录: {len(self.data_by_search_id)}")
+        return True
     
-    def process_data(self):
-        """处理数据，建立索引"""
-        print("\n开始处理数据...")
+    def load_eml_folder(self, folder, output=None):
+        """直接扫描.eml文件夹建立索引，不经过Excel的写入和读取
+        
+        output不为空时同时保存汇总文件（.xlsx/.csv/.parquet），并使用增量扫描清单
+        """
+        self.log(f"扫描邮件文件夹: {folder}")
+        
+        if not os.path.isdir(folder):
+            print(f"文件夹不存在: {folder}")
+            return False
+        
+        summary = load_summary_module()
+        manifest_path = summary.get_manifest_path(output) if output else None
+        cached = summary.load_manifest(manifest_path, folder) if manifest_path and summary.use_manifest else {}
+        entries = {}
+        writer = summary.ResultWriter(output) if output else None
         
+        rows = []
+        # summary的扫描进度与分析器的输出一起显示或不显示
+        summary_verbose, summary.verbose = summary.verbose, self.verbose
+        try:
+            for row in metrics.timed_iter('load', summary.iter_scan_inputs(folder, cached, entries)):
+                rows.append(row)
+                if writer and len(rows) % summary.write_batch_size == 0:
+                    writer.write(rows[-summary.write_batch_size:])
+            
+            if writer:
+                writer.write(rows[writer.rows_written:])
+                writer.close()
+                self.log(f"汇总文件已保存: {output}")
+                if summary.use_manifest:
+                    summary.save_manifest(manifest_path, folder, entries)
+        finally:
+            summary.verbose = summary_verbose
+        
+        # 时间直接转换为datetime列，process_data不需要再逐个解析字符串
+        filename_col, time_col = summary.ResultWriter.COLUMNS
+        self.df = pd.DataFrame(rows, columns=[filename_col, time_col])
+        self.columns = (filename_col, time_col)
+        self.df[time_col] = pd.to_datetime(self.df[time_col], format='%Y-%m-%d %H:%M:%S', errors='coerce')
+        self.log(f"数据形状: {self.df.shape}")
+        
+        self.process_data()
+        return True
+    
+    def detect_columns(self, columns):
+        """根据列名识别文件名列和时间列，返回 (文件名列, 时间列)"""
         # 确定列名
         filename_col = None
         time_col = None
@@ -52,7 +2034,7 @@ class EmailAnalyzer:
         possible_filename_cols = ['文件名', 'File', 'file', 'filename', '邮件名', '标题', 'Subject', 'Name']
         possible_time_cols = ['日本时间', '时间', 'Time', 'time', 'JST', '日期', 'Date', '发送时间', 'Timestamp']
         
-        for col in self.df.columns:
+        for col in columns:
             col_str = str(col).lower()
             if not filename_col:
                 for keyword in possible_filename_cols:
@@ -67,24 +2049,120 @@ class EmailAnalyzer:
                         break
         
         # 如果没有自动识别到，使用前两列
-        if not filename_col and len(self.df.columns) > 0:
-            filename_col = self.df.columns[0]
-            print(f"使用第一列作为文件名列: {filename_col}")
+        if not filename_col and len(columns) > 0:
+            filename_col = columns[0]
+            self.log(f"使用第一列作为文件名列: {filename_col}")
         
-        if not time_col and len(self.df.columns) > 1:
-            time_col = self.df.columns[1]
-            print(f"使用第二列作为时间列: {time_col}")
+        if not time_col and len(columns) > 1:
+            time_col = columns[1]
+            self.log(f"使用第二列作为时间列: {time_col}")
         elif not time_col:
-            time_col = self.df.columns[0]
-            print(f"使用第一列作为时间列: {time_col}")
+            time_col = columns[0]
+            self.log(f"使用第一列作为时间列: {time_col}")
+        
+        return filename_col, time_col
+    
+    def process_data(self, vectorized=True):
+        """处理数据，建立索引
+        
+        vectorized=True 时按列批量解析（默认），False 时使用原来的逐行处理（用于对比）
+        """
+        self.log("\n开始处理数据...")
         
-        print(f"使用列名: 文件名列='{filename_col}', 时间列='{time_col}'")
+        # 读取文件时已经按表头识别过列名的，不再重新识别
+        if self.columns and all(col in self.df.columns for col in self.columns):
+            filename_col, time_col = self.columns
+        else:
+            filename_col, time_col = self.detect_columns(self.df.columns)
+        
+        self.log(f"使用列名: 文件名列='{filename_col}', 时间列='{time_col}'")
+        self.columns = (filename_col, time_col)
         
         # 重置数据结构
         self.data_by_search_id = {}
         self.data_by_thread_id = defaultdict(list)
         self.all_emails = []
         
+        if vectorized:
+            self.build_index_vectorized(filename_col, time_col)
+        else:
+            self.build_index_rowwise(filename_col, time_col)
+        self.build_thread_timelines()
+        with metrics.timer('index'):
+            self.search_id_index = SearchIdNgramIndex(self.data_by_search_id.keys())
+        self.print_stats()
+    
+    def process_stream(self, path, chunk_size=None):
+        """流式处理: 按块读取数据文件并逐块累积索引，不保留整个DataFrame
+        
+        内存峰值约为一块数据加上紧凑的索引（文件名保存为UTF-8字节）
+        """
+        chunk_size = chunk_size or STREAM_CHUNK_SIZE
+        self.log(f"\n开始流式处理数据（每块 {chunk_size} 行）...")
+        
+        self.df = None
+        self.columns = None
+        self.data_by_search_id = {}
+        self.data_by_thread_id = defaultdict(list)
+        self.all_emails = []
+        
+        builder = IndexBuilder(keep_names=True)
+        total = 0
+        for chunk in metrics.timed_iter('load', self.iter_chunks(path, chunk_size)):
+            if total == 0:
+                filename_col, time_col = self.columns
+                self.log(f"使用列名: 文件名列='{filename_col}', 时间列='{time_col}'")
+            builder.add(chunk, *self.columns)
+            total += len(chunk)
+            self.log(f"  已读取 {total} 行")
+        
+        if self.columns is None:
+            print("数据文件为空")
+            return False
+        
+        self.all_emails, self.data_by_thread_id, self.data_by_search_id = builder.build(None, *self.columns)
+        self.build_thread_timelines()
+        with metrics.timer('index'):
+            self.search_id_index = SearchIdNgramIndex(self.data_by_search_id.keys())
+        self.print_stats()
+        return True
+    
+    def print_stats(self):
+        """显示索引的统计信息"""
+        self.log(f"\n数据处理完成:")
+        self.log(f"  有效邮件记录: {len(self.all_emails)}")
+        self.log(f"  唯一线程ID数量: {len(self.data_by_thread_id)}")
+        self.log(f"  包含搜索ID的记录: {len(self.data_by_search_id)}")
+        
+        # 显示线程ID统计（按类型）
+        thread_stats = defaultdict(int)
+        for thread_id in self.data_by_thread_id.keys():
+            if thread_id and thread_id != "未知":
+                if thread_id.startswith('A') and len(thread_id) == 4:  # Axxx
+                    thread_stats['A格式'] += 1
+                elif thread_id.startswith('B') and len(thread_id) == 4:  # Bxxx
+                    thread_stats['B格式'] += 1
+                elif thread_id.startswith('C') and len(thread_id) == 4:  # Cxxx
+                    thread_stats['C格式'] += 1
+                elif thread_id.startswith('INC'):
+                    thread_stats['INC编号'] += 1
+                elif 'C' in thread_id and len(thread_id) > 4:  # 类似C29497931的长格式
+                    thread_stats['长C格式'] += 1
+                else:
+                    thread_stats['其他'] += 1
+        
+        if thread_stats:
+            self.log(f"\n线程ID类型统计:")
+            for type_name, count in thread_stats.items():
+                self.log(f"  {type_name}: {count}个")
+        
+        if self.data_by_search_id:
+            self.log(f"\n搜索ID示例:")
+            for i, sid in enumerate(itertools.islice(self.data_by_search_id, 10)):
+                self.log(f"  {i+1}. {sid}")
+    
+    def build_index_rowwise(self, filename_col, time_col):
+        """逐行处理数据，建立索引"""
         # 处理每一行数据
         for idx in range(len(self.df)):
             try:
@@ -96,6 +2174,7 @@ class EmailAnalyzer:
                     
                 filename = row[filename_col]
                 if pd.isna(filename) or str(filename).strip() == '':
+                    metrics.count('rows_empty_filename')
                     continue
                 
                 filename_str = str(filename).strip()
@@ -105,32 +2184,21 @@ class EmailAnalyzer:
                 if time_col in row.index:
                     time_str = row[time_col]
                     if pd.notna(time_str):
-                        try:
-                            time_val = pd.to_datetime(time_str)
-                        except:
-                            # 尝试其他格式
-                            try:
-                                time_val = pd.to_datetime(time_str, format='%Y-%m-%d %H:%M:%S')
-                            except:
-                                try:
-                                    time_val = pd.to_datetime(time_str, format='%Y/%m/%d %H:%M:%S')
-                                except:
-                                    try:
-                                        time_val = pd.to_datetime(time_str, format='%Y-%m-%d %H:%M')
-                                    except:
-                                        try:
-                                            time_val = pd.to_datetime(time_str, format='%Y/%m/%d %H:%M')
-                                        except:
-                                            continue
+                        with metrics.timer('parse'):
+                            time_val = parse_time_value(time_str)
                 
                 if time_val is None:
+                    metrics.count('rows_unparsable_time')
                     continue
                 
                 # 提取各种ID
-                email_id = self.extract_email_id(filename_str)
-                thread_id = self.extract_thread_id(filename_str)
-                search_id = self.extract_search_id(filename_str)
-                reply_flag = self.is_reply(filename_str)
+                with metrics.timer('classify'):
+                    email_id = self.extract_email_id(filename_str)
+                    thread_id = self.extract_thread_id(filename_str)
+                    search_id = self.extract_search_id(filename_str)
+                    reply_flag = self.is_reply(filename_str)
+                if thread_id == "未知":
+                    metrics.count('records_unknown_thread')
                 
                 # 创建邮件信息对象
                 email_info = {
@@ -158,39 +2226,97 @@ class EmailAnalyzer:
                 continue
         
         # 按时间排序所有邮件
-        self.all_emails.sort(key=lambda x: x['时间'])
+        with metrics.timer('index'):
+            self.all_emails.sort(key=lambda x: x['时间'])
+    
+    def build_index_vectorized(self, filename_col, time_col):
+        """按列批量解析时间，用编译好的规则提取ID，建立按列保存的记录和索引（结果与逐行处理相同）"""
+        # 使用位置索引（原始行号 = 位置 + 2）
+        builder = IndexBuilder()
+        builder.add(self.df.reset_index(drop=True), filename_col, time_col)
+        self.all_emails, self.data_by_thread_id, self.data_by_search_id = builder.build(
+            self.df, filename_col, time_col)
+    
+    def add_emails(self, rows):
+        """追加新邮件，合并到已按时间排序的记录和各索引中，不重新处理已有的数据
         
-        print(f"\n数据处理完成:")
-        print(f"  有效邮件记录: {len(self.all_emails)}")
-        print(f"  唯一线程ID数量: {len(self.data_by_thread_id)}")
-        print(f"  包含搜索ID的记录: {len(self.data_by_search_id)}")
+        rows为DataFrame（含文件名列和时间列），或[文件名, 时间]的列表（如summary的扫描结果）。
+        新记录追加到各数组、各线程和三元组倒排列表的GrowableArray末尾（均摊O(k log k)，k为新记录数；
+        第一次追加时要建立ID的dict、复制到缓冲区，为O(n)），已有记录的位置不变；
+        另外只重建涉及到的线程的时间线；
+        同一搜索ID的新邮件覆盖原来的记录。结果与把新行接在数据后面重新处理相同。返回追加的有效记录数
+        """
+        store = self.all_emails
+        if isinstance(store, SQLiteEmailList):
+            raise ValueError("SQLite模式下不能追加邮件，请更新数据文件后重新加载")
+        columns = self.columns or tuple(load_summary_module().ResultWriter.COLUMNS)
+        if not isinstance(rows, pd.DataFrame):
+            rows = pd.DataFrame(list(rows), columns=list(columns))
+        missing = [col for col in columns if col not in rows.columns]
+        if missing:
+            raise ValueError(f"新数据缺少列: {missing}")
+        filename_col, time_col = columns
         
-        # 显示线程ID统计（按类型）
-        thread_stats = defaultdict(int)
-        for thread_id in self.data_by_thread_id.keys():
-            if thread_id and thread_id != "未知":
-                if thread_id.startswith('A') and len(thread_id) == 4:  # Axxx
-                    thread_stats['A格式'] += 1
-                elif thread_id.startswith('B') and len(thread_id) == 4:  # Bxxx
-                    thread_stats['B格式'] += 1
-                elif thread_id.startswith('C') and len(thread_id) == 4:  # Cxxx
-                    thread_stats['C格式'] += 1
-                elif thread_id.startswith('INC'):
-                    thread_stats['INC编号'] += 1
-                elif 'C' in thread_id and len(thread_id) > 4:  # 类似C29497931的长格式
-                    thread_stats['长C格式'] += 1
-                else:
-                    thread_stats['其他'] += 1
+        # 还没有按列保存的记录（未加载数据或逐行处理模式）: 合并后重新处理
+        if not isinstance(store, EmailRecordStore) or not len(store):
+            before = len(store)
+            self.df = rows.reset_index(drop=True) if self.df is None else pd.concat([self.df, rows], ignore_index=True)
+            self.columns = columns
+            self.process_data(vectorized=isinstance(store, EmailRecordStore) or not store)
+            return len(self.all_emails) - before
         
-        if thread_stats:
-            print(f"\n线程ID类型统计:")
-            for type_name, count in thread_stats.items():
-                print(f"  {type_name}: {count}个")
+        # 新行的位置接在源数据后面
+        chunk = rows.reset_index(drop=True)
+        chunk.index = pd.RangeIndex(store.row_count, store.row_count + len(chunk))
         
-        if self.data_by_search_id:
-            print(f"\n搜索ID示例:")
-            for i, (sid, _) in enumerate(list(self.data_by_search_id.items())[:10]):
-                print(f"  {i+1}. {sid}")
+        thread_index = self.data_by_thread_id
+        search_index = self.data_by_search_id
+        builder = IndexBuilder(keep_names=store.names is not None,
+                               thread_ids=thread_index.thread_ids, search_ids=search_index.search_ids)
+        builder.tz = store.tz
+        builder.has_times = True
+        builder.add(chunk, filename_col, time_col)
+        new = builder.collect()
+        
+        # 记录接在数组末尾，源数据保存为单独的块（读取analyzer.df时才合并）
+        first = len(store)
+        frame = chunk.reindex(columns=store.df.columns).reset_index(drop=True) if store.df is not None else None
+        store.append(new, frame, len(chunk))
+        k = len(new['rows'])
+        if k == 0:
+            return 0
+        positions = np.arange(first, first + k)
+        
+        # 线程索引和搜索ID索引: 只更新涉及到的线程和搜索ID，已有记录的位置不变
+        touched = thread_index.append(new['thread_codes'], positions, builder.threads.new_values())
+        new_search_ids = builder.searches.new_values()
+        search_index.append(new['search_codes'], positions, new_search_ids)
+        store.thread_ids = thread_index.thread_ids.values
+        store.search_ids = search_index.search_ids.values
+        with metrics.timer('index'):
+            self.search_id_index.add(new_search_ids.tolist())
+        
+        # 时间线: 只重建涉及到的线程
+        for code in touched.tolist():
+            self.thread_timelines[thread_index.thread_ids[code]] = thread_index.timeline(code)
+        
+        self.log(f"追加邮件记录: {k} 条（共 {len(store)} 条）")
+        return k
+    
+    @metrics.timed('index')
+    def build_thread_timelines(self):
+        """为每个线程预先建立按时间排序的时间数组（加载时执行一次，查询时不再复制和排序）"""
+        self.thread_timelines = {}
+        
+        if isinstance(self.data_by_thread_id, ThreadIndex):
+            index = self.data_by_thread_id
+            for code, thread_id in enumerate(index.thread_ids):
+                self.thread_timelines[thread_id] = index.timeline(code)
+        else:
+            for thread_id, emails in self.data_by_thread_id.items():
+                emails = sorted(emails, key=lambda x: x['时间'])
+                self.thread_timelines[thread_id] = ThreadTimeline(
+                    to_ns(e['时间'] for e in emails), [e['是回复'] for e in emails], emails=emails)
     
     def extract_email_id(self, filename):
         """从文件名中提取邮件ID"""
@@ -199,17 +2325,7 @@ class EmailAnalyzer:
         
         filename_str = str(filename)
         
-        patterns = [
-            r'\[.*?:(\d{5})\]',
-            r'_(\d{5})\.eml',
-            r'(\d{5})\.eml',
-            r'\[INC(\d{8})\]',  # 8位INC编号
-            r'INC(\d{8})',
-            r'(\d{5})_',
-            r'_(\d{5})_',
-        ]
-        
-        for pattern in patterns:
+        for pattern in EMAIL_ID_PATTERNS:
             match = re.search(pattern, filename_str)
             if match:
                 return match.group(1)
@@ -225,54 +2341,22 @@ class EmailAnalyzer:
         
         # 首先检查是否是长C编号（如C29497931） - 这些不是真正的C格式线程ID
         # 长C编号通常是8位或更多数字
-        long_c_pattern = r'[^a-zA-Z](C\d{8,})[^a-zA-Z]'
-        long_c_match = re.search(long_c_pattern, filename_str)
+        long_c_match = re.search(LONG_C_PATTERN, filename_str)
         if long_c_match:
             # 这是长C编号，不是真正的C格式线程ID
             return "未知"
         
         # 然后检查真正的短格式线程ID
-        patterns = [
-            # 真正的Cxxx格式 - 需要确保是短格式且后面有合适的上下文
-            r'[^a-zA-Z](C\d{3})[^\.a-zA-Z]',  # C088后面不是点或字母
-            r'_C(\d{3})\.eml',  # _C088.eml
-            r'問い合わせが入りました_C(\d{3})\.eml',  # 問い合わせが入りました_C088.eml
-            r'【Intune切り替え】問い合わせが入りました_C(\d{3})\.eml',
-            
-            # Axxx格式
-            r'[^a-zA-Z](A\d{3})[^\.a-zA-Z]',
-            r'_A(\d{3})\.eml',
-            
-            # Bxxx格式
-            r'[^a-zA-Z](B\d{3})[^\.a-zA-Z]',
-            r'_B(\d{3})\.eml',
-            
-            # 通用短格式（3-4位数字）
-            r'[^a-zA-Z]([A-Z]\d{3})[^\.a-zA-Z\d]',  # 字母+3位数字，后面不是点、字母或数字
-            r'_([A-Z]\d{3})\.eml',  # _A553.eml格式
-            
-            # 最后尝试宽松匹配
-            r'([A-Z]\d{3})(?![a-zA-Z\d])',  # 字母+3位数字，后面不是字母或数字
-        ]
-        
-        for pattern in patterns:
+        for pattern in THREAD_ID_PATTERNS:
             match = re.search(pattern, filename_str, re.IGNORECASE)
             if match:
                 thread_id = match.group(1).upper()
                 # 验证是真正的短格式线程ID（不是长C编号）
-                if (thread_id.startswith(('A', 'B', 'C')) and 
-                    len(thread_id) == 4 and  # A/B/C + 3位数字
-                    thread_id[1:].isdigit()):
+                if is_short_thread_id(thread_id):
                     return thread_id
         
         # 检查INC编号
-        inc_patterns = [
-            r'\[INC(\d+)\]',
-            r'INC(\d+)',
-            r'【INC(\d+)】',
-        ]
-        
-        for pattern in inc_patterns:
+        for pattern in INC_PATTERNS:
             match = re.search(pattern, filename_str)
             if match:
                 inc_num = match.group(1)
@@ -289,13 +2373,7 @@ class EmailAnalyzer:
         
         filename_str = str(filename)
         
-        patterns = [
-            r'\[(mdmswitch_help:\d+)\]',
-            r'\[(\w+:\d+)\]',
-            r'(\w+:\d+)',
-        ]
-        
-        for pattern in patterns:
+        for pattern in SEARCH_ID_PATTERNS:
             match = re.search(pattern, filename_str)
             if match:
                 return match.group(1)
@@ -308,19 +2386,46 @@ class EmailAnalyzer:
             return False
         
         filename_str = str(filename)
-        reply_indicators = ['Re:', '返信', 'RE:', 're:', '回复', '答复']
-        return any(indicator in filename_str for indicator in reply_indicators)
+        return any(indicator in filename_str for indicator in REPLY_INDICATORS)
+    
+    def find_search_ids(self, partial, limit=None):
+        """按部分字符串查找搜索ID（不区分大小写），返回排好序的候选列表
+        
+        例如 "03533" 可以找到 "mdmswitch_help:03533"
+        """
+        return self.search_id_index.lookup(partial, limit)
+    
+    def guess_thread_ids(self, filename, thread_id):
+        """线程ID未知时，从文件名中查找可能关联的、已存在的线程ID"""
+        possible_thread_ids = []
+        
+        # 查找可能的关联邮件编号
+        for regex in FALLBACK_THREAD_REGEXES:
+            match = regex.search(filename)
+            if match:
+                tid = match.group(1).upper()
+                if tid != thread_id and tid in self.data_by_thread_id:
+                    possible_thread_ids.append(tid)
+        return possible_thread_ids
     
+    def log(self, *args, **kwargs):
+        """显示处理和查询过程（verbose为False时不显示，如在查询服务中或设置了quiet）"""
+        if self.verbose:
+            print(*args, **kwargs)
+    
+    @metrics.timed('query', latency=True)
     def find_closest_response(self, search_id):
         """查找指定搜索ID的最接近回复"""
-        print(f"\n查找搜索ID: {search_id}")
+        self.log(f"\n查找搜索ID: {search_id}")
+        metrics.count('queries')
         
         if search_id not in self.data_by_search_id:
-            # 尝试模糊匹配
-            matching_ids = [sid for sid in self.data_by_search_id.keys() 
-                          if search_id.lower() in sid.lower()]
+            # 尝试模糊匹配（使用三元组索引，结果按确定的规则排序）
+            metrics.count('fuzzy_fallbacks')
+            matching_ids = self.find_search_ids(search_id, limit=1)
             if not matching_ids:
-                print(f"  未找到搜索ID: {search_id}")
+                metrics.count('search_id_not_found')
+                self.log(f"  未找到搜索ID: {search_id}")
                 return {
                     '搜索ID': search_id,
                     '目标邮件名包含': '未找到',
@@ -334,7 +2439,7 @@ class EmailAnalyzer:
                     '回复邮件数': 0,
                     '状态': '未找到搜索ID'
                 }
-            print(f"  找到匹配的搜索ID: {matching_ids[0]}")
+            self.log(f"  找到匹配的搜索ID: {matching_ids[0]}")
             search_id = matching_ids[0]
         
         target_email = self.data_by_search_id[search_id]
@@ -342,35 +2447,21 @@ class EmailAnalyzer:
         target_thread_id = target_email['线程ID']
         target_filename = target_email['文件名']
         
-        print(f"  目标邮件: {target_filename[:80]}...")
-        print(f"  目标时间: {target_time.strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"  线程ID: {target_thread_id}")
+        self.log(f"  目标邮件: {target_filename[:80]}...")
+        self.log(f"  目标时间: {target_time.strftime('%Y-%m-%d %H:%M:%S')}")
+        self.log(f"  线程ID: {target_thread_id}")
         
         if target_thread_id == "未知" or target_thread_id not in self.data_by_thread_id:
-            print(f"  ⚠ 未找到线程中的其他邮件 (线程ID: {target_thread_id})")
+            self.log(f"  ⚠ 未找到线程中的其他邮件 (线程ID: {target_thread_id})")
             
             # 尝试从文件名中直接提取可能的关联
-            possible_thread_ids = []
-            filename = target_filename
-            
-            # 查找可能的关联邮件编号
-            thread_patterns = [
-                r'[^a-zA-Z]([A-Z]\d{3})[^\.a-zA-Z]',
-                r'_([A-Z]\d{3})\.eml',
-            ]
-            
-            for pattern in thread_patterns:
-                match = re.search(pattern, filename, re.IGNORECASE)
-                if match:
-                    tid = match.group(1).upper()
-                    if tid != target_thread_id and tid in self.data_by_thread_id:
-                        possible_thread_ids.append(tid)
+            possible_thread_ids = self.guess_thread_ids(target_filename, target_thread_id)
             
             if possible_thread_ids:
-                print(f"  找到可能的关联线程ID: {possible_thread_ids}")
+                self.log(f"  找到可能的关联线程ID: {possible_thread_ids}")
                 # 使用第一个可能的线程ID
                 target_thread_id = possible_thread_ids[0]
-                print(f"  使用线程ID: {target_thread_id}")
+                self.log(f"  使用线程ID: {target_thread_id}")
             else:
                 return {
                     '搜索ID': search_id,
@@ -386,30 +2477,30 @@ class EmailAnalyzer:
                     '状态': '线程中无其他邮件'
                 }
         
-        thread_emails = self.data_by_thread_id[target_thread_id].copy()
-        thread_emails.sort(key=lambda x: x['时间'])
+        timeline = self.thread_timelines[target_thread_id]
+        thread_count = len(timeline)
         
-        print(f"  找到 {len(thread_emails)} 封同一线程的邮件")
+        self.log(f"  找到 {thread_count} 封同一线程的邮件")
         
         # 显示线程中的邮件时间线
-        if len(thread_emails) <= 10:  # 只显示少量邮件时显示时间线
-            print(f"  线程 {target_thread_id} 邮件时间线:")
-            for i, email in enumerate(thread_emails):
+        if self.verbose and thread_count <= 10:  # 只显示少量邮件时显示时间线
+            self.log(f"  线程 {target_thread_id} 邮件时间线:")
+            for i in range(thread_count):
+                email = timeline.email(i)
                 time_str = email['时间'].strftime('%m-%d %H:%M:%S')
                 is_target = " ←目标" if email.get('搜索ID') == search_id else ""
                 reply_mark = " [回复]" if email['是回复'] else ""
-                print(f"    {i+1:3d}. {time_str}{reply_mark}{is_target}")
+                self.log(f"    {i+1:3d}. {time_str}{reply_mark}{is_target}")
         
-        # 查找目标邮件之后的所有邮件
-        responses_after = []
-        for email in thread_emails:
-            if email['时间'] > target_time:
-                responses_after.append(email)
+        # 二分查找目标邮件之后的第一封邮件，之后的邮件数由位置相减得到
+        target_ns = pd.Timestamp(target_time).value
+        first_after = timeline.first_after(target_ns)
+        responses_count = thread_count - first_after
         
-        print(f"  目标邮件之后的邮件: {len(responses_after)} 封")
+        self.log(f"  目标邮件之后的邮件: {responses_count} 封")
         
-        if not responses_after:
-            print("  ⚠ 目标邮件之后没有其他邮件")
+        if responses_count == 0:
+            self.log("  ⚠ 目标邮件之后没有其他邮件")
             return {
                 '搜索ID': search_id,
                 '目标邮件名包含': target_thread_id,
@@ -419,43 +2510,26 @@ class EmailAnalyzer:
                 '回复间隔': 'N/A',
                 '回复间隔(小时)': 'N/A',
                 '回复类型': 'N/A',
-                '线程邮件数': len(thread_emails),
+                '线程邮件数': thread_count,
                 '回复邮件数': 0,
                 '状态': '无回复'
             }
         
-        # 优先查找回复邮件
-        reply_responses = [r for r in responses_after if r['是回复']]
+        # 优先查找回复邮件: 目标时间之后的第一封回复就是时间最近的
+        reply_pos, reply_count = timeline.first_reply_after(target_ns)
         
-        if reply_responses:
-            # 从回复邮件中找时间最近的
-            nearest_response = None
-            min_time_diff = None
-            
-            for response in reply_responses:
-                time_diff = response['时间'] - target_time
-                if min_time_diff is None or time_diff < min_time_diff:
-                    min_time_diff = time_diff
-                    nearest_response = response
-            
+        if reply_pos is not None:
+            nearest_response = timeline.email(reply_pos)
             response_type = "回复邮件"
-            print(f"  找到 {len(reply_responses)} 封回复邮件")
+            self.log(f"  找到 {reply_count} 封回复邮件")
         else:
-            # 如果没有回复邮件，找时间最近的任何邮件
-            nearest_response = None
-            min_time_diff = None
-            
-            for response in responses_after:
-                time_diff = response['时间'] - target_time
-                if min_time_diff is None or time_diff < min_time_diff:
-                    min_time_diff = time_diff
-                    nearest_response = response
-            
+            # 如果没有回复邮件，使用时间最近的任何邮件
+            nearest_response = timeline.email(first_after)
             response_type = "非回复邮件"
-            print(f"  无回复邮件，使用最近的非回复邮件")
+            self.log(f"  无回复邮件，使用最近的非回复邮件")
         
-        print(f"  最近回复时间: {nearest_response['时间'].strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"  回复邮件ID: {nearest_response['邮件ID']}")
+        self.log(f"  最近回复时间: {nearest_response['时间'].strftime('%Y-%m-%d %H:%M:%S')}")
+        self.log(f"  回复邮件ID: {nearest_response['邮件ID']}")
         
         # 计算时间差
         time_diff = nearest_response['时间'] - target_time
@@ -472,7 +2546,7 @@ class EmailAnalyzer:
         else:
             interval_str = f"{minutes}分钟"
         
-        print(f"  回复间隔: {interval_str} ({total_hours:.2f}小时)")
+        self.log(f"  回复间隔: {interval_str} ({total_hours:.2f}小时)")
         
         return {
             '搜索ID': search_id,
@@ -483,92 +2557,403 @@ class EmailAnalyzer:
             '回复间隔': interval_str,
             '回复间隔(小时)': round(total_hours, 2),
             '回复类型': response_type,
-            '线程邮件数': len(thread_emails),
-            '回复邮件数': len(responses_after),
+            '线程邮件数': thread_count,
+            '回复邮件数': responses_count,
             '状态': '成功'
         }
     
+    @metrics.timed('query')
+    def compute_all_responses(self, search_ids=None):
+        """一次性计算所有搜索ID（或指定的搜索ID）的最近回复，返回DataFrame
+        
+        结果列和判断规则与find_closest_response相同，但不逐个查询: 用按线程分组的
+        merge_asof(direction='forward')一次找出目标之后的第一封邮件和第一封回复邮件
+        """
+        if search_ids is None:
+            search_ids = list(self.data_by_search_id.keys())
+        
+        resolved = self.resolve_search_ids(search_ids)
+        targets = self.locate_responses([sid for sid in resolved if sid is not None])
+        in_thread = targets['在线程中'].to_numpy()
+        
+        n = len(targets)
+        thread_count = np.zeros(n, dtype=np.int64)
+        thread_count[in_thread] = [len(self.thread_timelines[t]) for t in targets.loc[in_thread, '线程ID']]
+        thread_count[~in_thread] = 1
+        after_pos = targets['之后位置']
+        responses_count = np.where(after_pos.notna(), thread_count - after_pos.fillna(0), 0).astype(np.int64)
+        
+        use_reply = targets['使用回复'].to_numpy()
+        response_pos = targets['回复位置']
+        success = response_pos.notna().to_numpy()
+        response_ns = targets['回复ns'].to_numpy()
+        
+        response_ids = np.full(n, 'N/A', dtype=object)
+        store_rows, store_positions = [], []
+        for i, thread_id, pos in zip(np.flatnonzero(success), targets['线程ID'].to_numpy()[success],
+                                     response_pos[success].astype(np.int64).tolist()):
+            timeline = self.thread_timelines[thread_id]
+            if timeline.store is not None:
+                store_rows.append(i)
+                store_positions.append(timeline.positions[pos])
+            else:
+                response_ids[i] = timeline.email(pos)['邮件ID']
+        if store_rows:
+            response_ids[store_rows] = self.all_emails.email_ids(np.array(store_positions))
+        
+        # 时间差（与timedelta的days/seconds相同的取整方式）
+        diff_ns = response_ns - targets['ns'].to_numpy()
+        total_seconds = diff_ns // 10**9
+        days = total_seconds // 86400
+        hours = (total_seconds % 86400) // 3600
+        minutes = (total_seconds % 3600) // 60
+        total_hours = np.array([round(h, 2) for h in (diff_ns / 1e9 / 3600).tolist()], dtype=object)
+        
+        days_s, hours_s, minutes_s = (pd.Series(a).astype(str) for a in (days, hours, minutes))
+        interval = np.where(days > 0, days_s + '天' + hours_s + '小时' + minutes_s + '分钟',
+                            np.where(hours > 0, hours_s + '小时' + minutes_s + '分钟', minutes_s + '分钟'))
+        
+        target_str = self.format_ns(targets['ns'].to_numpy())
+        response_str = self.format_ns(response_ns)
+        
+        status = np.where(success, '成功', np.where(in_thread, '无回复', '线程中无其他邮件'))
+        found = pd.DataFrame({
+            '搜索ID': targets['搜索ID'].to_numpy(),
+            '目标邮件名包含': targets['线程ID'].to_numpy(),
+            '目标邮件时间': target_str,
+            '最近的返信时间': np.where(success, response_str, '无回复'),
+            '回复邮件ID': response_ids,
+            '回复间隔': np.where(success, interval, 'N/A'),
+            '回复间隔(小时)': np.where(success, total_hours, 'N/A'),
+            '回复类型': np.where(success, np.where(use_reply, '回复邮件', '非回复邮件'), 'N/A'),
+            '线程邮件数': thread_count,
+            '回复邮件数': np.where(success, responses_count, 0),
+            '状态': status,
+        })
+        
+        # 未找到的搜索ID按原顺序插回
+        results = pd.DataFrame(index=range(len(resolved)), columns=found.columns, dtype=object)
+        found_rows = [i for i, sid in enumerate(resolved) if sid is not None]
+        results.iloc[found_rows] = found.to_numpy(dtype=object)
+        missing_rows = [i for i, sid in enumerate(resolved) if sid is None]
+        for i in missing_rows:
+            results.iloc[i] = [search_ids[i], '未找到', 'N/A', '未找到邮件', 'N/A', 'N/A', 'N/A', 'N/A', 0, 0, '未找到搜索ID']
+        return results
+    
+    def resolve_search_ids(self, search_ids):
+        """解析搜索ID: 不存在时与单个查询一样做模糊匹配，找不到时为None"""
+        metrics.count('queries', len(search_ids))
+        resolved = []
+        for search_id in search_ids:
+            if search_id not in self.data_by_search_id:
+                metrics.count('fuzzy_fallbacks')
+                matching_ids = self.find_search_ids(search_id, limit=1)
+                search_id = matching_ids[0] if matching_ids else None
+                if search_id is None:
+                    metrics.count('search_id_not_found')
+            resolved.append(search_id)
+        return resolved
+    
+    def locate_responses(self, search_ids):
+        """找出每个目标邮件之后的第一封邮件和第一封回复邮件（compute_all_responses和response_stats共用）
+        
+        search_ids为已存在的搜索ID。返回target_table加上: 线程类型（按原来的线程ID）、在线程中、
+        之后位置（之后第一封邮件的线程内位置）、使用回复、回复位置（有回复邮件时为回复邮件，否则为之后
+        第一封邮件；都没有时为NaN）、回复ns（没有时为0）。线程ID为从文件名猜测关联线程后的结果
+        """
+        targets = self.target_table(search_ids)
+        
+        # 线程ID未知时，与单个查询一样从文件名中找关联线程
+        threads = targets['线程ID'].tolist()
+        families = targets['线程ID'].map({t: thread_family(t) for t in set(threads)}).tolist()
+        for i, (thread_id, search_id) in enumerate(zip(threads, targets['搜索ID'])):
+            if thread_id == "未知" or thread_id not in self.data_by_thread_id:
+                filename = self.data_by_search_id[search_id]['文件名']
+                families[i] = thread_family(thread_id, filename)
+                possible_thread_ids = self.guess_thread_ids(filename, thread_id)
+                if possible_thread_ids:
+                    threads[i] = possible_thread_ids[0]
+        targets['线程ID'] = threads
+        targets['线程类型'] = families
+        in_thread = targets['线程ID'].isin(self.thread_timelines.keys())
+        
+        # 目标之后的第一封邮件 / 第一封回复邮件（严格晚于目标时间），"行"为在emails中的行号
+        emails = self.timeline_table()
+        emails['行'] = np.arange(len(emails))
+        left = targets.loc[in_thread, ['线程ID', 'ns']].reset_index().sort_values('ns', kind='stable')
+        
+        def first_after(right):
+            if left.empty:
+                return pd.DataFrame({'位置': pd.Series(dtype=float), '行': pd.Series(dtype=float)})
+            return pd.merge_asof(left, right, on='ns', by='线程ID', direction='forward',
+                                 allow_exact_matches=False).set_index('index')
+        
+        first_any = first_after(emails).reindex(targets.index)
+        first_reply = first_after(emails[emails['是回复']]).reindex(targets.index)
+        
+        # 有回复邮件时用回复邮件，否则用目标之后最近的任何邮件
+        use_reply = first_reply['位置'].notna()
+        response_row = first_reply['行'].where(use_reply, first_any['行'])
+        found = response_row.notna().to_numpy()
+        response_ns = np.zeros(len(targets), dtype=np.int64)
+        response_ns[found] = emails['ns'].to_numpy()[response_row[found].astype(np.int64)]
+        
+        targets['在线程中'] = in_thread
+        targets['之后位置'] = first_any['位置']
+        targets['使用回复'] = use_reply
+        targets['回复位置'] = first_reply['位置'].where(use_reply, first_any['位置'])
+        targets['回复ns'] = response_ns
+        return targets
+    
+    @metrics.timed('query')
+    def response_stats(self, search_ids=None, period='day', within_hours=None, by_family=True):
+        """按线程类型和目标邮件的日期（或周）统计所有搜索ID（或指定的搜索ID）的回复时间，返回DataFrame
+        
+        每组: 邮件数、已回复数、回复间隔（小时）的平均/p50/p90/p99，以及N小时内回复的比例
+        （within_hours，默认为SLA_HOURS；分母为该组全部邮件，没有回复的也计入）。
+        回复的判断与compute_all_responses相同，整列计算，不逐个查询。
+        period为'day'、'week'（按周一开始的周）或None（不按时间分组）；by_family=False时不按线程类型分组
+        """
+        within_hours = SLA_HOURS if within_hours is None else within_hours
+        if search_ids is None:
+            search_ids = list(self.data_by_search_id.keys())
+        targets = self.locate_responses([sid for sid in self.resolve_search_ids(search_ids) if sid is not None])
+        
+        success = targets['回复位置'].notna().to_numpy()
+        diff_ns = targets['回复ns'].to_numpy() - targets['ns'].to_numpy()
+        table = pd.DataFrame({
+            '线程类型': pd.Categorical(targets['线程类型'] if by_family else ['全部'] * len(targets),
+                                    categories=THREAD_FAMILIES if by_family else ['全部']),
+            '小时': np.where(success, diff_ns / 3.6e12, np.nan),
+        })
+        keys = ['线程类型']
+        if period is not None:
+            local = self.local_times(targets['ns'].to_numpy())
+            if period == 'day':
+                table['日期'] = local.strftime('%Y-%m-%d')
+                keys.append('日期')
+            elif period == 'week':
+                week_start = local.normalize() - pd.to_timedelta(local.dayofweek, unit='D')
+                table['周'] = week_start.strftime('%Y-%m-%d')
+                keys.append('周')
+            else:
+                raise ValueError(f"period只能是'day'、'week'或None: {period}")
+        
+        grouped = table.groupby(keys, observed=True, sort=True)['小时']
+        stats = pd.DataFrame({
+            '邮件数': grouped.size(),
+            '已回复': grouped.count(),
+            '平均(小时)': grouped.mean(),
+        })
+        # 没有目标邮件时unstack的结果没有分位数列，补上空列
+        quantiles = grouped.quantile([0.5, 0.9, 0.99]).unstack().reindex(columns=[0.5, 0.9, 0.99])
+        for q, label in ((0.5, 'p50(小时)'), (0.9, 'p90(小时)'), (0.99, 'p99(小时)')):
+            stats[label] = quantiles[q]
+        stats = stats.round(2)
+        for hours in within_hours:
+            within = (table['小时'] <= hours).groupby([table[key] for key in keys], observed=True).mean()
+            stats[f"{hours}小时内回复比例"] = within.round(4)
+        return stats.reset_index()
+    
+    def target_table(self, search_ids):
+        """搜索ID对应的目标邮件: 搜索ID、线程ID、时间(纳秒)"""
+        index = self.data_by_search_id
+        if isinstance(index, SearchIndex):
+            store = index.store
+            pos = index.positions[index.search_ids.get_indexer(search_ids)]
+            # 编码-1（没有线程ID）取到末尾的"未知"
+            thread_ids = np.append(store.thread_ids, "未知")[store.thread_codes[pos]]
+            return pd.DataFrame({
+                '搜索ID': search_ids,
+                '线程ID': thread_ids,
+                'ns': store.times[pos].astype(np.int64),
+            })
+        emails = [index[sid] for sid in search_ids]
+        return pd.DataFrame({
+            '搜索ID': search_ids,
+            '线程ID': [e['线程ID'] for e in emails],
+            'ns': to_ns(e['时间'] for e in emails) if emails else np.array([], dtype=np.int64),
+        })
+    
+    def timeline_table(self):
+        """所有线程邮件的表: 线程ID、时间(纳秒)、线程内位置、是否回复（按时间排序）"""
+        thread_ids, times, positions, replies = [], [], [], []
+        for thread_id, timeline in self.thread_timelines.items():
+            count = len(timeline)
+            thread_ids.append(np.full(count, thread_id, dtype=object))
+            times.append(timeline.times)
+            positions.append(np.arange(count))
+            reply = np.zeros(count, dtype=bool)
+            reply[timeline.reply_index] = True
+            replies.append(reply)
+        if not times:
+            return pd.DataFrame({'线程ID': pd.Series(dtype=object), 'ns': pd.Series(dtype=np.int64),
+                                 '位置': pd.Series(dtype=np.int64), '是回复': pd.Series(dtype=bool)})
+        table = pd.DataFrame({
+            '线程ID': np.concatenate(thread_ids),
+            'ns': np.concatenate(times).astype(np.int64),
+            '位置': np.concatenate(positions),
+            '是回复': np.concatenate(replies),
+        })
+        return table.sort_values('ns', kind='stable').reset_index(drop=True)
+    
+    def local_times(self, ns):
+        """把int64纳秒数组转换为DatetimeIndex（带时区时为原时区的时间）"""
+        tz = self.all_emails.tz if isinstance(self.all_emails, EmailRecordStore) else (
+            self.all_emails[0]['时间'].tz if self.all_emails else None)
+        index = pd.DatetimeIndex(np.asarray(ns, dtype='datetime64[ns]'))
+        if tz is not None:
+            index = index.tz_localize('UTC').tz_convert(tz)
+        return index
+    
+    def format_ns(self, ns):
+        """把int64纳秒数组格式化为时间字符串（带时区时显示原时区的时间）"""
+        return np.asarray(self.local_times(ns).strftime('%Y-%m-%d %H:%M:%S'), dtype=object)
+    
     def batch_query(self, search_ids):
         """批量查询多个搜索ID"""
-        print(f"\n开始批量处理 {len(search_ids)} 个搜索ID...")
+        self.log(f"\n开始批量处理 {len(search_ids)} 个搜索ID...")
         
         batch_results = []
         
         for i, search_id in enumerate(search_ids):
-            print(f"[{i+1}/{len(search_ids)}] ", end="")
+            self.log(f"[{i+1}/{len(search_ids)}] ", end="")
             
             result = self.find_closest_response(search_id)
             batch_results.append(result)
             
             if result['状态'] == '成功':
-                print(f"  ✓ 找到回复: {result['最近的返信时间']} (间隔:{result['回复间隔']})")
+                self.log(f"  ✓ 找到回复: {result['最近的返信时间']} (间隔:{result['回复间隔']})")
             elif result['状态'] == '未找到搜索ID':
-                print(f"  ✗ 未找到")
+                self.log(f"  ✗ 未找到")
             else:
-                print(f"  ⚠ {result['状态']}")
+                self.log(f"  ⚠ {result['状态']}")
         
         return batch_results
+    
+    def iter_responses(self, search_ids, chunk_size=STREAM_CHUNK_SIZE):
+        """逐块计算搜索ID的回复结果，逐个产生与batch_query相同的结果dict，不保留全部结果
+        
+        search_ids可以是文件等迭代器；内存索引每块用compute_all_responses一次计算，
+        SQLite后端逐个查询（compute_all_responses需要读取全部线程）
+        """
+        search_ids = iter(search_ids)
+        while True:
+            chunk = list(itertools.islice(search_ids, chunk_size))
+            if not chunk:
+                break
+            if self.sqlite_db is not None:
+                for search_id in chunk:
+                    yield self.find_closest_response(search_id)
+            else:
+                yield from self.compute_all_responses(chunk).to_dict('records')
 
 # 修改文件保存函数，解决权限问题
-def safe_save_excel_with_auto_rename(df, base_filename=None):
-    """安全保存Excel文件，自动处理文件占用和权限问题"""
+def write_result_file(df, path, output_format=None):
+    """用summary-version-2.py的ResultWriter按批写入DataFrame（xlsx为常量内存的写入方式）"""
+    summary = load_summary_module()
+    writer = summary.ResultWriter(path, output_format, columns=[str(col) for col in df.columns])
+    try:
+        for start in range(0, len(df), summary.write_batch_size):
+            batch = df.iloc[start:start + summary.write_batch_size].astype(object)
+            # 空值写为空单元格（与to_excel相同）
+            writer.write(batch.where(batch.notna(), None).to_numpy().tolist())
+    finally:
+        writer.close()
+
+def default_file_mode():
+    """新建文件的默认权限（0o666去掉umask），与直接用open创建的文件相同"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+def move_into_place(tmp_path, file_path):
+    """把写好的临时文件放到file_path: 同一磁盘时直接重命名（原子操作）；
+    不同磁盘时先复制到目标文件夹中的临时文件再重命名，不会留下只写了一半的结果文件"""
+    try:
+        os.replace(tmp_path, file_path)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    partial_path = file_path + '.tmp'
+    try:
+        shutil.copyfile(tmp_path, partial_path)
+        os.replace(partial_path, file_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+
+def safe_save_excel_with_auto_rename(df, base_filename=None, output_format=None, locations=None):
+    """安全保存结果文件，自动处理文件占用和权限问题
+    
+    结果只序列化一次: 先写入临时文件，再依次尝试各保存位置。
+    output_format为'xlsx'、'csv'或'parquet'（默认为save_format），locations默认为SAVE_LOCATIONS
+    """
+    output_format = (output_format or save_format).lower()
+    ext = '.' + output_format
     if not base_filename:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         base_filename = f"邮件查询结果_{timestamp}"
     
-    # 确保是.xlsx文件
-    if not base_filename.endswith('.xlsx'):
-        base_filename += '.xlsx'
-    
-    # 尝试多个可能的保存位置
-    save_locations = [
-        os.path.join(os.path.expanduser("~"), "Desktop"),  # 桌面
-        os.path.join(os.path.expanduser("~"), "Downloads"),  # 下载文件夹
-        os.path.dirname(os.path.abspath(__file__)),  # 脚本所在目录
-        "C:\\Temp",  # 临时文件夹
-        ".",  # 当前目录
-    ]
+    # 确保扩展名与格式一致
+    if not base_filename.endswith(ext):
+        base_filename += ext
     
-    # 尝试保存
-    for location in save_locations:
+    fd, tmp_path = tempfile.mkstemp(prefix='邮件结果_', suffix=ext)
+    os.close(fd)
+    try:
         try:
-            # 确保目录存在
-            if not os.path.exists(location):
+            write_result_file(df, tmp_path, output_format)
+            # mkstemp创建的文件只有本人可读写(0600)，重命名后仍保留，改为普通文件的权限
+            os.chmod(tmp_path, default_file_mode())
+        except Exception as e:
+            print(f"✗ 结果写入失败: {e}")
+            return None
+        
+        # 尝试多个可能的保存位置
+        for location in SAVE_LOCATIONS if locations is None else locations:
+            try:
+                # 确保目录存在
+                if not os.path.exists(location):
+                    continue
+                
+                file_path = os.path.join(location, os.path.basename(base_filename))
+                
+                # 如果文件已存在，添加时间戳
+                if os.path.exists(file_path):
+                    name_part, ext = os.path.splitext(file_path)
+                    micro_timestamp = datetime.now().strftime("%H%M%S_%f")[:-3]
+                    file_path = f"{name_part}_{micro_timestamp}{ext}"
+                
+                move_into_place(tmp_path, file_path)
+                print(f"✓ 文件保存成功: {file_path}")
+                return file_path
+                
+            except PermissionError:
+                # 当前位置权限被拒绝，尝试下一个位置
                 continue
+            except Exception as e:
+                # 其他错误，记录但继续尝试
+                print(f"  在 {location} 保存失败: {e}")
+                continue
+        
+        # 如果所有位置都失败，尝试使用绝对唯一的文件名
+        try:
+            # 在当前目录创建绝对唯一的文件名
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
+            unique_filename = f"邮件结果_{timestamp}{os.path.splitext(base_filename)[1]}"
             
-            file_path = os.path.join(location, os.path.basename(base_filename))
-            
-            # 如果文件已存在，添加时间戳
-            if os.path.exists(file_path):
-                name_part, ext = os.path.splitext(file_path)
-                micro_timestamp = datetime.now().strftime("%H%M%S_%f")[:-3]
-                file_path = f"{name_part}_{micro_timestamp}{ext}"
-            
-            # 尝试保存
-            df.to_excel(file_path, index=False)
-            print(f"✓ 文件保存成功: {file_path}")
-            return file_path
-            
-        except PermissionError:
-            # 当前位置权限被拒绝，尝试下一个位置
-            continue
+            move_into_place(tmp_path, unique_filename)
+            print(f"✓ 文件保存成功（使用唯一文件名）: {unique_filename}")
+            return unique_filename
         except Exception as e:
-            # 其他错误，记录但继续尝试
-            print(f"  在 {location} 保存失败: {e}")
-            continue
-    
-    # 如果所有位置都失败，尝试使用绝对唯一的文件名
-    try:
-        # 在当前目录创建绝对唯一的文件名
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
-        unique_filename = f"邮件结果_{timestamp}.xlsx"
-        
-        df.to_excel(unique_filename, index=False)
-        print(f"✓ 文件保存成功（使用唯一文件名）: {unique_filename}")
-        return unique_filename
-    except Exception as e:
-        print(f"✗ 所有保存尝试均失败: {e}")
-        return None
+            print(f"✗ 所有保存尝试均失败: {e}")
+            return None
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
 def main():
     """主程序"""
@@ -582,15 +2967,18 @@ def main():
     
     if not os.path.exists(excel_file):
         print(f"文件不存在: {excel_file}")
-        excel_file = input("请输入Excel文件路径: ").strip()
+        excel_file = input("请输入Excel文件路径（或.eml文件夹）: ").strip()
         if not os.path.exists(excel_file):
             print("文件不存在，程序退出")
             return
     
     print(f"使用文件: {excel_file}")
     
-    # 创建分析器对象
-    analyzer = EmailAnalyzer(excel_file)
+    # 创建分析器对象（输入文件夹时直接扫描.eml文件）
+    if os.path.isdir(excel_file):
+        analyzer = EmailAnalyzer(eml_folder=excel_file)
+    else:
+        analyzer = EmailAnalyzer(excel_file)
     
     if not analyzer.all_emails:
         print("数据加载失败，请检查文件格式")
@@ -619,9 +3007,11 @@ def main():
         print("2. 批量查询")
         print("3. 测试C088示例")
         print("4. 保存并退出")
+        print("5. 计算全部搜索ID的回复时间")
+        print("6. 回复时间统计（按线程类型和日期/周）")
         print("输入 'quit' 或 'q' 退出")
         
-        choice = input("\n请选择 (1-4): ").strip().lower()
+        choice = input("\n请选择 (1-6): ").strip().lower()
         
         if choice in ['quit', 'exit', 'q']:
             break
@@ -721,13 +3111,116 @@ def main():
             
             print("程序退出")
             break
+        
+        elif choice == '5':
+            print(f"\n计算全部 {len(analyzer.data_by_search_id)} 个搜索ID的回复时间...")
+            df = analyzer.compute_all_responses()
+            saved_file = safe_save_excel_with_auto_rename(df, "全部回复时间")
+            
+            if saved_file:
+                success = int((df['状态'] == '成功').sum())
+                print(f"\n成功: {success}/{len(df)}")
+            else:
+                print("保存失败")
+        
+        elif choice == '6':
+            period = 'week' if input("\n按日(d)还是按周(w)统计（默认按日）: ").strip().lower() == 'w' else 'day'
+            stats = analyzer.response_stats(period=period)
+            print(stats.to_string(index=False, max_rows=30))
+            safe_save_excel_with_auto_rename(stats, "回复时间统计")
+
+def batch_cli(argv=None):
+    """无交互的批量查询: 从文件或标准输入读取搜索ID（每行一个），结果逐块写入CSV/Parquet/xlsx
+    
+    不显示每个查询的过程，最后只显示一行统计。退出码: 0 成功比例达到--min-success，
+    1 低于该比例，2 参数或数据文件错误。可以在cron等计划任务中使用
+    """
+    parser = argparse.ArgumentParser(description="批量查询搜索ID的回复时间")
+    parser.add_argument('data_file', help="数据文件（Excel、CSV或Parquet）")
+    parser.add_argument('-i', '--ids', default='-', help="搜索ID文件，每行一个（默认为标准输入）")
+    parser.add_argument('-o', '--output', default='批量查询结果.csv', help="结果文件（.csv / .parquet / .xlsx）")
+    parser.add_argument('--format', help="结果格式（默认按结果文件的扩展名）")
+    parser.add_argument('--min-success', type=float, default=BATCH_MIN_SUCCESS, help="成功比例的下限")
+    parser.add_argument('--sqlite', action='store_true', help="使用SQLite后端")
+    parser.add_argument('--metrics', default=metrics_file, help="运行统计文件（.json为JSON，其他为Prometheus文本格式）")
+    parser.add_argument('--profile', default=profile_file, help="用cProfile记录本次运行，写入该文件")
+    args = parser.parse_args(argv)
+    
+    with profiled(args.profile):
+        code = run_batch(args)
+    if args.metrics:
+        metrics.write(args.metrics)
+    return code
+
+def run_batch(args):
+    """执行batch_cli解析好的批量查询，返回退出码"""
+    for path in (args.data_file, args.ids):
+        if path != '-' and not os.path.exists(path):
+            print(f"文件不存在: {path}", file=sys.stderr)
+            return 2
+    
+    # 加载过程的输出只在失败时显示
+    start = time.perf_counter()
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        analyzer = EmailAnalyzer(args.data_file, sqlite=args.sqlite or None)
+    if not analyzer.all_emails:
+        print(log.getvalue(), file=sys.stderr)
+        print("数据加载失败，请检查文件格式", file=sys.stderr)
+        return 2
+    analyzer.verbose = False
+    load_time = time.perf_counter() - start
+    
+    columns = ['搜索ID', '目标邮件名包含', '目标邮件时间', '最近的返信时间', '回复邮件ID', '回复间隔',
+               '回复间隔(小时)', '回复类型', '线程邮件数', '回复邮件数', '状态']
+    summary = load_summary_module()
+    try:
+        writer = summary.ResultWriter(args.output, args.format, columns=columns)
+    except (ImportError, ValueError, OSError) as e:
+        print(f"不能写入结果文件: {e}", file=sys.stderr)
+        return 2
+    
+    id_file = sys.stdin if args.ids == '-' else open(args.ids, 'r', encoding='utf-8-sig')
+    search_ids = (line.strip() for line in id_file if line.strip())
+    
+    start = time.perf_counter()
+    success = 0
+    batch = []
+    try:
+        for result in analyzer.iter_responses(search_ids):
+            batch.append([result[col] for col in columns])
+            success += result['状态'] == '成功'
+            if len(batch) >= summary.write_batch_size:
+                writer.write(batch)
+                batch = []
+        writer.write(batch)
+    finally:
+        writer.close()
+        if id_file is not sys.stdin:
+            id_file.close()
+    elapsed = time.perf_counter() - start
+    
+    total = writer.rows_written
+    ratio = success / total if total else 1.0
+    rate = total / elapsed if elapsed > 0 else 0.0
+    print(f"查询 {total} 个搜索ID，成功 {success} 个 ({ratio:.1%})，"
+          f"加载 {load_time:.2f} 秒，查询 {elapsed:.2f} 秒 ({rate:,.0f} 个/秒)，结果: {args.output}")
+    return 0 if ratio >= args.min_success else 1
 
 if __name__ == "__main__":
+    # 有命令行参数时为无交互的批量查询
+    if len(sys.argv) > 1:
+        sys.exit(batch_cli())
+    
     try:
-        main()
+        with profiled(profile_file):
+            main()
     except Exception as e:
         print(f"程序错误: {e}")
         import traceback
         traceback.print_exc()
     
-    input("\n按回车键退出...")
\ No newline at end of file
+    if metrics_file:
+        metrics.write(metrics_file)
+    
+    input("\n按回车键退出...")